@@ -2,6 +2,9 @@ import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import './Terminal.css';
 
+const API_URL = 'http://localhost:8000/api';
+const SOCKET_URL = 'ws://localhost:8000/api/terminal/ws';
+
 const Terminal = () => {
   const [input, setInput] = useState('');
   const [history, setHistory] = useState([]);
@@ -10,6 +13,8 @@ const Terminal = () => {
   const [isLoading, setIsLoading] = useState(false);
   const outputRef = useRef(null);
   const inputRef = useRef(null);
+  const socketRef = useRef(null);
+  const commandIdRef = useRef(0);
 
   // Add a welcome message when the component mounts
   useEffect(() => {
@@ -39,6 +44,78 @@ const Terminal = () => {
     }
   }, [history]);
 
+  // Keep a WebSocket session open so cd, export and history carry over between commands
+  useEffect(() => {
+    let closed = false;
+    let retryTimer = null;
+
+    const connect = () => {
+      const sessionId = sessionStorage.getItem('terminalSessionId');
+      const url = sessionId ? `${SOCKET_URL}?session_id=${encodeURIComponent(sessionId)}` : SOCKET_URL;
+      const socket = new WebSocket(url);
+
+      socket.onmessage = (message) => {
+        const event = JSON.parse(message.data);
+
+        if (event.type === 'session') {
+          sessionStorage.setItem('terminalSessionId', event.session_id);
+          return;
+        }
+
+        setHistory(prevHistory => {
+          const index = prevHistory.findIndex(item => item.id === event.id);
+          if (index === -1) return prevHistory;
+
+          if (event.type === 'output' && event.data === '__CLEAR__') {
+            return [prevHistory[0]];
+          }
+
+          const updatedHistory = [...prevHistory];
+          const item = updatedHistory[index];
+          if (event.type === 'output') {
+            updatedHistory[index] = {
+              ...item,
+              output: item.output + event.data,
+              isLoading: false
+            };
+          } else if (event.type === 'done') {
+            updatedHistory[index] = {
+              ...item,
+              isError: event.status !== 0,
+              isLoading: false
+            };
+          }
+          return updatedHistory;
+        });
+
+        if (event.type === 'done') {
+          setIsLoading(false);
+        }
+      };
+
+      socket.onclose = () => {
+        if (socketRef.current === socket) {
+          socketRef.current = null;
+        }
+        setIsLoading(false);
+        if (!closed) {
+          retryTimer = setTimeout(connect, 2000);
+        }
+      };
+
+      socketRef.current = socket;
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (socketRef.current) {
+        socketRef.current.close();
+      }
+    };
+  }, []);
+
   // Focus the input field when the component mounts
   useEffect(() => {
     if (inputRef.current) {
@@ -47,10 +124,12 @@ const Terminal = () => {
   }, []);
 
   const executeCommand = async () => {
-    if (!input.trim()) return;
+    if (!input.trim() || isLoading) return;
 
     // Add command to history
+    const commandId = ++commandIdRef.current;
     const newHistoryItem = {
+      id: commandId,
       command: input,
       output: '',
       isError: false,
@@ -69,8 +148,15 @@ const Terminal = () => {
     // Set loading state
     setIsLoading(true);
 
+    // Send the command over the session socket when it is connected
+    const socket = socketRef.current;
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify({ command: input, id: commandId }));
+      return;
+    }
+
     try {
-      const response = await axios.post('http://localhost:8000/api/terminal', {
+      const response = await axios.post(`${API_URL}/terminal`, {
         command: input
       });
 
@@ -120,6 +206,13 @@ const Terminal = () => {
   };
 
   const handleKeyDown = (e) => {
+    // Handle Ctrl+C to cancel the running command
+    if (e.key === 'c' && e.ctrlKey && isLoading && socketRef.current) {
+      e.preventDefault();
+      socketRef.current.send(JSON.stringify({ type: 'cancel' }));
+      return;
+    }
+
     // Handle Enter key to execute command
     if (e.key === 'Enter') {
       executeCommand();
@@ -155,6 +248,7 @@ const Terminal = () => {
       // Simple auto-completion for common commands
       const commonCommands = [
         'help', 'ls', 'cat', 'pwd', 'echo', 'date', 'whoami', 'clear',
+        'cd', 'export', 'unset', 'env', 'history',
         'ai:', 'ai:code:', 'ai:model:',
         'file:list', 'file:view', 'file:run', 'file:create'
       ];
@@ -257,7 +351,7 @@ const Terminal = () => {
           onKeyDown={handleKeyDown}
           placeholder="Type your command..."
           ref={inputRef}
-          disabled={isLoading}
+          readOnly={isLoading}
         />
         <button
           className="terminal-button"
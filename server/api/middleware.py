@@ -0,0 +1,33 @@
+from urllib.parse import parse_qs
+from services.rate_limiter import current_user
+
+
+class UserContextMiddleware:
+    """
+    Records who each request is made on behalf of, so upstream AI requests
+    can be shared fairly between users
+
+    The user is the X-User-Id header if given, otherwise the terminal
+    session_id in the query string, otherwise the client address.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        user = headers.get(b"x-user-id", b"").decode("latin-1")
+        if not user:
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            user = (query.get("session_id") or [""])[0]
+        if not user and scope.get("client"):
+            user = scope["client"][0]
+
+        token = current_user.set(user or "anonymous")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_user.reset(token)
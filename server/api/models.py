@@ -1,8 +1,76 @@
-from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
 
 class CommandRequest(BaseModel):
     command: str
+    # Terminal session to run the command in, as opened over /api/terminal/ws
+    session_id: Optional[str] = None
+    # Return the time spent in each stage of the command, in milliseconds
+    timings: bool = False
 
 class CommandResponse(BaseModel):
     output: str
-    status: int = 0 
\ No newline at end of file
+    status: int = 0
+    # Milliseconds per stage, when the request asked for timings
+    timings: Optional[Dict[str, float]] = None
+
+class BatchCommand(BaseModel):
+    command: str
+    # Name other commands use in depends_on, defaults to the command's index
+    id: Optional[str] = None
+    # Commands that must finish successfully before this one starts
+    depends_on: List[str] = Field(default_factory=list)
+
+class BatchRequest(BaseModel):
+    commands: List[BatchCommand]
+    # "parallel" runs independent commands concurrently, "sequence" one after another in order
+    mode: Literal["parallel", "sequence"] = "parallel"
+    # Skip every command not yet started once one fails
+    stop_on_error: bool = False
+    # Lower the number of commands run at once (capped by BATCH_MAX_CONCURRENCY)
+    max_concurrency: Optional[int] = None
+    # Stream each result as a server-sent event as soon as it completes
+    stream: bool = False
+    session_id: Optional[str] = None
+
+class BatchResult(BaseModel):
+    index: int
+    id: str
+    command: str
+    output: str
+    status: int = 0
+    # The command did not run because a dependency failed or the batch was stopped
+    skipped: bool = False
+    duration_ms: float = 0
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
+    # Status of the batch: 0 if every command succeeded
+    status: int = 0
+
+class JobRequest(BaseModel):
+    prompt: str
+    priority: Literal["high", "normal", "low"] = "normal"
+    model: Optional[str] = None
+    # Run the generated code once it is saved
+    auto_run: bool = True
+    use_cache: bool = True
+    # Code candidates to generate in parallel, keeping the first that runs cleanly;
+    # None for AI_CODE_CANDIDATES
+    candidates: Optional[int] = None
+
+class JobInfo(BaseModel):
+    id: str
+    prompt: str
+    model: str
+    priority: str
+    auto_run: bool
+    use_cache: bool
+    candidates: Optional[int] = None
+    # queued, running, succeeded, failed or cancelled
+    state: str
+    output: str = ""
+    status: Optional[int] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
\ No newline at end of file
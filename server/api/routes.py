@@ -1,13 +1,229 @@
-from fastapi import APIRouter, HTTPException
-from api.models import CommandRequest, CommandResponse
-from services.terminal import execute_terminal_command
+import json
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, WebSocket
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from api.models import BatchRequest, BatchResponse, CommandRequest, CommandResponse, JobInfo, JobRequest
+from core.logging_config import logging_stats
+from services.batch import execute_batch, prepare_batch, run_batch
+from services.jobs import job_queue
+from services.kernels import kernel_manager
+from services.metrics import collect_timings, metrics
+from services.session import TerminalSession, session_manager
+from services.terminal import execute_terminal_command, stream_terminal_command
+from services.terminal_socket import serve_terminal_socket
+from services.response_cache import response_cache
+from services.ai_service import ai_singleflight
+from services.hedging import hedge_policy
+from services.rate_limiter import upstream_scheduler
 
 router = APIRouter(prefix="/api")
+# Routes outside /api, e.g. for monitoring
+root_router = APIRouter()
 
-@router.post("/terminal", response_model=CommandResponse)
+async def get_session(session_id: Optional[str]) -> Optional[TerminalSession]:
+    """
+    Look up the session a request names, if any
+    """
+    if session_id is None:
+        return None
+    session = await session_manager.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown terminal session")
+    return session
+
+async def _run_command(command: str, session: Optional[TerminalSession]) -> CommandResponse:
+    if session is None:
+        return await execute_terminal_command(command)
+    
+    async with session_manager.use(session, command):
+        return await execute_terminal_command(command, session)
+
+@router.post("/terminal", response_model=CommandResponse, response_model_exclude_none=True)
 async def execute_command(request: CommandRequest):
     """
-    Execute a terminal command and return the output
+    Execute a terminal command and return the output, and with timings set, the time spent per stage
+    """
+    command = request.command.strip()
+    session = await get_session(request.session_id)
+    if not request.timings:
+        return await _run_command(command, session)
+    
+    with collect_timings() as timings:
+        response = await _run_command(command, session)
+    response.timings = {stage: round(ms, 3) for stage, ms in timings.items()}
+    return response
+
+@router.post("/terminal/stream")
+async def stream_command(request: CommandRequest):
+    """
+    Execute a terminal command and stream the output as server-sent events
     """
     command = request.command.strip()
-    return await execute_terminal_command(command) 
\ No newline at end of file
+    session = await get_session(request.session_id)
+    
+    async def events():
+        if session is None:
+            async for event in stream_terminal_command(command):
+                yield event
+            return
+        
+        async with session_manager.use(session, command):
+            async for event in stream_terminal_command(command, session):
+                yield event
+    
+    async def event_stream():
+        with collect_timings() as timings:
+            async for event in events():
+                if request.timings and event["type"] == "done":
+                    event = dict(event, timings={stage: round(ms, 3) for stage, ms in timings.items()})
+                yield f"data: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/terminal/batch")
+async def execute_command_batch(request: BatchRequest):
+    """
+    Execute a batch of terminal commands, running independent ones concurrently
+    
+    Returns every result in the batch's order, or with stream set, streams each
+    result as a server-sent event as soon as its command completes
+    """
+    session = await get_session(request.session_id)
+    sequential = request.mode == "sequence"
+    try:
+        prepare_batch(request.commands, sequential)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    options = dict(sequential=sequential, stop_on_error=request.stop_on_error,
+                   max_concurrency=request.max_concurrency, session=session)
+    
+    if not request.stream:
+        if session is None:
+            results = await execute_batch(request.commands, **options)
+        else:
+            async with session_manager.use(session):
+                results = await execute_batch(request.commands, **options)
+        status = 0 if all(result.status == 0 for result in results) else 1
+        return BatchResponse(results=results, status=status)
+    
+    async def results():
+        if session is None:
+            async for result in run_batch(request.commands, **options):
+                yield result
+            return
+        
+        async with session_manager.use(session):
+            async for result in run_batch(request.commands, **options):
+                yield result
+    
+    async def event_stream():
+        status = 0
+        async for result in results():
+            status = status or (1 if result.status else 0)
+            yield f"data: {json.dumps({'type': 'result', **result.model_dump()})}\n\n"
+        yield f"data: {json.dumps({'type': 'done', 'status': status})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/jobs", response_model=JobInfo, status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Queue an ai:code generation job and return it right away
+    """
+    try:
+        job = await job_queue.submit(request.prompt, priority=request.priority, model=request.model,
+                                     auto_run=request.auto_run, use_cache=request.use_cache,
+                                     candidates=request.candidates)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.to_dict()
+
+@router.get("/jobs", response_model=List[JobInfo])
+async def list_jobs(state: Optional[str] = None, limit: int = 50):
+    """
+    List the most recently submitted jobs, optionally only those in one state
+    """
+    return [job.to_dict() for job in await job_queue.list(state, limit)]
+
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=JobInfo)
+async def get_job_status(job_id: str):
+    """
+    Return a job's state, and its output once it has finished
+    """
+    return (await get_job(job_id)).to_dict()
+
+@router.delete("/jobs/{job_id}", response_model=JobInfo)
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued or running job
+    """
+    await get_job(job_id)
+    return (await job_queue.cancel(job_id)).to_dict()
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Stream a job's state as server-sent events until it has finished
+    """
+    await get_job(job_id)
+    
+    async def event_stream():
+        async for event in job_queue.subscribe(job_id):
+            yield f"data: {json.dumps({'type': 'job', **event})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/terminal/ws")
+async def terminal_socket(websocket: WebSocket, session_id: Optional[str] = None):
+    """
+    Run terminal commands over a WebSocket in a persistent session
+    """
+    await serve_terminal_socket(websocket, session_id)
+
+def runtime_stats() -> Dict[str, Dict]:
+    """
+    Collect the runtime statistics served by /api/stats and exported by /metrics
+    """
+    return {
+        "ai_cache": response_cache.stats(),
+        "ai_singleflight": ai_singleflight.stats(),
+        "ai_upstream": upstream_scheduler.stats(),
+        "ai_hedging": hedge_policy.stats(),
+        "sessions": session_manager.stats(),
+        "kernels": kernel_manager.stats(),
+        "jobs": job_queue.stats(),
+        "logging": logging_stats(),
+    }
+
+@router.get("/stats")
+async def get_stats():
+    """
+    Return runtime statistics for the AI response cache, request coalescing, upstream limits, hedging, terminal sessions, kernels, jobs and logging
+    """
+    return runtime_stats()
+
+@root_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Export command counts, latency histograms and runtime statistics in the Prometheus text format
+    """
+    body = metrics.render(runtime_stats())
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
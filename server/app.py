@@ -1,29 +1,60 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api.routes import router
+from api.middleware import UserContextMiddleware
+from api.routes import root_router, router
+from core.config import masked_api_key, settings
+from core.logging_config import configure_logging
+from services.http_client import HTTPClient
+from services.jobs import job_queue
+from services.kernels import kernel_manager
+from services.session import session_manager
+from services.worker_pool import worker_pool
 import logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (levels, format and sampling come from the LOG_* settings)
+configure_logging()
 logger = logging.getLogger("terminal-api")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Set up shared resources on startup and release them on shutdown
+    """
+    # The HTTP client is started on first use and its modules load in the background,
+    # so startup doesn't wait for them and the first AI command usually doesn't either
+    asyncio.get_running_loop().run_in_executor(None, HTTPClient.preload)
+    logger.info(f"Using AI provider {settings.ai_provider} with model {settings.openai_model}, "
+                f"API key {masked_api_key(settings) or 'not set'}")
+    if worker_pool.enabled:
+        await worker_pool.start()
+    session_manager.start()
+    kernel_manager.start()
+    job_queue.start()
+    yield
+    await job_queue.close()
+    await session_manager.close()
+    await kernel_manager.close()
+    await worker_pool.close()
+    await HTTPClient.close()
+
 # Create FastAPI app
-app = FastAPI(title="AI Terminal Agent API")
+app = FastAPI(title="AI Terminal Agent API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:5173"],  # Frontend URL
+    allow_origins=list(settings.cors_origins),  # The frontend's URL by default
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(UserContextMiddleware)
 
 # Include API routes
 app.include_router(router)
+app.include_router(root_router)
 
 # Root endpoint
 @app.get("/")
@@ -31,5 +62,18 @@ async def root():
     return {"message": "AI Terminal Agent API is running"}
 
 if __name__ == "__main__":
+    import argparse
+    import os
     import uvicorn
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the AI Terminal Agent API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.server_workers,
+                        help="worker processes; with more than one, runs in production mode (no reloading)")
+    args = parser.parse_args()
+    if args.workers > 1:
+        # Each worker imports the app afresh and reads its settings from the environment
+        os.environ["SERVER_WORKERS"] = str(args.workers)
+        uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run("app:app", host=args.host, port=args.port, reload=True) 
\ No newline at end of file
@@ -0,0 +1 @@
+"""End-to-end benchmarks of the terminal API, see benchmarks/run.py"""
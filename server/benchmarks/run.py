@@ -0,0 +1,419 @@
+"""
+End-to-end benchmark of /api/terminal, per command class and concurrency level
+
+Drives the app in-process (straight through its ASGI interface) and/or over
+HTTP (a uvicorn subprocess), with ai: commands answered by the bundled mock
+server. Reports throughput, latency percentiles and server RSS, and saves
+the results as JSON so runs can be compared:
+
+    cd server
+    python -m benchmarks.run --mode both --concurrency 1,4,16,64 --requests 200
+    python -m benchmarks.run --baseline benchmarks/results/<earlier run>.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(SERVER_DIR, "benchmarks", "results")
+
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+# Command lines per class, cycled through; {i} is replaced by the request number
+WORKLOADS = {
+    "shell": ["echo hello", "ls", "pwd", "date"],
+    "help": ["help"],
+    "file_list": ["file:list", "file:list .py", "file:list --sort size --desc"],
+    "file_view": ["file:view hello_world.py", "file:view fibonacci_sequence.py --head 5"],
+    "file_run": ["file:run hello_world.py"],
+    # Distinct prompts and --no-cache, so every request reaches the mock
+    "ai": ["ai:benchmark prompt {i} --no-cache"],
+}
+
+# Requests made before each measured run
+WARMUP_REQUESTS = 5
+
+# (status of the HTTP exchange, command status) of one request
+Send = Callable[[str], Awaitable[Tuple[int, int]]]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Return a process's resident set size in megabytes, None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def child_pids(pid: int) -> List[int]:
+    """Return the ids of a process's direct children, empty where /proc is unavailable"""
+    children = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The parent id follows the command name, which is in parentheses and may contain spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def server_rss_mb(pid: int, workers: int) -> Optional[float]:
+    """Return the RSS of the server, summed over its worker processes when it has several"""
+    if workers <= 1:
+        return rss_mb(pid)
+    sizes = [size for size in map(rss_mb, child_pids(pid)) if size is not None]
+    return round(sum(sizes), 1) if sizes else None
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def server_environment(mock_url: str, workdir: str) -> Dict[str, str]:
+    """Settings the app under test runs with; they must be in place before it is imported"""
+    return {
+        "AI_PROVIDER": "mock",
+        "AI_BASE_URL": mock_url,
+        # Measure the pipeline, not the client-side rate limits
+        "AI_REQUESTS_PER_MINUTE": "0",
+        "AI_TOKENS_PER_MINUTE": "0",
+        "JOB_DB_PATH": os.path.join(workdir, "jobs.sqlite3"),
+    }
+
+
+async def measure(send: Send, commands: List[str], requests: int, concurrency: int) -> Dict[str, Any]:
+    """
+    Send requests with a fixed number of concurrent clients
+
+    Returns:
+        Throughput, latency percentiles in milliseconds and error counts
+    """
+    for i in range(min(WARMUP_REQUESTS, requests)):
+        await send(commands[i % len(commands)].format(i=f"warmup-{i}"))
+
+    latencies: List[float] = []
+    errors = 0
+    failed_commands = 0
+    counter = iter(range(requests))
+
+    async def client() -> None:
+        nonlocal errors, failed_commands
+        for i in counter:
+            line = commands[i % len(commands)].format(i=i)
+            started = time.perf_counter()
+            try:
+                http_status, command_status = await send(line)
+            except Exception:
+                http_status, command_status = 0, 1
+            latencies.append(time.perf_counter() - started)
+            if http_status != 200:
+                errors += 1
+            elif command_status != 0:
+                failed_commands += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "failed_commands": failed_commands,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+            "p50": round(percentile(ordered, 0.50) * 1000, 3),
+            "p95": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99": round(percentile(ordered, 0.99) * 1000, 3),
+            "max": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        },
+    }
+
+
+def asgi_sender(app) -> Send:
+    """Call the app's ASGI interface directly, without any network or HTTP client"""
+    async def send(line: str) -> Tuple[int, int]:
+        body = json.dumps({"command": line}).encode("utf-8")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/api/terminal",
+            "raw_path": b"/api/terminal",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+            "client": ("127.0.0.1", 50000),
+            "server": ("127.0.0.1", 80),
+        }
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        status = 0
+        chunks: List[bytes] = []
+
+        async def receive() -> Dict[str, Any]:
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()
+
+        async def reply(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await app(scope, receive, reply)
+        if status != 200:
+            return status, 1
+        return status, json.loads(b"".join(chunks)).get("status", 0)
+    return send
+
+
+def http_sender(session, base_url: str) -> Send:
+    async def send(line: str) -> Tuple[int, int]:
+        async with session.post(f"{base_url}/api/terminal", json={"command": line}) as response:
+            if response.status != 200:
+                await response.read()
+                return response.status, 1
+            return response.status, (await response.json()).get("status", 0)
+    return send
+
+
+async def run_inprocess(args, mock_url: str, workdir: str) -> List[Dict[str, Any]]:
+    """Benchmark the app imported into this process"""
+    os.environ.update(server_environment(mock_url, workdir))
+    import logging
+    from app import app, lifespan
+
+    # The app logs every request at DEBUG, which would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    results = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        async with lifespan(app):
+            send = asgi_sender(app)
+            for name in args.classes:
+                for concurrency in args.concurrency:
+                    result = await measure(send, WORKLOADS[name], args.requests, concurrency)
+                    result.update(mode="inprocess", command_class=name, concurrency=concurrency,
+                                  rss_mb=rss_mb(os.getpid()))
+                    results.append(result)
+                    print(summary(result), file=sys.stderr)
+    return results
+
+
+async def run_http(args, mock_url: str, workdir: str) -> List[Dict[str, Any]]:
+    """Benchmark the app served by uvicorn in a subprocess"""
+    import aiohttp
+
+    port = free_port()
+    env = dict(os.environ, **server_environment(mock_url, workdir))
+    command = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning", "--no-access-log"]
+    if args.server_workers > 1:
+        # Production mode: worker processes sharing state through SQLite
+        env.update(SERVER_WORKERS=str(args.server_workers),
+                   SHARED_STATE_PATH=os.path.join(workdir, "shared_state.sqlite3"))
+        command += ["--workers", str(args.server_workers)]
+    server = subprocess.Popen(
+        command,
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    results = []
+    try:
+        connector = aiohttp.TCPConnector(limit=max(args.concurrency))
+        async with aiohttp.ClientSession(connector=connector) as session:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    async with session.get(base_url + "/") as response:
+                        if response.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    pass
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("The benchmark server did not start")
+                await asyncio.sleep(0.2)
+
+            send = http_sender(session, base_url)
+            for name in args.classes:
+                for concurrency in args.concurrency:
+                    result = await measure(send, WORKLOADS[name], args.requests, concurrency)
+                    result.update(mode="http", command_class=name, concurrency=concurrency,
+                                  server_workers=args.server_workers,
+                                  rss_mb=server_rss_mb(server.pid, args.server_workers))
+                    results.append(result)
+                    print(summary(result), file=sys.stderr)
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return results
+
+
+def summary(result: Dict[str, Any]) -> str:
+    latency = result["latency_ms"]
+    return (f"{result['mode']:9} {result['command_class']:10} c={result['concurrency']:<4} "
+            f"{result['throughput_rps']:>9.1f} req/s  p50 {latency['p50']:>8.2f}  p95 {latency['p95']:>8.2f}  "
+            f"p99 {latency['p99']:>8.2f} ms  errors {result['errors']}/{result['failed_commands']}  "
+            f"rss {result['rss_mb']} MB")
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """
+    Compare results with an earlier run
+
+    Returns:
+        One line per regression: throughput down or p95 latency up by more than tolerance
+    """
+    with open(baseline_path) as f:
+        baseline = {
+            (r["mode"], r["command_class"], r["concurrency"]): r for r in json.load(f)["results"]
+        }
+    regressions = []
+    for result in results:
+        before = baseline.get((result["mode"], result["command_class"], result["concurrency"]))
+        if before is None:
+            continue
+        name = f"{result['mode']} {result['command_class']} c={result['concurrency']}"
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+        if result["latency_ms"]["p95"] > before["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {before['latency_ms']['p95']} -> {result['latency_ms']['p95']} ms"
+            )
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=SERVER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main_async(args) -> int:
+    from aiohttp import web
+    from tools.mock_openai import MockOptions, create_app
+
+    mock_port = free_port()
+    mock = web.AppRunner(create_app(MockOptions(
+        latency=args.mock_latency,
+        tokens_per_second=args.mock_tokens_per_second,
+        seed=0,
+    )))
+    await mock.setup()
+    await web.TCPSite(mock, "127.0.0.1", mock_port).start()
+    mock_url = f"http://127.0.0.1:{mock_port}/v1"
+
+    results: List[Dict[str, Any]] = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            if args.mode in ("http", "both"):
+                results += await run_http(args, mock_url, workdir)
+            if args.mode in ("inprocess", "both"):
+                results += await run_inprocess(args, mock_url, workdir)
+    finally:
+        await mock.cleanup()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "requests": args.requests,
+            "mock_latency": args.mock_latency,
+            "mock_tokens_per_second": args.mock_tokens_per_second,
+            "server_workers": args.server_workers,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}", file=sys.stderr)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark /api/terminal per command class")
+    parser.add_argument("--mode", choices=("inprocess", "http", "both"), default="both")
+    parser.add_argument("--classes", default=",".join(WORKLOADS),
+                        help=f"comma separated command classes ({', '.join(WORKLOADS)})")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per class and concurrency level")
+    parser.add_argument("--mock-latency", type=float, default=0.05, help="seconds the mock takes to answer")
+    parser.add_argument("--mock-tokens-per-second", type=float, default=0.0, help="mock generation speed")
+    parser.add_argument("--server-workers", type=int, default=1,
+                        help="worker processes of the server in http mode")
+    parser.add_argument("--output", help="where to save the JSON results")
+    parser.add_argument("--baseline", help="earlier results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative change in throughput or p95 reported as a regression")
+    args = parser.parse_args(argv)
+
+    args.classes = [name.strip() for name in args.classes.split(",") if name.strip()]
+    unknown = [name for name in args.classes if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"unknown command class: {', '.join(unknown)}")
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return asyncio.run(main_async(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+Startup benchmark: how long the server takes to import, to boot and to
+answer its first requests, and how long a pre-warmed Python worker takes to
+spawn. These decide how quickly new worker processes and containers are
+ready to serve.
+
+    cd server
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --baseline benchmarks/results/startup-<earlier run>.json
+
+Every measurement runs in fresh processes and is reported as the median of
+the runs, in milliseconds.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.run import RESULTS_DIR, SERVER_DIR, free_port, git_commit, server_environment
+
+WORKER_SCRIPT = os.path.join(SERVER_DIR, "services", "python_worker.py")
+
+# First requests timed after the server is up; each loads code a plain boot doesn't
+FIRST_REQUESTS = {
+    "first_shell_ms": "ls",
+    "first_help_ms": "help",
+    "first_ai_ms": "ai:Say hello",
+}
+
+# Top-level packages reported in the import breakdown
+TOP_PACKAGES = 10
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Parse the output of python -X importtime -c "import app"
+
+    Returns:
+        Milliseconds to import app, and milliseconds of import time spent
+        in each top-level package (its modules' own time, without children)
+    """
+    total = 0.0
+    packages: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(own) / 1000
+        if name.rstrip() == " app":
+            total = int(cumulative) / 1000
+    return total, packages
+
+
+def measure_imports(runs: int, env: Dict[str, str]) -> Dict[str, Any]:
+    """Time a bare interpreter and importing the app, each in fresh processes"""
+    interpreter, wall, imports = [], [], []
+    packages: Dict[str, List[float]] = {}
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], cwd=SERVER_DIR, env=env, check=True)
+        interpreter.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                                 cwd=SERVER_DIR, env=env, capture_output=True, text=True, check=True)
+        wall.append((time.perf_counter() - started) * 1000)
+        total, own = parse_importtime(process.stderr)
+        imports.append(total)
+        for package, ms in own.items():
+            packages.setdefault(package, []).append(ms)
+
+    slowest = sorted(((statistics.median(times), package) for package, times in packages.items()), reverse=True)
+    return {
+        "interpreter_ms": round(statistics.median(interpreter), 2),
+        "import_app_ms": round(statistics.median(imports), 2),
+        "process_ms": round(statistics.median(wall), 2),
+        "by_package": {package: round(ms, 2) for ms, package in slowest[:TOP_PACKAGES]},
+    }
+
+
+async def measure_cold_start(runs: int, env: Dict[str, str]) -> Dict[str, float]:
+    """Time uvicorn from launch until it answers, then the first request of each kind"""
+    import aiohttp
+
+    timings: Dict[str, List[float]] = {}
+    for _ in range(runs):
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            async with aiohttp.ClientSession() as session:
+                deadline = time.monotonic() + 60
+                while True:
+                    try:
+                        async with session.get(base_url + "/") as response:
+                            if response.status == 200:
+                                break
+                    except aiohttp.ClientError:
+                        pass
+                    if server.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError("The benchmark server did not start")
+                    await asyncio.sleep(0.01)
+                timings.setdefault("ready_ms", []).append((time.perf_counter() - started) * 1000)
+
+                for name, command in FIRST_REQUESTS.items():
+                    sent = time.perf_counter()
+                    async with session.post(base_url + "/api/terminal", json={"command": command}) as response:
+                        await response.read()
+                        if response.status != 200:
+                            raise RuntimeError(f"{command!r} failed with status {response.status}")
+                    timings.setdefault(name, []).append((time.perf_counter() - sent) * 1000)
+        finally:
+            server.terminate()
+            try:
+                server.wait(10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    return {name: round(statistics.median(values), 2) for name, values in timings.items()}
+
+
+def measure_worker_spawn(runs: int, env: Dict[str, str]) -> float:
+    """Time a pre-warmed Python worker from launch until it reports ready"""
+    spawns = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        worker = subprocess.Popen([sys.executable, "-u", WORKER_SCRIPT], cwd=SERVER_DIR, env=env,
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        ready = worker.stdout.readline()
+        spawns.append((time.perf_counter() - started) * 1000)
+        worker.kill()
+        worker.wait()
+        if not ready:
+            raise RuntimeError("The Python worker failed to start")
+    return round(statistics.median(spawns), 2)
+
+
+def flatten(results: Dict[str, Any]) -> Dict[str, float]:
+    """Return the measurements compared with a baseline, by name"""
+    flat = {f"import.{name}": value for name, value in results["import"].items() if name.endswith("_ms")}
+    flat.update({f"cold_start.{name}": value for name, value in results["cold_start"].items()})
+    flat["worker_spawn_ms"] = results["worker_spawn_ms"]
+    return flat
+
+
+def compare(results: Dict[str, Any], baseline_path: str, tolerance: float) -> List[str]:
+    """
+    Compare results with an earlier run
+
+    Returns:
+        One line per measurement that got slower by more than tolerance
+    """
+    with open(baseline_path) as f:
+        before = flatten(json.load(f)["results"])
+    regressions = []
+    for name, value in flatten(results).items():
+        if name in before and value > before[name] * (1 + tolerance):
+            regressions.append(f"{name}: {before[name]} -> {value} ms")
+    return regressions
+
+
+async def main_async(args) -> int:
+    from aiohttp import web
+    from tools.mock_openai import MockOptions, create_app
+
+    mock_port = free_port()
+    mock = web.AppRunner(create_app(MockOptions(latency=0, seed=0)))
+    await mock.setup()
+    await web.TCPSite(mock, "127.0.0.1", mock_port).start()
+
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(os.environ, **server_environment(f"http://127.0.0.1:{mock_port}/v1", workdir))
+            results = {
+                "import": measure_imports(args.runs, env),
+                "cold_start": await measure_cold_start(args.runs, env),
+                "worker_spawn_ms": measure_worker_spawn(args.runs, env),
+            }
+    finally:
+        await mock.cleanup()
+
+    for name, value in flatten(results).items():
+        print(f"{name:28} {value:>9.2f} ms", file=sys.stderr)
+    packages = ", ".join(f"{package} {ms}" for package, ms in results["import"]["by_package"].items())
+    print(f"slowest imports (ms): {packages}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "runs": args.runs,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, "startup-" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}", file=sys.stderr)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark server import, boot and worker spawn times")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--output", help="where to save the JSON results")
+    parser.add_argument("--baseline", help="earlier results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown reported as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return asyncio.run(main_async(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
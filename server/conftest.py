@@ -0,0 +1 @@
+# Makes pytest put the server directory on sys.path, so tests import services.* like the app does
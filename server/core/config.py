@@ -1,32 +1,450 @@
 # Application configuration settings
-import os
+#
+# Settings come from the environment, then the .env file in the server
+# directory. They are read and checked once, into the frozen `settings`
+# snapshot; the UPPER_CASE names (from core.config import COMMAND_TIMEOUT)
+# are aliases of its fields.
 import logging
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
 
-# Set up logger
 logger = logging.getLogger("terminal-api")
 
-# Try to read the .env file manually
-env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
-logger.info(f"Trying to read .env file from: {env_path}")
-
-if os.path.exists(env_path):
-    with open(env_path, 'r') as f:
-        for line in f:
-            if line.strip() and not line.startswith('#'):
-                key, value = line.strip().split('=', 1)
-                os.environ[key] = value
-                if key == "OPENAI_API_KEY":
-                    masked = value[:8] + "*" * 10 + value[-4:] if value else ""
-                    logger.info(f"Loaded API key from file: {masked}")
-
-# Get API key
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
-masked_key = OPENAI_API_KEY[:8] + "*" * 10 + OPENAI_API_KEY[-4:] if OPENAI_API_KEY else ""
-logger.info(f"Using OpenAI API key: {masked_key}")
-
-# Timeout for command execution in seconds
-COMMAND_TIMEOUT = 10
-
-# OpenAI API settings
-OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
-logger.info(f"Using OpenAI model: {OPENAI_MODEL}") 
\ No newline at end of file
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV_PATH = os.path.join(SERVER_DIR, ".env")
+
+LOG_LEVEL_NAMES = ("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET")
+
+
+class ConfigError(ValueError):
+    """Raised when settings have values that can't be used"""
+
+
+def read_env_file(path: str) -> Dict[str, str]:
+    """
+    Read KEY=VALUE lines from a .env file
+
+    Blank lines and comments are skipped, an "export " prefix and quotes
+    around the value are removed, and malformed lines are skipped with a
+    warning.
+
+    Args:
+        path: The file; a missing file has no settings
+
+    Returns:
+        The settings in the file
+    """
+    values: Dict[str, str] = {}
+    if not os.path.exists(path):
+        return values
+    with open(path, "r") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("export "):
+                line = line[len("export "):].lstrip()
+            key, separator, value = line.partition("=")
+            key, value = key.strip(), value.strip()
+            if not separator or not key.isidentifier():
+                logger.warning(f"Ignoring malformed line {number} in {path}")
+                continue
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+                value = value[1:-1]
+            values[key] = value
+    return values
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Every setting of the server, read from the environment by load_settings"""
+
+    # OpenAI API key and the chat completions API the AI commands use: "openai",
+    # "compatible" (any OpenAI-compatible server) or "mock" (tools/mock_openai.py)
+    openai_api_key: str
+    openai_model: str
+    ai_provider: str
+    # API root, e.g. http://127.0.0.1:8001/v1; the provider's default when empty
+    ai_base_url: str
+
+    # Worker processes serving the API (python app.py --workers N); with more than one, state
+    # that must be seen by every worker lives in the SQLite file at shared_state_path
+    server_workers: int
+    shared_state_path: str
+    # Web pages (origins, e.g. http://localhost:5173) allowed to use the API from a browser, "*" for any
+    cors_origins: Tuple[str, ...]
+
+    # Timeouts for shell commands and for running generated Python files, in seconds
+    command_timeout: float
+    script_timeout: float
+    # Maximum bytes of output (stdout and stderr combined) kept per command or script run
+    output_max_bytes: int
+    # Maximum number of subprocesses allowed to run at the same time
+    max_concurrent_processes: int
+
+    # Pool of pre-warmed Python interpreters for running generated files (0 disables the pool)
+    python_worker_pool_size: int
+    # Runs after which a worker interpreter is replaced with a fresh one
+    python_worker_max_runs: int
+    # Address-space limit for each run in megabytes (0 for no limit)
+    python_worker_memory_limit_mb: int
+
+    # Compiled code and validation results for generated files
+    artifact_cache_dir: str
+    artifact_cache_max_entries: int
+    # SQLite index of generated files used by file:list
+    file_index_path: str
+    # file:view returns whole files up to this size, larger views are truncated
+    view_max_bytes: int
+    # Lines shown by default when a file is too large to view whole
+    view_default_lines: int
+
+    # Terminal sessions (WebSocket connections keep their working directory, environment and history)
+    max_sessions: int
+    # Seconds a session without a connection is kept before it is closed
+    session_idle_timeout: float
+    # Commands remembered in each session's history
+    session_history_size: int
+
+    # /api/terminal/batch limits: commands per batch, and commands of one batch run at the same time
+    batch_max_commands: int
+    batch_max_concurrency: int
+
+    # Background ai:code jobs (/api/jobs), persisted so queued jobs survive a restart
+    job_db_path: str
+    # Jobs run at the same time
+    job_workers: int
+    # Jobs that may wait in the queue before new ones are refused
+    job_max_queued: int
+    # Seconds finished jobs are kept
+    job_retention: float
+    # Seconds between looks for jobs queued or cancelled by other worker processes
+    job_poll_interval: float
+
+    # Persistent Python/Node REPL kernels (kernel: commands), one per session and language
+    kernel_max: int
+    # Seconds an unused kernel is kept before it is stopped
+    kernel_idle_timeout: float
+    # Seconds a single evaluation may run before it is interrupted
+    kernel_timeout: float
+    # Memory limit for each kernel in megabytes (0 for no limit)
+    kernel_memory_limit_mb: int
+    node_binary: str
+
+    # Shared HTTP client connection pool settings
+    http_pool_limit: int
+    http_pool_limit_per_host: int
+    http_keepalive_timeout: float
+    http_dns_cache_ttl: int
+
+    # AI response cache settings
+    ai_cache_enabled: bool
+    ai_cache_max_entries: int
+    ai_cache_ttl: float
+    # Path of the SQLite file backing the on-disk tier, empty to keep the cache in memory only
+    # (shared by the worker processes by default when there are several)
+    ai_cache_path: str
+
+    # Limits on requests to the OpenAI API: requests in flight at once, and
+    # requests and tokens per minute (0 for no rate limit)
+    ai_max_in_flight: int
+    ai_requests_per_minute: float
+    ai_tokens_per_minute: float
+    # Retries of a throttled or failed request, with exponential backoff between them in seconds
+    ai_max_retries: int
+    ai_backoff_base: float
+    ai_backoff_max: float
+    # Deadlines of a request to the OpenAI API in seconds (0 for none): to connect, between reads
+    # (including the wait for a non-streamed answer to be generated), and for the whole request
+    # including its retries
+    ai_connect_timeout: float
+    ai_read_timeout: float
+    ai_total_timeout: float
+    # Hedging: a request still waiting for its response after this percentile of recent response
+    # times (0 to never hedge) is sent again and the first response used; only once there are
+    # enough recent times, after at least the minimum delay in seconds, and for at most the given
+    # fraction of recent requests
+    ai_hedge_percentile: float
+    ai_hedge_min_samples: int
+    ai_hedge_min_delay: float
+    ai_hedge_max_ratio: float
+    # ai:code candidates generated in parallel by default (the first that compiles and runs cleanly
+    # is kept), the most one command may ask for, and the most estimated tokens (prompt plus
+    # max tokens, per candidate) one command's candidates may use together
+    ai_code_candidates: int
+    ai_code_max_candidates: int
+    ai_code_token_budget: int
+
+    # Logging: default level, per-logger overrides ("terminal-api.ai=DEBUG,aiohttp=WARNING")
+    # and output format, "text" or "json" (one object per line)
+    log_level: str
+    log_levels: str
+    log_format: str
+    # Records waiting for the writer thread; more are dropped rather than blocking the caller
+    log_queue_size: int
+    # Longer messages and fields (prompts, responses) are truncated
+    log_max_field_chars: int
+    # Fraction of records kept for high-volume loggers; warnings and errors are always kept
+    log_sample_rates: str
+
+
+class _EnvReader:
+    """Reads typed values from the environment, collecting every problem instead of stopping at the first"""
+
+    def __init__(self, environ: Mapping[str, str]):
+        self.environ = environ
+        self.errors: List[str] = []
+
+    def string(self, name: str, default: str = "", choices: Optional[Tuple[str, ...]] = None) -> str:
+        value = self.environ.get(name, default)
+        if choices is not None and value not in choices:
+            self.errors.append(f"{name}={value!r} is not one of {', '.join(choices)}")
+        return value
+
+    def number(self, name: str, default: float, kind: type = int, minimum: float = 0) -> float:
+        raw = self.environ.get(name)
+        if raw is None or raw.strip() == "":
+            return kind(default)
+        try:
+            value = kind(raw)
+        except ValueError:
+            self.errors.append(f"{name}={raw!r} is not {'an integer' if kind is int else 'a number'}")
+            return kind(default)
+        if value < minimum:
+            self.errors.append(f"{name}={raw!r} must be at least {minimum}")
+            return kind(default)
+        return value
+
+    def integer(self, name: str, default: int, minimum: int = 0) -> int:
+        return self.number(name, default, int, minimum)
+
+    def real(self, name: str, default: float, minimum: float = 0) -> float:
+        return self.number(name, default, float, minimum)
+
+    def boolean(self, name: str, default: bool) -> bool:
+        raw = self.environ.get(name)
+        if raw is None or raw.strip() == "":
+            return default
+        value = raw.strip().lower()
+        if value in ("1", "true", "yes", "on"):
+            return True
+        if value in ("0", "false", "no", "off"):
+            return False
+        self.errors.append(f"{name}={raw!r} is not a boolean (true or false)")
+        return default
+
+    def pairs(self, name: str, default: str, check: Callable[[str], Optional[str]]) -> str:
+        """
+        Read a comma-separated list of logger=value pairs, returned as is
+
+        Args:
+            check: Returns what is wrong with a value, or None if it is usable
+        """
+        value = self.environ.get(name, default)
+        for item in filter(None, (item.strip() for item in value.split(","))):
+            logger_name, equals, setting = item.partition("=")
+            problem = check(setting.strip()) if equals and logger_name.strip() else "is not logger=value"
+            if problem is not None:
+                self.errors.append(f"{name}: {item!r} {problem}")
+        return value
+
+    def log_levels(self, name: str, default: str = "") -> str:
+        return self.pairs(name, default, lambda level: None if level.upper() in LOG_LEVEL_NAMES
+                          else f"is not one of {', '.join(LOG_LEVEL_NAMES)}")
+
+    def rates(self, name: str, default: str = "") -> str:
+        return self.pairs(name, default, _rate_problem)
+
+
+def _rate_problem(value: str) -> Optional[str]:
+    try:
+        rate = float(value)
+    except ValueError:
+        return "is not a number"
+    return None if 0 <= rate <= 1 else "is not between 0 and 1"
+
+
+def load_settings(environ: Mapping[str, str] = os.environ) -> Settings:
+    """
+    Read and check every setting
+
+    Args:
+        environ: Where settings are read from
+
+    Returns:
+        The settings
+
+    Raises:
+        ConfigError: Listing every setting with an unusable value
+    """
+    env = _EnvReader(environ)
+    server_workers = env.integer("SERVER_WORKERS", 1, minimum=1)
+    shared_state_path = env.string(
+        "SHARED_STATE_PATH", os.path.join(SERVER_DIR, ".shared_state.sqlite3") if server_workers > 1 else ""
+    )
+    ai_base_url = env.string("AI_BASE_URL")
+    if ai_base_url and not ai_base_url.startswith(("http://", "https://")):
+        env.errors.append(f"AI_BASE_URL={ai_base_url!r} is not an http:// or https:// URL")
+
+    settings = Settings(
+        openai_api_key=env.string("OPENAI_API_KEY"),
+        openai_model=env.string("OPENAI_MODEL", "gpt-4o-mini"),
+        ai_provider=env.string("AI_PROVIDER", "openai", choices=("openai", "compatible", "mock")),
+        ai_base_url=ai_base_url,
+        server_workers=server_workers,
+        shared_state_path=shared_state_path,
+        cors_origins=tuple(
+            origin.strip() for origin in env.string("CORS_ORIGINS", "http://localhost:5173").split(",")
+            if origin.strip()
+        ),
+        command_timeout=env.real("COMMAND_TIMEOUT", 10),
+        script_timeout=env.real("SCRIPT_TIMEOUT", 10),
+        output_max_bytes=env.integer("OUTPUT_MAX_BYTES", 1024 * 1024, minimum=1),
+        max_concurrent_processes=env.integer("MAX_CONCURRENT_PROCESSES", 8, minimum=1),
+        python_worker_pool_size=env.integer("PYTHON_WORKER_POOL_SIZE", 2),
+        python_worker_max_runs=env.integer("PYTHON_WORKER_MAX_RUNS", 100, minimum=1),
+        python_worker_memory_limit_mb=env.integer("PYTHON_WORKER_MEMORY_LIMIT_MB", 512),
+        artifact_cache_dir=env.string("ARTIFACT_CACHE_DIR", os.path.join(SERVER_DIR, ".artifact_cache")),
+        artifact_cache_max_entries=env.integer("ARTIFACT_CACHE_MAX_ENTRIES", 512),
+        file_index_path=env.string("FILE_INDEX_PATH", os.path.join(SERVER_DIR, ".file_index.sqlite3")),
+        view_max_bytes=env.integer("VIEW_MAX_BYTES", 256 * 1024, minimum=1),
+        view_default_lines=env.integer("VIEW_DEFAULT_LINES", 200, minimum=1),
+        max_sessions=env.integer("MAX_SESSIONS", 100, minimum=1),
+        session_idle_timeout=env.real("SESSION_IDLE_TIMEOUT", 1800),
+        session_history_size=env.integer("SESSION_HISTORY_SIZE", 500),
+        batch_max_commands=env.integer("BATCH_MAX_COMMANDS", 100, minimum=1),
+        batch_max_concurrency=env.integer("BATCH_MAX_CONCURRENCY", 4, minimum=1),
+        job_db_path=env.string("JOB_DB_PATH", os.path.join(SERVER_DIR, ".jobs.sqlite3")),
+        job_workers=env.integer("JOB_WORKERS", 2, minimum=1),
+        job_max_queued=env.integer("JOB_MAX_QUEUED", 1000),
+        job_retention=env.real("JOB_RETENTION", 86400),
+        job_poll_interval=env.real("JOB_POLL_INTERVAL", 1, minimum=0.01),
+        kernel_max=env.integer("KERNEL_MAX", 16),
+        kernel_idle_timeout=env.real("KERNEL_IDLE_TIMEOUT", 600),
+        kernel_timeout=env.real("KERNEL_TIMEOUT", 30),
+        kernel_memory_limit_mb=env.integer("KERNEL_MEMORY_LIMIT_MB", 512),
+        node_binary=env.string("NODE_BINARY", "node"),
+        http_pool_limit=env.integer("HTTP_POOL_LIMIT", 100),
+        http_pool_limit_per_host=env.integer("HTTP_POOL_LIMIT_PER_HOST", 20),
+        http_keepalive_timeout=env.real("HTTP_KEEPALIVE_TIMEOUT", 60),
+        http_dns_cache_ttl=env.integer("HTTP_DNS_CACHE_TTL", 300),
+        ai_cache_enabled=env.boolean("AI_CACHE_ENABLED", True),
+        ai_cache_max_entries=env.integer("AI_CACHE_MAX_ENTRIES", 256),
+        ai_cache_ttl=env.real("AI_CACHE_TTL", 3600),
+        ai_cache_path=env.string("AI_CACHE_PATH", shared_state_path),
+        ai_max_in_flight=env.integer("AI_MAX_IN_FLIGHT", 8, minimum=1),
+        ai_requests_per_minute=env.real("AI_REQUESTS_PER_MINUTE", 500),
+        ai_tokens_per_minute=env.real("AI_TOKENS_PER_MINUTE", 200000),
+        ai_max_retries=env.integer("AI_MAX_RETRIES", 3),
+        ai_backoff_base=env.real("AI_BACKOFF_BASE", 0.5),
+        ai_backoff_max=env.real("AI_BACKOFF_MAX", 30),
+        ai_connect_timeout=env.real("AI_CONNECT_TIMEOUT", 10),
+        ai_read_timeout=env.real("AI_READ_TIMEOUT", 120),
+        ai_total_timeout=env.real("AI_TOTAL_TIMEOUT", 300),
+        ai_hedge_percentile=env.real("AI_HEDGE_PERCENTILE", 0),
+        ai_hedge_min_samples=env.integer("AI_HEDGE_MIN_SAMPLES", 20, minimum=1),
+        ai_hedge_min_delay=env.real("AI_HEDGE_MIN_DELAY", 0.25),
+        ai_hedge_max_ratio=env.real("AI_HEDGE_MAX_RATIO", 0.1),
+        ai_code_candidates=env.integer("AI_CODE_CANDIDATES", 1, minimum=1),
+        ai_code_max_candidates=env.integer("AI_CODE_MAX_CANDIDATES", 4, minimum=1),
+        ai_code_token_budget=env.integer("AI_CODE_TOKEN_BUDGET", 10000),
+        log_level=env.string("LOG_LEVEL", "INFO").upper(),
+        log_levels=env.log_levels("LOG_LEVELS"),
+        log_format=env.string("LOG_FORMAT", "text").lower(),
+        log_queue_size=env.integer("LOG_QUEUE_SIZE", 10000, minimum=1),
+        log_max_field_chars=env.integer("LOG_MAX_FIELD_CHARS", 2000),
+        log_sample_rates=env.rates("LOG_SAMPLE_RATES", "terminal-api.ai.payloads=0.1"),
+    )
+    if settings.log_level not in LOG_LEVEL_NAMES:
+        env.errors.append(f"LOG_LEVEL={settings.log_level!r} is not one of {', '.join(LOG_LEVEL_NAMES)}")
+    if settings.log_format not in ("text", "json"):
+        env.errors.append(f"LOG_FORMAT={settings.log_format!r} is not one of text, json")
+    if settings.ai_hedge_percentile >= 100:
+        env.errors.append(f"AI_HEDGE_PERCENTILE={settings.ai_hedge_percentile:g} is not below 100")
+    if settings.ai_hedge_max_ratio > 1:
+        env.errors.append(f"AI_HEDGE_MAX_RATIO={settings.ai_hedge_max_ratio:g} is more than 1")
+
+    if env.errors:
+        raise ConfigError("Invalid settings:\n  " + "\n  ".join(env.errors))
+    return settings
+
+
+def masked_api_key(settings: Settings) -> str:
+    """Return the API key with all but its ends hidden, for logging"""
+    key = settings.openai_api_key
+    return key[:8] + "*" * 10 + key[-4:] if key else ""
+
+
+# The .env file fills in what the environment doesn't set, so processes started
+# from the server (including worker processes) see the same settings
+for _key, _value in read_env_file(ENV_PATH).items():
+    os.environ.setdefault(_key, _value)
+
+settings = load_settings()
+
+# Aliases of the settings under their environment variable names
+OPENAI_API_KEY = settings.openai_api_key
+OPENAI_MODEL = settings.openai_model
+AI_PROVIDER = settings.ai_provider
+AI_BASE_URL = settings.ai_base_url
+SERVER_WORKERS = settings.server_workers
+SHARED_STATE_PATH = settings.shared_state_path
+CORS_ORIGINS = settings.cors_origins
+COMMAND_TIMEOUT = settings.command_timeout
+SCRIPT_TIMEOUT = settings.script_timeout
+OUTPUT_MAX_BYTES = settings.output_max_bytes
+MAX_CONCURRENT_PROCESSES = settings.max_concurrent_processes
+PYTHON_WORKER_POOL_SIZE = settings.python_worker_pool_size
+PYTHON_WORKER_MAX_RUNS = settings.python_worker_max_runs
+PYTHON_WORKER_MEMORY_LIMIT_MB = settings.python_worker_memory_limit_mb
+ARTIFACT_CACHE_DIR = settings.artifact_cache_dir
+ARTIFACT_CACHE_MAX_ENTRIES = settings.artifact_cache_max_entries
+FILE_INDEX_PATH = settings.file_index_path
+VIEW_MAX_BYTES = settings.view_max_bytes
+VIEW_DEFAULT_LINES = settings.view_default_lines
+MAX_SESSIONS = settings.max_sessions
+SESSION_IDLE_TIMEOUT = settings.session_idle_timeout
+SESSION_HISTORY_SIZE = settings.session_history_size
+BATCH_MAX_COMMANDS = settings.batch_max_commands
+BATCH_MAX_CONCURRENCY = settings.batch_max_concurrency
+JOB_DB_PATH = settings.job_db_path
+JOB_WORKERS = settings.job_workers
+JOB_MAX_QUEUED = settings.job_max_queued
+JOB_RETENTION = settings.job_retention
+JOB_POLL_INTERVAL = settings.job_poll_interval
+KERNEL_MAX = settings.kernel_max
+KERNEL_IDLE_TIMEOUT = settings.kernel_idle_timeout
+KERNEL_TIMEOUT = settings.kernel_timeout
+KERNEL_MEMORY_LIMIT_MB = settings.kernel_memory_limit_mb
+NODE_BINARY = settings.node_binary
+HTTP_POOL_LIMIT = settings.http_pool_limit
+HTTP_POOL_LIMIT_PER_HOST = settings.http_pool_limit_per_host
+HTTP_KEEPALIVE_TIMEOUT = settings.http_keepalive_timeout
+HTTP_DNS_CACHE_TTL = settings.http_dns_cache_ttl
+AI_CACHE_ENABLED = settings.ai_cache_enabled
+AI_CACHE_MAX_ENTRIES = settings.ai_cache_max_entries
+AI_CACHE_TTL = settings.ai_cache_ttl
+AI_CACHE_PATH = settings.ai_cache_path
+AI_MAX_IN_FLIGHT = settings.ai_max_in_flight
+AI_REQUESTS_PER_MINUTE = settings.ai_requests_per_minute
+AI_TOKENS_PER_MINUTE = settings.ai_tokens_per_minute
+AI_MAX_RETRIES = settings.ai_max_retries
+AI_BACKOFF_BASE = settings.ai_backoff_base
+AI_BACKOFF_MAX = settings.ai_backoff_max
+AI_CONNECT_TIMEOUT = settings.ai_connect_timeout
+AI_READ_TIMEOUT = settings.ai_read_timeout
+AI_TOTAL_TIMEOUT = settings.ai_total_timeout
+AI_HEDGE_PERCENTILE = settings.ai_hedge_percentile
+AI_HEDGE_MIN_SAMPLES = settings.ai_hedge_min_samples
+AI_HEDGE_MIN_DELAY = settings.ai_hedge_min_delay
+AI_HEDGE_MAX_RATIO = settings.ai_hedge_max_ratio
+AI_CODE_CANDIDATES = settings.ai_code_candidates
+AI_CODE_MAX_CANDIDATES = settings.ai_code_max_candidates
+AI_CODE_TOKEN_BUDGET = settings.ai_code_token_budget
+LOG_LEVEL = settings.log_level
+LOG_LEVELS = settings.log_levels
+LOG_FORMAT = settings.log_format
+LOG_QUEUE_SIZE = settings.log_queue_size
+LOG_MAX_FIELD_CHARS = settings.log_max_field_chars
+LOG_SAMPLE_RATES = settings.log_sample_rates
@@ -0,0 +1,191 @@
+# Logging pipeline: structured records, written by a background thread
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from typing import Any, Dict, Optional
+from core.config import (
+    LOG_FORMAT,
+    LOG_LEVEL,
+    LOG_LEVELS,
+    LOG_MAX_FIELD_CHARS,
+    LOG_QUEUE_SIZE,
+    LOG_SAMPLE_RATES,
+)
+
+# Attributes every LogRecord has; anything else was passed with extra= and is a structured field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """Parse "name=LEVEL,other=LEVEL" into {name: LEVEL}"""
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def parse_rates(spec: str) -> Dict[str, float]:
+    """Parse "name=0.1,other=0.5" into {name: rate}"""
+    return {name: float(rate) for name, rate in parse_levels(spec).items()}
+
+
+def truncate(value: str, limit: int) -> str:
+    if limit > 0 and len(value) > limit:
+        return f"{value[:limit]}... [{len(value) - limit} more characters]"
+    return value
+
+
+def record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    """Return the structured fields passed to a log call with extra="""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through only a fraction of the records of high-volume loggers"""
+
+    def __init__(self, rates: Dict[str, float]):
+        """
+        Args:
+            rates: Fraction of records kept per logger name; applies to child loggers too
+        """
+        super().__init__()
+        self.rates = rates
+        self.dropped = 0
+
+    def _rate(self, name: str) -> float:
+        while True:
+            if name in self.rates:
+                return self.rates[name]
+            if "." not in name:
+                return 1.0
+            name = name.rsplit(".", 1)[0]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Warnings and errors are never sampled away
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without ever waiting: when the queue
+    is full the record is dropped and counted instead of stalling the caller
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_field_chars: int):
+        super().__init__(log_queue)
+        self.max_field_chars = max_field_chars
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Format the message here, while the arguments are still current, and cut
+        # payloads down before they are queued
+        record = super().prepare(record)
+        record.msg = truncate(record.msg, self.max_field_chars)
+        for key, value in record_fields(record).items():
+            if not isinstance(value, (int, float, bool)) and value is not None:
+                text = value if isinstance(value, str) else json.dumps(value, default=str)
+                if isinstance(value, str) or len(text) > self.max_field_chars > 0:
+                    setattr(record, key, truncate(text, self.max_field_chars))
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the structured fields at the top level"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The usual text line, followed by the structured fields as key=value pairs"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+_sampler = SamplingFilter({})
+_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def configure_logging() -> None:
+    """
+    Route all logging through a bounded queue to a writer thread
+
+    Levels come from LOG_LEVEL and the per-logger LOG_LEVELS, sampling rates
+    from LOG_SAMPLE_RATES, and the output format from LOG_FORMAT ("text" or
+    "json"). Calling it again is a no-op.
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler = NonBlockingQueueHandler(log_queue, LOG_MAX_FIELD_CHARS)
+    _sampler.rates = parse_rates(LOG_SAMPLE_RATES)
+    _handler.addFilter(_sampler)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Write out the records still queued and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> Dict[str, int]:
+    """Return counts of records dropped because the queue was full or by sampling"""
+    return {
+        "dropped_queue_full": _handler.dropped if _handler is not None else 0,
+        "dropped_sampled": _sampler.dropped,
+    }
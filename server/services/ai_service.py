@@ -1,11 +1,309 @@
 import os
 import json
-import aiohttp
-import certifi
-import ssl
-from typing import Dict, Any, Optional, List
+import time
+import asyncio
+import logging
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Any, Optional, List, AsyncIterator, Tuple
 from api.models import CommandResponse
-from core.config import OPENAI_API_KEY, OPENAI_MODEL
+from core.config import (AI_CODE_CANDIDATES, AI_CODE_MAX_CANDIDATES, AI_CODE_TOKEN_BUDGET, AI_CONNECT_TIMEOUT,
+                         AI_READ_TIMEOUT, AI_TOTAL_TIMEOUT, OPENAI_MODEL, SCRIPT_TIMEOUT)
+from services.worker_pool import run_python_file
+from services.artifact_cache import artifact_cache
+from services.code_stream import CodeStream, extract_code
+from services.hedging import hedge_policy
+from services.http_client import HTTPClient
+from services.llm_backend import ChatBackend, llm_backend
+from services.metrics import CODE_CANDIDATES, CODE_STREAMS, record, span
+from services.process_runner import ProcessResult
+from services.rate_limiter import RETRYABLE_STATUSES, upstream_scheduler
+from services.response_cache import ResponseCache, response_cache
+from services.shared_state import run_in_thread, shared_state
+from services.singleflight import SingleFlight
+
+logger = logging.getLogger("terminal-api.ai")
+# Prompts and raw responses; high volume, so sampled and truncated (see core/logging_config.py)
+payload_logger = logging.getLogger("terminal-api.ai.payloads")
+
+if TYPE_CHECKING:
+    import aiohttp
+    from services.file_service import StagedFile
+
+# Coalesces concurrent identical completion requests
+ai_singleflight = SingleFlight()
+
+# Seconds a worker process may hold a completion request to itself, after which
+# the other processes stop waiting for it (see _coalesce_completion)
+SHARED_FLIGHT_TTL = 120
+SHARED_FLIGHT_POLL = 0.05
+
+class AIServiceError(Exception):
+    """Raised when a streamed AI request cannot be completed"""
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """
+    Estimate the tokens a completion request uses, for rate limiting
+    
+    Roughly four characters per prompt token, plus the most the answer can use.
+    """
+    return len(prompt) // 4 + max_tokens
+
+def candidate_count(prompt: str, max_tokens: int, requested: Optional[int] = None) -> int:
+    """
+    Return how many code candidates to generate for a request
+    
+    The requested number (AI_CODE_CANDIDATES by default) is capped by
+    AI_CODE_MAX_CANDIDATES, and by how many requests of this size fit in
+    AI_CODE_TOKEN_BUDGET. There is always at least one.
+    """
+    count = min(requested or AI_CODE_CANDIDATES, AI_CODE_MAX_CANDIDATES,
+                AI_CODE_TOKEN_BUDGET // estimate_tokens(prompt, max_tokens))
+    return max(count, 1)
+
+@dataclass
+class CodeAnswer:
+    """A code completion streamed by AIService._stream_answer"""
+    # The model's answer, up to where reading stopped
+    text: str = ""
+    # The code extracted from it
+    code: str = ""
+    # Whether the answer holds all of its code, so it can be cached
+    complete: bool = False
+    # What to report instead, when no usable answer came back
+    error: Optional[CommandResponse] = None
+
+@dataclass(eq=False)
+class CodeCandidate:
+    """One of several code completions generated in parallel for the same request"""
+    staged: "StagedFile"
+    answer: CodeAnswer = field(default_factory=CodeAnswer)
+    # Name the file would be saved under, set once the code compiles
+    filename: Optional[str] = None
+    # Its dry run from the staged file, if it was run
+    run: Optional[ProcessResult] = None
+    
+    @property
+    def passed(self) -> bool:
+        """Whether the code compiled and, if it was run, exited cleanly"""
+        if self.filename is None:
+            return False
+        return self.run is None or (self.run.returncode == 0 and not self.run.timed_out)
+    
+    @property
+    def progress(self) -> int:
+        """How far the candidate got: no answer, code that doesn't compile, code that compiles, or passed"""
+        if self.passed:
+            return 3
+        if self.filename is not None:
+            return 2
+        return 0 if self.answer.error is not None else 1
+
+def request_timeout(deadline: Optional[float]) -> "aiohttp.ClientTimeout":
+    """
+    Return the timeouts of one request to the API, see AI_CONNECT_TIMEOUT and AI_READ_TIMEOUT
+    
+    Args:
+        deadline: time.monotonic() by which the whole request must be done, None for no limit
+    """
+    import aiohttp
+    total = None if deadline is None else max(deadline - time.monotonic(), 0.001)
+    return aiohttp.ClientTimeout(total=total, sock_connect=AI_CONNECT_TIMEOUT or None,
+                                 sock_read=AI_READ_TIMEOUT or None)
+
+def describe_error(error: Exception) -> str:
+    """Describe a failed request for the user; aiohttp's timeouts come without a message"""
+    if isinstance(error, asyncio.TimeoutError) and not str(error):
+        return "The request timed out"
+    return str(error)
+
+class _Attempt:
+    """One request of a possibly hedged completion attempt, with its own upstream slot"""
+    
+    def __init__(self, session: "aiohttp.ClientSession", backend: ChatBackend, payload: Dict[str, Any],
+                 tokens: int, deadline: Optional[float]):
+        self.slot = AsyncExitStack()
+        # Set once the request has a slot and is sent; the wait for a slot doesn't count towards hedging
+        self.sent = asyncio.Event()
+        self.sent_at: Optional[float] = None
+        self.answered_at: Optional[float] = None
+        self.task = asyncio.ensure_future(self._send(session, backend, payload, tokens, deadline))
+    
+    async def _send(self, session: "aiohttp.ClientSession", backend: ChatBackend, payload: Dict[str, Any],
+                    tokens: int, deadline: Optional[float]) -> "aiohttp.ClientResponse":
+        waiting_since = time.perf_counter()
+        await self.slot.enter_async_context(upstream_scheduler.slot(tokens))
+        record("ai.queue", time.perf_counter() - waiting_since)
+        self.sent_at = time.perf_counter()
+        self.sent.set()
+        response = await session.post(backend.chat_url, headers=backend.headers(), json=payload,
+                                      timeout=request_timeout(deadline))
+        self.answered_at = time.perf_counter()
+        return response
+    
+    @property
+    def latency(self) -> Optional[float]:
+        """Seconds the request waited for its response, so far if it has none yet; None if it wasn't sent"""
+        if self.sent_at is None:
+            return None
+        return (self.answered_at or time.perf_counter()) - self.sent_at
+    
+    async def discard(self) -> None:
+        """Cancel the request, or close its response if it already has one, and free its slot"""
+        self.task.cancel()
+        try:
+            result, = await asyncio.gather(self.task, return_exceptions=True)
+            if not isinstance(result, BaseException):
+                result.close()
+        finally:
+            await self.slot.aclose()
+
+async def _send_hedged(session: "aiohttp.ClientSession", backend: ChatBackend, payload: Dict[str, Any],
+                       tokens: int, deadline: Optional[float], held: AsyncExitStack) -> "aiohttp.ClientResponse":
+    """
+    Send one attempt of a completion request, sending it again if it is slow to respond
+    
+    Whichever response comes first is used and the other request is
+    cancelled, see HedgePolicy. The used request's upstream slot is added
+    to held, to be kept until its response has been read.
+    
+    Raises:
+        The first request's error, if neither got a response
+    """
+    key = hedge_policy.key(payload)
+    primary = _Attempt(session, backend, payload, tokens, deadline)
+    attempts = [primary]
+    try:
+        delay = hedge_policy.delay(key)
+        if delay is not None:
+            sent = asyncio.ensure_future(primary.sent.wait())
+            try:
+                await asyncio.wait((primary.task, sent), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                sent.cancel()
+            done, _ = await asyncio.wait((primary.task,), timeout=delay)
+            if not done and hedge_policy.allow():
+                logger.info("Hedging slow AI request", extra={"delay": round(delay, 2)})
+                attempts.append(_Attempt(session, backend, payload, tokens, deadline))
+        
+        winner, error = None, None
+        pending = {attempt.task for attempt in attempts}
+        while winner is None and pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in attempts:
+                if attempt.task not in done:
+                    continue
+                if attempt.task.exception() is None:
+                    winner = winner or attempt
+                else:
+                    error = error or attempt.task.exception()
+        
+        # The first request's wait is what hedging is measured against, even when the duplicate won
+        if winner is not None and primary.latency is not None:
+            hedge_policy.observe(key, primary.latency)
+        if winner is None:
+            raise error
+        hedge_policy.finish(hedged=len(attempts) > 1, hedge_won=winner is not primary)
+        
+        attempts.remove(winner)
+        held.push_async_callback(winner.slot.aclose)
+        return winner.task.result()
+    finally:
+        for attempt in attempts:
+            await attempt.discard()
+
+@asynccontextmanager
+async def open_completion(payload: Dict[str, Any], tokens: int,
+                          backend: Optional[ChatBackend] = None) -> AsyncIterator["aiohttp.ClientResponse"]:
+    """
+    Send a chat completion request within the upstream limits, retrying throttled or failed attempts
+    
+    The request holds an upstream slot until the block exits, so streamed
+    answers count against the concurrency limit while they are read. An
+    attempt that is slow to respond is hedged (see _send_hedged), and the
+    whole request, including retries and reading the response, must finish
+    within AI_TOTAL_TIMEOUT.
+    
+    Args:
+        payload: The request body
+        tokens: Estimated tokens the request uses
+        backend: The API to send it to, the configured one by default
+        
+    Yields:
+        The response; a non-200 status is only yielded once retries (or the time for them) are used up
+        
+    Raises:
+        asyncio.TimeoutError: If no attempt got a response in time
+    """
+    import aiohttp
+    backend = backend or llm_backend
+    session = await HTTPClient.get_session()
+    deadline = time.monotonic() + AI_TOTAL_TIMEOUT if AI_TOTAL_TIMEOUT else None
+    attempt = 0
+    while True:
+        async with AsyncExitStack() as held:
+            with span("ai.upstream"):
+                try:
+                    response = await _send_hedged(session, backend, payload, tokens, deadline, held)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt >= upstream_scheduler.max_retries:
+                        raise
+                    delay = upstream_scheduler.backoff(attempt)
+                    if not _time_left(deadline, delay):
+                        raise asyncio.TimeoutError(f"No response from the API within {AI_TOTAL_TIMEOUT:g} seconds")
+                else:
+                    if response.status in RETRYABLE_STATUSES and attempt < upstream_scheduler.max_retries:
+                        delay = upstream_scheduler.backoff(attempt, upstream_scheduler.retry_after(response.headers))
+                        retrying = _time_left(deadline, delay)
+                    else:
+                        retrying = False
+                    if not retrying:
+                        try:
+                            yield response
+                        finally:
+                            response.release()
+                        return
+                    
+                    if response.status == 429:
+                        # Everyone waits, not just this request, or the next one is throttled too
+                        upstream_scheduler.pause(delay)
+                    response.release()
+        
+        logger.warning("Retrying AI request", extra={"delay": round(delay, 2), "attempt": attempt + 2})
+        attempt += 1
+        with span("ai.backoff"):
+            await asyncio.sleep(delay)
+
+def _time_left(deadline: Optional[float], delay: float) -> bool:
+    """Whether there is time to wait delay seconds and try again before the deadline"""
+    return deadline is None or time.monotonic() + delay < deadline
+
+class ChatStream:
+    """Reads the text of a streamed chat completion from its server-sent events"""
+    
+    def __init__(self, response: "aiohttp.ClientResponse"):
+        self.response = response
+        # Whether the API marked the answer as complete
+        self.finished = False
+    
+    async def __aiter__(self) -> AsyncIterator[str]:
+        # The API sends server-sent events, one "data:" line per chunk
+        async for raw_line in self.response.content:
+            line = raw_line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            
+            data = line[5:].strip()
+            if data == "[DONE]":
+                self.finished = True
+                return
+            
+            chunk = json.loads(data)
+            if not chunk.get("choices"):
+                continue
+            delta = chunk["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
 
 class AIService:
     """Service for interacting with OpenAI API"""
@@ -14,7 +312,8 @@ class AIService:
     async def generate_response(prompt: str, 
                                model: Optional[str] = None,
                                temperature: float = 0.7,
-                               max_tokens: int = 1000) -> CommandResponse:
+                               max_tokens: int = 1000,
+                               use_cache: bool = True) -> CommandResponse:
         """
         Generate a response from OpenAI API
         
@@ -23,79 +322,501 @@ class AIService:
             model: The model to use (defaults to config value)
             temperature: Controls randomness (0-1)
             max_tokens: Maximum tokens in the response
+            use_cache: Whether a cached response may be returned (a fresh
+                response is still stored when this is False)
             
         Returns:
             CommandResponse with the model's response
         """
-        api_key = OPENAI_API_KEY
-        masked_key = api_key[:8] + "*" * 10 + api_key[-4:] if api_key else ""
-        print(f"Using API key: {masked_key}")
+        key_error = llm_backend.missing_key_error()
+        if key_error:
+            return CommandResponse(output=key_error, status=1)
         
-        if not api_key:
-            return CommandResponse(
-                output="Error: OpenAI API key not configured. Set the OPENAI_API_KEY environment variable.",
-                status=1
+        model = model or OPENAI_MODEL
+        
+        cache_key = ResponseCache.make_key(llm_backend.cache_model(model), prompt, temperature, max_tokens)
+        if use_cache:
+            with span("ai.cache"):
+                cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return CommandResponse(output=f"Model: {model}\n\n{cached}", status=0)
+
+        # Identical requests already in flight share one upstream call
+        return await ai_singleflight.do(
+            cache_key,
+            lambda: AIService._coalesce_completion(
+                cache_key, model,
+                lambda: AIService._request_completion(cache_key, prompt, model, temperature, max_tokens)
             )
+        )
+
+    @staticmethod
+    async def _coalesce_completion(cache_key: str,
+                                   model: str,
+                                   request: Callable[[], Awaitable[CommandResponse]]) -> CommandResponse:
+        """
+        Request a completion, unless another worker process is already
+        requesting the same one; then wait for it to finish and return its
+        answer from the shared response cache
         
-        model = model or OPENAI_MODEL
+        Args:
+            cache_key: Key the answer is cached under
+            model: The model the answer comes from
+            request: Sends the request and caches a successful answer
+        """
+        if shared_state is None or not response_cache.enabled or not response_cache.path:
+            return await request()
+        
+        lease = f"completion:{cache_key}"
+        while True:
+            owner = await run_in_thread(shared_state.acquire_lease, lease, SHARED_FLIGHT_TTL)
+            if owner is not None:
+                try:
+                    return await request()
+                finally:
+                    await run_in_thread(shared_state.release_lease, lease, owner)
+            
+            with span("ai.coalesce"):
+                while await run_in_thread(shared_state.lease_held, lease):
+                    await asyncio.sleep(SHARED_FLIGHT_POLL)
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return CommandResponse(output=f"Model: {model}\n\n{cached}", status=0)
+            # The other request failed, try again ourselves
 
+    @staticmethod
+    async def _request_completion(cache_key: str,
+                                  prompt: str,
+                                  model: str,
+                                  temperature: float,
+                                  max_tokens: int) -> CommandResponse:
+        """
+        Send a chat completion request upstream and cache a successful answer
+        
+        Args:
+            cache_key: Key the answer is cached under
+            prompt: The prompt to send to the model
+            model: The model to use
+            temperature: Controls randomness (0-1)
+            max_tokens: Maximum tokens in the response
+            
+        Returns:
+            CommandResponse with the model's response
+        """
         try:
-            # Create an SSL context using certifi's CA bundle
-            ssl_context = ssl.create_default_context(cafile=certifi.where())
-            
-            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                }
+            payload = llm_backend.payload(prompt, model, temperature, max_tokens)
+            
+            logger.debug("Sending AI request", extra={"url": llm_backend.chat_url, "model": model,
+                                                      "prompt_chars": len(prompt)})
+            payload_logger.debug("AI prompt", extra={"model": model, "prompt": prompt})
+            
+            tokens = estimate_tokens(prompt, max_tokens)
+            async with open_completion(payload, tokens) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.warning("AI request failed", extra={"status": response.status, "body": error_text})
+                    return CommandResponse(
+                        output=f"Error from OpenAI API (Status {response.status}): {error_text}",
+                        status=1
+                    )
                 
-                payload = {
-                    "model": model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": temperature,
-                    "max_tokens": max_tokens
-                }
+                data = await response.json()
+                payload_logger.debug("AI response", extra={"model": model, "response": data})
                 
-                print(f"Sending request to OpenAI API with model: {model}")
-                print(f"Prompt: {prompt}")
+                usage = data.get("usage") or {}
+                logger.debug("AI response received", extra={"model": model, "usage": usage})
+                if "total_tokens" in usage:
+                    upstream_scheduler.settle(tokens, usage["total_tokens"])
                 
-                async with session.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=headers,
-                    json=payload
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        print(f"Error from OpenAI API: {error_text}")
-                        return CommandResponse(
-                            output=f"Error from OpenAI API (Status {response.status}): {error_text}",
-                            status=1
-                        )
-                    
-                    data = await response.json()
-                    print(f"Received response from OpenAI API: {data}")
-                    
-                    # Extract the response text
-                    response_text = data["choices"][0]["message"]["content"]
-                    
-                    # Include model info in the output
-                    output = f"Model: {model}\n\n{response_text}"
-                    
-                    return CommandResponse(output=output, status=0)
+                # Extract the response text
+                response_text = data["choices"][0]["message"]["content"]
+                await response_cache.set(cache_key, response_text)
+                
+                # Include model info in the output
+                output = f"Model: {model}\n\n{response_text}"
+                
+                return CommandResponse(output=output, status=0)
                     
         except Exception as e:
-            print(f"Exception in AI service: {str(e)}")
+            logger.exception("AI request raised", extra={"model": model})
             return CommandResponse(
-                output=f"Error calling OpenAI API: {str(e)}",
+                output=f"Error calling OpenAI API: {describe_error(e)}",
                 status=1
             ) 
 
+    @staticmethod
+    async def stream_response(prompt: str,
+                              model: Optional[str] = None,
+                              temperature: float = 0.7,
+                              max_tokens: int = 1000,
+                              use_cache: bool = True) -> AsyncIterator[str]:
+        """
+        Stream a response from OpenAI API as it is generated
+        
+        Args:
+            prompt: The prompt to send to the model
+            model: The model to use (defaults to config value)
+            temperature: Controls randomness (0-1)
+            max_tokens: Maximum tokens in the response
+            use_cache: Whether a cached response may be returned
+            
+        Yields:
+            Pieces of the response text as they arrive
+            
+        Raises:
+            AIServiceError: If the request fails
+        """
+        key_error = llm_backend.missing_key_error()
+        if key_error:
+            raise AIServiceError(key_error)
+        
+        model = model or OPENAI_MODEL
+        
+        cache_key = ResponseCache.make_key(llm_backend.cache_model(model), prompt, temperature, max_tokens)
+        if use_cache:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        payload = llm_backend.payload(prompt, model, temperature, max_tokens, stream=True)
+        
+        try:
+            async with open_completion(payload, estimate_tokens(prompt, max_tokens)) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise AIServiceError(f"Error from OpenAI API (Status {response.status}): {error_text}")
+                
+                collected = []
+                stream = ChatStream(response)
+                async for delta in stream:
+                    collected.append(delta)
+                    yield delta
+                
+                # Only complete answers are worth caching
+                if stream.finished:
+                    await response_cache.set(cache_key, "".join(collected))
+                        
+        except AIServiceError:
+            raise
+        except Exception as e:
+            raise AIServiceError(f"Error calling OpenAI API: {describe_error(e)}") from e
+
+    @staticmethod
+    async def _stream_answer(prompt: str,
+                             model: str,
+                             temperature: float,
+                             max_tokens: int,
+                             staged: "StagedFile") -> CodeAnswer:
+        """
+        Stream a code completion, extracting, checking and writing the code as it arrives
+        
+        Reading stops as soon as the code block is closed, and the request is
+        abandoned as soon as the code is clearly malformed, so neither waits
+        for (or pays for) the rest of the answer.
+        
+        Args:
+            prompt: The prompt to send to the model
+            model: The model to use
+            temperature: Controls randomness (0-1)
+            max_tokens: Maximum tokens in the response
+            staged: Receives the code
+            
+        Returns:
+            The answer and its code, or the error to report
+        """
+        payload = llm_backend.payload(prompt, model, temperature, max_tokens, stream=True)
+        payload_logger.debug("AI prompt", extra={"model": model, "prompt": prompt})
+        
+        code = CodeStream(staged)
+        collected = []
+        try:
+            async with open_completion(payload, estimate_tokens(prompt, max_tokens)) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.warning("AI request failed", extra={"status": response.status, "body": error_text})
+                    CODE_STREAMS.inc(outcome="failed")
+                    return CodeAnswer(error=CommandResponse(
+                        output=f"Error from OpenAI API (Status {response.status}): {error_text}",
+                        status=1
+                    ))
+                
+                stream = ChatStream(response)
+                async for delta in stream:
+                    collected.append(delta)
+                    code.feed(delta)
+                    if code.done or code.malformed:
+                        # Closes the connection, so the API stops generating
+                        response.close()
+                        break
+            
+            text = "".join(collected)
+            payload_logger.debug("AI response", extra={"model": model, "response": text})
+            
+            if code.malformed:
+                CODE_STREAMS.inc(outcome="malformed")
+                logger.warning(f"Python syntax error in generated code: {code.malformed}")
+                return CodeAnswer(text=text, error=CommandResponse(
+                    output=f"⚠️ Warning: The generated Python code contains syntax errors: {code.malformed}\n"
+                           f"Stopped generating it early, and no file was created.",
+                    status=1
+                ))
+            
+            CODE_STREAMS.inc(outcome="complete" if stream.finished else "stopped" if code.done else "truncated")
+            answer = CodeAnswer(text=text, code=code.finish(), complete=stream.finished or code.done)
+            staged.close()
+            return answer
+        
+        except Exception as e:
+            logger.exception("AI request raised", extra={"model": model})
+            CODE_STREAMS.inc(outcome="failed")
+            return CodeAnswer(error=CommandResponse(
+                output=f"Error calling OpenAI API: {describe_error(e)}",
+                status=1
+            ))
+
+    @staticmethod
+    async def _stream_code(cache_key: str,
+                           prompt: str,
+                           model: str,
+                           temperature: float,
+                           max_tokens: int,
+                           request: str,
+                           created: List[CommandResponse]) -> CommandResponse:
+        """
+        Stream a code completion into a file, see _stream_answer
+        
+        Args:
+            cache_key: Key the answer is cached under
+            prompt: The prompt to send to the model
+            model: The model to use
+            temperature: Controls randomness (0-1)
+            max_tokens: Maximum tokens in the response
+            request: The user's request, recorded with the file
+            created: Receives the result of creating the file, once it is saved
+            
+        Returns:
+            CommandResponse with the model's response, like _request_completion
+        """
+        from services.file_service import FileService, StagedFile
+        staged = StagedFile()
+        try:
+            answer = await AIService._stream_answer(prompt, model, temperature, max_tokens, staged)
+            if answer.error is not None:
+                return answer.error
+            
+            file_response = await FileService.create_file(answer.code, prompt=request, staged=staged)
+            created.append(file_response)
+            
+            # The answer up to the end of the code block holds all of the code; only
+            # code that compiled is cached, so asking again can get a working answer
+            if answer.complete and file_response.status == 0:
+                await response_cache.set(cache_key, answer.text)
+            return CommandResponse(output=f"Model: {model}\n\n{answer.text}", status=0)
+        finally:
+            # Nothing left to delete once the file was moved into place
+            staged.discard()
+
+    @staticmethod
+    async def _try_candidate(prompt: str,
+                             model: str,
+                             temperature: float,
+                             max_tokens: int,
+                             dry_run: bool) -> CodeCandidate:
+        """
+        Generate one candidate, compile it and, with dry_run, run it from its staged file
+        
+        Returns:
+            The candidate; its staged file is deleted if the task is cancelled
+        """
+        from services.file_service import FileService, StagedFile
+        candidate = CodeCandidate(staged=StagedFile())
+        try:
+            candidate.answer = await AIService._stream_answer(prompt, model, temperature, max_tokens,
+                                                              candidate.staged)
+            if candidate.answer.error is not None:
+                return candidate
+            
+            content = candidate.answer.code.strip()
+            filename, file_path = FileService.target_path(content)
+            with span("file.compile"):
+                # Compiled for its final path, so tracebacks and the later save use the same artifact
+                artifact = artifact_cache.analyze(content, file_path)
+            if artifact.syntax_error:
+                return candidate
+            
+            candidate.filename = filename
+            if dry_run:
+                args = ["--demo"] if artifact.is_interactive else []
+                candidate.run = await run_python_file(candidate.staged.path, args, timeout=SCRIPT_TIMEOUT,
+                                                      code_path=artifact.code_path)
+            return candidate
+        except BaseException:
+            candidate.staged.discard()
+            raise
+
+    @staticmethod
+    async def _generate_candidates(cache_key: str,
+                                   prompt: str,
+                                   model: str,
+                                   temperature: float,
+                                   max_tokens: int,
+                                   request: str,
+                                   count: int,
+                                   dry_run: bool) -> Tuple[CommandResponse, Optional[CodeCandidate]]:
+        """
+        Generate several candidates in parallel and save the first one that
+        compiles and, with dry_run, runs cleanly
+        
+        Candidates are checked as they arrive; once one passes, the others
+        are cancelled, which stops their generation. If none passes, the one
+        that got furthest is saved (or its error returned), as if it had been
+        the only one.
+        
+        Args:
+            cache_key: Key the chosen answer is cached under
+            prompt: The prompt to send to the model
+            model: The model to use
+            temperature: Controls randomness (0-1)
+            max_tokens: Maximum tokens in each response
+            request: The user's request, recorded with the file
+            count: Number of candidates
+            dry_run: Whether candidates must run without errors, not just compile
+            
+        Returns:
+            The result of creating the file (or the error), and the candidate it came from
+        """
+        from services.file_service import FileService
+        tasks = [
+            asyncio.ensure_future(AIService._try_candidate(prompt, model, temperature, max_tokens, dry_run))
+            for _ in range(count)
+        ]
+        candidates: List[CodeCandidate] = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    candidate = await next_done
+                except Exception:
+                    logger.exception("Code candidate raised", extra={"model": model})
+                    continue
+                candidates.append(candidate)
+                if candidate.passed:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Wait for the cancelled candidates to close their connections and delete their files
+            for result in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(result, CodeCandidate) and all(result is not candidate for candidate in candidates):
+                    result.staged.discard()
+        
+        if not candidates:
+            return CommandResponse(output="Error: Every code candidate failed", status=1), None
+        
+        chosen = max(candidates, key=lambda candidate: candidate.progress)
+        for candidate in candidates:
+            CODE_CANDIDATES.inc(outcome="chosen" if candidate is chosen else "rejected")
+            if candidate is not chosen:
+                candidate.staged.discard()
+        CODE_CANDIDATES.inc(count - len(candidates), outcome="cancelled")
+        
+        try:
+            if chosen.answer.error is not None:
+                return chosen.answer.error, chosen
+            # Only an answer that passed is worth answering the same request with again
+            if chosen.answer.complete and chosen.passed:
+                await response_cache.set(cache_key, chosen.answer.text)
+            file_response = await FileService.create_file(chosen.answer.code, filename=chosen.filename,
+                                                          prompt=request, staged=chosen.staged)
+        finally:
+            chosen.staged.discard()
+        
+        if file_response.status == 0:
+            check = "ran cleanly" if dry_run else "compiled"
+            summary = (f"🎯 Kept the first of {count} candidates that {check}\n\n" if chosen.passed else
+                       f"⚠️ None of the {count} candidates {check}, kept the closest\n\n")
+            file_response.output = summary + file_response.output
+        return file_response, chosen
+
+    @staticmethod
+    async def _run_saved(file_response: CommandResponse,
+                         filename: str,
+                         result: Optional[ProcessResult] = None) -> CommandResponse:
+        """
+        Run a file generate_and_save_code just saved, or report the run it already had
+        
+        Args:
+            file_response: The result of creating the file
+            filename: The file's name
+            result: The file's dry run, if it was run before it was saved
+            
+        Returns:
+            CommandResponse with the file creation message and the script's output
+        """
+        from services.file_service import FILES_DIR
+        file_path = os.path.join(FILES_DIR, filename)
+        
+        # Check if the file contains input() calls (likely interactive)
+        artifact = artifact_cache.for_file(file_path)
+        is_interactive = artifact.is_interactive
+        
+        try:
+            # Create a message about running the file
+            run_message = f"\n🚀 Automatically running the file...\n\n"
+            
+            # If the script is interactive, run it with --demo flag
+            if is_interactive:
+                run_message += "Detected interactive script, running in demo mode...\n\n"
+            if result is None:
+                args = ["--demo"] if is_interactive else []
+                result = await run_python_file(file_path, args, timeout=SCRIPT_TIMEOUT,
+                                               code_path=artifact.code_path)
+            
+            if result.timed_out:
+                # If the script times out, it might be waiting for input
+                if is_interactive:
+                    return CommandResponse(
+                        output=file_response.output + 
+                               "\n⚠️ The script appears to be interactive and is waiting for user input.\n" +
+                               f"To run it manually, use: python {file_path}\n" +
+                               "Or view the code with: file:view " + filename,
+                        status=0
+                    )
+                return CommandResponse(
+                    output=file_response.output + f"\n⚠️ Script execution timed out after {SCRIPT_TIMEOUT} seconds.",
+                    status=0
+                )
+            
+            # Format the output
+            if result.returncode == 0:
+                if result.stdout.strip():
+                    run_message += f"Output:\n{result.stdout}\n"
+                else:
+                    run_message += "The script ran successfully with no output.\n"
+            else:
+                run_message += f"Error running the script:\n{result.stderr}\n"
+            run_message += result.truncation_marker()
+            
+            # Combine the file creation message with the run message
+            return CommandResponse(
+                output=file_response.output + run_message,
+                status=0
+            )
+            
+        except Exception as e:
+            return CommandResponse(
+                output=file_response.output + f"\n⚠️ Error running the script: {str(e)}",
+                status=0
+            )
+
     @staticmethod
     async def generate_and_save_code(prompt: str, 
                                model: Optional[str] = None,
                                temperature: float = 0.7,
                                max_tokens: int = 2000,
-                               auto_run: bool = True) -> CommandResponse:
+                               auto_run: bool = True,
+                               use_cache: bool = True,
+                               candidates: Optional[int] = None) -> CommandResponse:
         """
         Generate code from OpenAI API and save it to a file
         
@@ -105,6 +826,11 @@ class AIService:
             temperature: Controls randomness (0-1)
             max_tokens: Maximum tokens in the response
             auto_run: Whether to automatically run the generated code
+            use_cache: Whether a cached response may be returned
+            candidates: Number of candidates to generate in parallel, keeping the
+                first that compiles and (with auto_run) runs cleanly; defaults to
+                AI_CODE_CANDIDATES, and is capped by AI_CODE_MAX_CANDIDATES and
+                AI_CODE_TOKEN_BUDGET
             
         Returns:
             CommandResponse with the result
@@ -124,119 +850,70 @@ class AIService:
         Request: {prompt}
         """
         
-        # Get the response from the AI
-        response = await AIService.generate_response(enhanced_prompt, model, temperature, max_tokens)
+        key_error = llm_backend.missing_key_error()
+        if key_error:
+            return CommandResponse(output=key_error, status=1)
         
-        # If there was an error, return it
-        if response.status != 0:
-            return response
-        
-        # Extract just the code part
-        ai_response = response.output
-        if ai_response.startswith(f"Model:"):
-            # Remove the model info line
-            ai_response = ai_response.split("\n\n", 1)[1]
+        model = model or OPENAI_MODEL
         
-        # Clean up the code - remove markdown code block syntax if present
-        cleaned_code = ai_response
+        cache_key = ResponseCache.make_key(llm_backend.cache_model(model), enhanced_prompt, temperature, max_tokens)
+        response = None
+        if use_cache:
+            with span("ai.cache"):
+                cached = await response_cache.get(cache_key)
+            if cached is not None:
+                response = CommandResponse(output=f"Model: {model}\n\n{cached}", status=0)
         
-        # Remove markdown code block syntax if present
-        if "```python" in cleaned_code or "```" in cleaned_code:
-            # Try to extract just the code between markdown code blocks
-            import re
-            code_block_pattern = r"```(?:python)?(.*?)```"
-            code_blocks = re.findall(code_block_pattern, cleaned_code, re.DOTALL)
+        from services.file_service import FileService
+        count = candidate_count(enhanced_prompt, max_tokens, candidates)
+        filename, dry_run = None, None
+        if response is None and count > 1:
+            file_response, chosen = await AIService._generate_candidates(
+                cache_key, enhanced_prompt, model, temperature, max_tokens, prompt, count, auto_run
+            )
+            if chosen is not None:
+                filename, dry_run = chosen.filename, chosen.run
+        else:
+            # The answer is streamed into the file as it is generated; requests
+            # that join an identical one in flight get its answer instead
+            created: List[CommandResponse] = []
+            if response is None:
+                response = await ai_singleflight.do(
+                    cache_key,
+                    lambda: AIService._coalesce_completion(
+                        cache_key, model,
+                        lambda: AIService._stream_code(cache_key, enhanced_prompt, model, temperature, max_tokens,
+                                                       prompt, created)
+                    )
+                )
             
-            if code_blocks:
-                # Use the first code block found
-                cleaned_code = code_blocks[0].strip()
+            if created:
+                file_response = created[0]
             else:
-                # If no code blocks found with regex, manually remove markdown syntax
-                cleaned_code = cleaned_code.replace("```python", "").replace("```", "")
-        
-        # Create the file
-        from services.file_service import FileService, FILES_DIR
-        file_response = FileService.create_file(cleaned_code)
+                # If there was an error, return it
+                if response.status != 0:
+                    return response
+                
+                # Extract just the code part, without the model info line
+                ai_response = response.output.split("\n\n", 1)[1]
+                with span("ai.extract_code"):
+                    cleaned_code = extract_code(ai_response)
+                
+                # Create the file
+                file_response = await FileService.create_file(cleaned_code, prompt=prompt)
         
         # If file creation failed, return the error
         if file_response.status != 0:
-            return file_response
-        
-        # If auto_run is enabled, run the file
-        if auto_run:
+            return file_response         
+        if filename is None:
             # Extract the filename from the response
             import re
             filename_match = re.search(r"File created successfully: ([\w\.-]+)", file_response.output)
-            if filename_match:
-                filename = filename_match.group(1)
-                file_path = os.path.join(FILES_DIR, filename)
-                
-                # Check if the file contains input() calls (likely interactive)
-                with open(file_path, 'r') as f:
-                    file_content = f.read()
-                    is_interactive = 'input(' in file_content
-                
-                # Run the file
-                import subprocess
-                import sys
-                
-                try:
-                    # Create a message about running the file
-                    run_message = f"\n🚀 Automatically running the file...\n\n"
-                    
-                    # If the script is interactive, run it with --demo flag
-                    if is_interactive:
-                        run_message += "Detected interactive script, running in demo mode...\n\n"
-                        result = subprocess.run(
-                            [sys.executable, file_path, "--demo"],
-                            capture_output=True,
-                            text=True,
-                            timeout=10  # 10 second timeout
-                        )
-                    else:
-                        # Run the Python file normally
-                        result = subprocess.run(
-                            [sys.executable, file_path],
-                            capture_output=True,
-                            text=True,
-                            timeout=10  # 10 second timeout
-                        )
-                    
-                    # Format the output
-                    if result.returncode == 0:
-                        if result.stdout.strip():
-                            run_message += f"Output:\n{result.stdout}\n"
-                        else:
-                            run_message += "The script ran successfully with no output.\n"
-                    else:
-                        run_message += f"Error running the script:\n{result.stderr}\n"
-                    
-                    # Combine the file creation message with the run message
-                    return CommandResponse(
-                        output=file_response.output + run_message,
-                        status=0
-                    )
-                    
-                except subprocess.TimeoutExpired:
-                    # If the script times out, it might be waiting for input
-                    if is_interactive:
-                        return CommandResponse(
-                            output=file_response.output + 
-                                   "\n⚠️ The script appears to be interactive and is waiting for user input.\n" +
-                                   f"To run it manually, use: python {file_path}\n" +
-                                   "Or view the code with: file:view " + filename,
-                            status=0
-                        )
-                    else:
-                        return CommandResponse(
-                            output=file_response.output + "\n⚠️ Script execution timed out after 10 seconds.",
-                            status=0
-                        )
-                except Exception as e:
-                    return CommandResponse(
-                        output=file_response.output + f"\n⚠️ Error running the script: {str(e)}",
-                        status=0
-                    )
+            filename = filename_match.group(1) if filename_match else None
+        
+        # If auto_run is enabled, run the file
+        if auto_run and filename:
+            return await AIService._run_saved(file_response, filename, dry_run)
         
         # If auto_run is disabled or we couldn't extract the filename, just return the file creation response
         return file_response 
\ No newline at end of file
@@ -0,0 +1,174 @@
+import hashlib
+import importlib.util
+import logging
+import marshal
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from core.config import ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger("terminal-api")
+
+
+@dataclass
+class CodeArtifact:
+    """Compiled code and static facts about one version of a Python file"""
+    content_hash: str
+    syntax_error: Optional[str] = None
+    is_interactive: bool = False
+    has_demo: bool = False
+    # Marshalled code object on disk, None if the code doesn't compile
+    code_path: Optional[str] = None
+
+
+class ArtifactCache:
+    """Content-hash keyed cache of compiled code and validation results"""
+
+    def __init__(self, directory: str, max_entries: int = 512):
+        """
+        Args:
+            directory: Where marshalled code objects are stored
+            max_entries: Maximum number of artifacts kept in memory
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        # (content hash, file path) -> artifact
+        self._artifacts: "OrderedDict[Tuple[str, str], CodeArtifact]" = OrderedDict()
+        # (file path, mtime, size) -> content hash, so unchanged files are never re-read
+        self._stat_index: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+
+    @staticmethod
+    def hash_content(content: str) -> str:
+        """Return the SHA-256 hex digest of the source"""
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _remember(self, cache: OrderedDict, key, value) -> None:
+        """Insert into one of the LRU maps, evicting the oldest entries"""
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+    def _disk_path(self, content_hash: str, file_path: str) -> str:
+        # The code object embeds its file name and bytecode version, so both are part of the key
+        key = hashlib.sha256(
+            importlib.util.MAGIC_NUMBER + content_hash.encode() + file_path.encode("utf-8")
+        ).hexdigest()
+        return os.path.join(self.directory, key + ".bin")
+
+    def _load(self, disk_path: str, content_hash: str) -> Optional[CodeArtifact]:
+        """Load an artifact previously written by _store"""
+        try:
+            with open(disk_path, "rb") as f:
+                stored_hash, syntax_error, is_interactive, has_demo = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if stored_hash != content_hash:
+            return None
+        return CodeArtifact(
+            content_hash=content_hash,
+            syntax_error=syntax_error,
+            is_interactive=is_interactive,
+            has_demo=has_demo,
+            code_path=disk_path if syntax_error is None else None,
+        )
+
+    def _store(self, disk_path: str, artifact: CodeArtifact, code) -> None:
+        """Write the facts header followed by the code object"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{disk_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                marshal.dump((artifact.content_hash, artifact.syntax_error,
+                              artifact.is_interactive, artifact.has_demo), f)
+                if code is not None:
+                    marshal.dump(code, f)
+            os.replace(tmp_path, disk_path)
+        except OSError as e:
+            logger.warning(f"Could not store compiled artifact: {str(e)}")
+            artifact.code_path = None
+
+    def analyze(self, content: str, file_path: str) -> CodeArtifact:
+        """
+        Compile and inspect Python source, reusing earlier results for identical content
+
+        Args:
+            content: The Python source
+            file_path: Path the source is (or will be) saved at
+
+        Returns:
+            CodeArtifact for the source
+        """
+        content_hash = self.hash_content(content)
+        key = (content_hash, file_path)
+
+        artifact = self._artifacts.get(key)
+        if artifact is not None:
+            self._artifacts.move_to_end(key)
+            return artifact
+
+        disk_path = self._disk_path(content_hash, file_path)
+        artifact = self._load(disk_path, content_hash)
+
+        if artifact is None:
+            code = None
+            syntax_error = None
+            try:
+                code = compile(content, file_path, "exec")
+            except SyntaxError as e:
+                syntax_error = str(e)
+
+            artifact = CodeArtifact(
+                content_hash=content_hash,
+                syntax_error=syntax_error,
+                is_interactive="input(" in content,
+                has_demo="--demo" in content,
+                code_path=disk_path if code is not None else None,
+            )
+            self._store(disk_path, artifact, code)
+
+        self._remember(self._artifacts, key, artifact)
+        return artifact
+
+    def for_file(self, file_path: str) -> CodeArtifact:
+        """
+        Return the artifact for a file on disk, reading it only if it changed
+
+        Args:
+            file_path: Path of the Python file
+
+        Returns:
+            CodeArtifact for the file's current content
+        """
+        st = os.stat(file_path)
+        stat_key = (file_path, st.st_mtime_ns, st.st_size)
+
+        content_hash = self._stat_index.get(stat_key)
+        if content_hash is not None:
+            artifact = self._artifacts.get((content_hash, file_path))
+            if artifact is not None:
+                self._artifacts.move_to_end((content_hash, file_path))
+                return artifact
+
+        with open(file_path, "r") as f:
+            content = f.read()
+
+        artifact = self.analyze(content, file_path)
+        self._remember(self._stat_index, stat_key, artifact.content_hash)
+        return artifact
+
+    def register_file(self, file_path: str, artifact: CodeArtifact) -> None:
+        """
+        Record that a file just written on disk holds the given artifact's content
+
+        Args:
+            file_path: Path of the written file
+            artifact: Artifact returned by analyze for the written content
+        """
+        st = os.stat(file_path)
+        self._remember(self._stat_index, (file_path, st.st_mtime_ns, st.st_size), artifact.content_hash)
+
+
+# Shared artifact cache for generated files
+artifact_cache = ArtifactCache(ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_MAX_ENTRIES)
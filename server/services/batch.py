@@ -0,0 +1,156 @@
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional
+from api.models import BatchCommand, BatchResult
+from core.config import BATCH_MAX_COMMANDS, BATCH_MAX_CONCURRENCY
+from services.session import TerminalSession
+from services.terminal import execute_terminal_command
+
+
+def prepare_batch(commands: List[BatchCommand], sequential: bool = False) -> Dict[str, List[str]]:
+    """
+    Assign ids and check a batch's dependencies
+
+    Args:
+        commands: The batch's commands; commands without an id get their index
+        sequential: Whether every command also waits for the one before it
+
+    Returns:
+        Mapping of command id to the ids it waits for
+
+    Raises:
+        ValueError: If the batch is too large, ids are duplicated, or the
+            dependencies name unknown commands or form a cycle
+    """
+    if not commands:
+        raise ValueError("The batch has no commands")
+    if len(commands) > BATCH_MAX_COMMANDS:
+        raise ValueError(f"A batch may have at most {BATCH_MAX_COMMANDS} commands")
+
+    ids = []
+    for index, command in enumerate(commands):
+        if command.id is None:
+            command.id = str(index)
+        ids.append(command.id)
+    if len(set(ids)) != len(ids):
+        raise ValueError("Command ids must be unique")
+
+    known = set(ids)
+    waits: Dict[str, List[str]] = {}
+    for index, command in enumerate(commands):
+        for dependency in command.depends_on:
+            if dependency not in known:
+                raise ValueError(f"Unknown dependency of {command.id}: {dependency}")
+        waits[command.id] = list(command.depends_on)
+        if sequential and index > 0:
+            waits[command.id].append(ids[index - 1])
+
+    # Every command must be reachable without a cycle (Kahn's algorithm)
+    remaining = {command_id: set(deps) for command_id, deps in waits.items()}
+    ready = [command_id for command_id, deps in remaining.items() if not deps]
+    resolved = 0
+    while ready:
+        finished = ready.pop()
+        resolved += 1
+        for command_id, deps in remaining.items():
+            if finished in deps:
+                deps.discard(finished)
+                if not deps:
+                    ready.append(command_id)
+    if resolved != len(ids):
+        raise ValueError("The batch's dependencies form a cycle")
+    return waits
+
+
+async def run_batch(commands: List[BatchCommand],
+                    sequential: bool = False,
+                    stop_on_error: bool = False,
+                    max_concurrency: Optional[int] = None,
+                    session: Optional[TerminalSession] = None) -> AsyncIterator[BatchResult]:
+    """
+    Run a batch of commands, yielding each result as soon as it completes
+
+    Commands run as soon as the commands they depend on have succeeded, at
+    most max_concurrency at a time, or one at a time in a session: its
+    commands share its working directory, environment and kernels, so each
+    must see what the one before it did. A command whose dependency failed is
+    skipped, as is every command not yet started once one fails when
+    stop_on_error is set.
+
+    Args:
+        commands: The batch's commands
+        sequential: Run the commands one after another in order
+        stop_on_error: Skip the rest of the batch after a failure
+        max_concurrency: Commands run at once, at most BATCH_MAX_CONCURRENCY; ignored with a session
+        session: Terminal session the commands run in, if any
+
+    Yields:
+        BatchResult for each command, in completion order
+
+    Raises:
+        ValueError: If the batch is invalid, before anything runs
+    """
+    waits = prepare_batch(commands, sequential)
+    limit = min(max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    if session is not None:
+        limit = 1
+    semaphore = asyncio.Semaphore(max(limit, 1))
+    finished = {command.id: asyncio.Event() for command in commands}
+    results: Dict[str, BatchResult] = {}
+    completed: asyncio.Queue = asyncio.Queue()
+    failed = False
+
+    def skip(index: int, command: BatchCommand, reason: str) -> BatchResult:
+        return BatchResult(index=index, id=command.id, command=command.command,
+                           output=f"Skipped: {reason}", status=1, skipped=True)
+
+    async def run(index: int, command: BatchCommand) -> None:
+        nonlocal failed
+        for dependency in waits[command.id]:
+            await finished[dependency].wait()
+
+        failed_dependency = next(
+            (d for d in command.depends_on if results[d].status != 0), None
+        )
+        if failed_dependency is not None:
+            result = skip(index, command, f"dependency {failed_dependency} failed")
+        else:
+            async with semaphore:
+                if stop_on_error and failed:
+                    result = skip(index, command, "an earlier command failed")
+                else:
+                    line = command.command.strip()
+                    if session is not None and line:
+                        session.history.append(line)
+                    started = time.monotonic()
+                    try:
+                        response = await execute_terminal_command(line, session)
+                        output, status = response.output, response.status
+                    except Exception as e:
+                        output, status = f"Error: {str(e)}", 1
+                    result = BatchResult(index=index, id=command.id, command=command.command,
+                                         output=output, status=status,
+                                         duration_ms=round((time.monotonic() - started) * 1000, 3))
+
+        if result.status != 0:
+            failed = True
+        results[command.id] = result
+        finished[command.id].set()
+        completed.put_nowait(result)
+
+    tasks = [asyncio.ensure_future(run(index, command)) for index, command in enumerate(commands)]
+    try:
+        for _ in commands:
+            yield await completed.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def execute_batch(commands: List[BatchCommand], **kwargs) -> List[BatchResult]:
+    """
+    Run a batch of commands and return every result in the batch's order, see run_batch
+    """
+    results = [result async for result in run_batch(commands, **kwargs)]
+    return sorted(results, key=lambda result: result.index)
+
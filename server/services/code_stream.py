@@ -0,0 +1,261 @@
+import io
+import tokenize
+from typing import List, Optional, Tuple
+
+FENCE = "```"
+
+# Keywords that continue the statement before them, so a line starting with one isn't a new statement
+CONTINUATIONS = ("else", "elif", "except", "finally")
+
+# Keywords starting the definition a decorator belongs to
+DEFINITIONS = ("def", "class", "async")
+
+# File name syntax errors are reported against, before the file has its final name
+SOURCE_NAME = "generated code"
+
+
+class CodeExtractor:
+    """
+    Extracts the Python code from a model's answer while it streams in
+
+    The answer is read line by line:
+    - An answer that opens with a ``` fence is the code in that block; the
+      text after the closing fence is ignored.
+    - In an answer that doesn't, a line starting with a fence opens the code
+      block, and the text before it was prose. If that block is never closed,
+      the code is the whole answer without its fence lines, as it was before.
+    - An answer without fences is all code.
+    """
+
+    def __init__(self):
+        # "start", "plain" (unfenced text), "fenced" (inside the code block) or "done"
+        self.state = "start"
+        self._partial = ""
+        # Lines of unfenced text and the fenced lines after them, kept in case the block is never closed
+        self._plain: List[str] = []
+        self._opened_late = False
+
+    @property
+    def done(self) -> bool:
+        """Whether the code block was closed, so the rest of the answer doesn't matter"""
+        return self.state == "done"
+
+    def feed(self, text: str) -> Tuple[bool, List[str]]:
+        """
+        Add the next piece of the answer
+
+        Returns:
+            Whether the code extracted so far turned out to be prose and must be
+            dropped, and the new lines of code (each ending with a newline)
+        """
+        self._partial += text
+        lines = self._partial.split("\n")
+        self._partial = lines.pop()
+        restart, code = False, []
+        for line in lines:
+            restart = self._line(line + "\n", code) or restart
+        if self.state == "fenced" and FENCE in self._partial:
+            # The closing fence often ends the answer without a newline; don't wait for one
+            line, self._partial = self._partial, ""
+            self._line(line, code)
+        return restart, code
+
+    def finish(self) -> Tuple[bool, List[str]]:
+        """
+        Flush the end of the answer, see feed
+
+        Returns the whole code again (with restart set) if a block opened after
+        prose was never closed.
+        """
+        restart, code = False, []
+        if self._partial:
+            line, self._partial = self._partial, ""
+            restart = self._line(line, code)
+        if self.state == "fenced" and self._opened_late:
+            return True, [line.replace(FENCE + "python", "").replace(FENCE, "") for line in self._plain]
+        return restart, code
+
+    def _line(self, line: str, code: List[str]) -> bool:
+        """Handle one line of the answer, adding its code to code; returns True if earlier code must be dropped"""
+        stripped = line.strip()
+        if self.state == "start":
+            if not stripped:
+                return False
+            if stripped.startswith(FENCE):
+                self.state = "fenced"
+                self._open(line, code)
+                return False
+            self.state = "plain"
+
+        if self.state == "plain":
+            if stripped.startswith(FENCE):
+                self.state = "fenced"
+                self._opened_late = True
+                self._plain.append(line)
+                code.clear()
+                self._open(line, code)
+                return True
+            self._plain.append(line)
+            code.append(line)
+        elif self.state == "fenced":
+            if self._opened_late:
+                self._plain.append(line)
+            end = line.find(FENCE)
+            if end < 0:
+                code.append(line)
+            else:
+                if line[:end].strip():
+                    code.append(line[:end] + "\n")
+                self.state = "done"
+        return False
+
+    def _open(self, line: str, code: List[str]) -> None:
+        """Handle the line with an opening fence, keeping any code after the language tag"""
+        rest = line.split(FENCE, 1)[1]
+        if rest.lstrip().startswith("python"):
+            rest = rest.lstrip()[len("python"):]
+        if FENCE in rest:
+            # A whole block on one line
+            self._line(rest, code)
+        elif rest.strip():
+            code.append(rest)
+
+
+class SyntaxChecker:
+    """
+    Checks Python code for syntax errors while it is still arriving
+
+    Each top-level statement is compiled as soon as the next one starts, so a
+    malformed answer is noticed long before it is complete. Statements are
+    compiled on their own, each once; the complete file is still compiled
+    when it is saved.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the code checked so far"""
+        self._chunk: List[str] = []
+        self._first_line = 1
+        # Whether the pending code is decorators still waiting for their definition
+        self._decorated = False
+        # Top-level statements that compiled
+        self.statements = 0
+        # The first syntax error found, if any
+        self.error: Optional[str] = None
+
+    def add(self, line: str) -> None:
+        """Add the next line of code, checking the statement it ends, if any"""
+        if self._chunk and self._starts_statement(line) and self._complete():
+            self._check()
+        self._chunk.append(line)
+        word = line.split(None, 1)[0] if line[:1].strip() else ""
+        if word.startswith("@"):
+            self._decorated = True
+        elif word in DEFINITIONS:
+            self._decorated = False
+
+    def _starts_statement(self, line: str) -> bool:
+        """Whether a line can start a new top-level statement"""
+        if not line[:1] or line[0] in " \t\r\n#":
+            return False
+        word = line.split(None, 1)[0].split(":", 1)[0]
+        if word in CONTINUATIONS:
+            return False
+        # A decorator belongs to the definition after it, however many lines it spans
+        return not self._decorated
+
+    def _complete(self) -> bool:
+        """Whether the pending code ends outside any bracket or string"""
+        readline = io.StringIO("".join(self._chunk)).readline
+        try:
+            for _ in tokenize.generate_tokens(readline):
+                pass
+        except tokenize.TokenError:
+            return False
+        except SyntaxError:
+            # Inconsistent indentation, which compiling reports
+            pass
+        return True
+
+    def _check(self) -> None:
+        """Compile the pending statement and start the next one"""
+        source = "".join(self._chunk)
+        has_code = any(line.strip() and not line.lstrip().startswith("#") for line in self._chunk)
+        try:
+            # Padded so that errors report the line number in the whole file
+            compile("\n" * (self._first_line - 1) + source, SOURCE_NAME, "exec", dont_inherit=True)
+        except SyntaxError as e:
+            if self.error is None:
+                self.error = str(e)
+        else:
+            if has_code:
+                self.statements += 1
+        self._first_line += len(self._chunk)
+        self._chunk = []
+
+
+def extract_code(text: str) -> str:
+    """Return the Python code in a complete answer, see CodeExtractor"""
+    extractor = CodeExtractor()
+    _, code = extractor.feed(text)
+    restart, rest = extractor.finish()
+    return "".join(rest if restart else code + rest)
+
+
+class CodeStream:
+    """
+    Feeds a streamed answer through a CodeExtractor and a SyntaxChecker into
+    a writer (with write(line) and reset() methods), e.g. a StagedFile
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.extractor = CodeExtractor()
+        self.checker = SyntaxChecker()
+        self._lines: List[str] = []
+        self._started = False
+
+    @property
+    def done(self) -> bool:
+        """Whether the code is complete, see CodeExtractor.done"""
+        return self.extractor.done
+
+    @property
+    def malformed(self) -> Optional[str]:
+        """
+        The syntax error of code that is clearly malformed, else None
+
+        A syntax error in unfenced text only counts once part of it compiled,
+        as it may be prose before a code block that is yet to come.
+        """
+        error = self.checker.error
+        if error and (self.extractor.state in ("fenced", "done") or self.checker.statements):
+            return error
+        return None
+
+    def feed(self, text: str) -> None:
+        """Add the next piece of the answer"""
+        self._apply(*self.extractor.feed(text))
+
+    def finish(self) -> str:
+        """Flush the end of the answer and return the code"""
+        self._apply(*self.extractor.finish())
+        return "".join(self._lines)
+
+    def _apply(self, restart: bool, lines: List[str]) -> None:
+        if restart:
+            self._lines = []
+            self._started = False
+            self.writer.reset()
+            self.checker.reset()
+        for line in lines:
+            self._lines.append(line)
+            self.writer.write(line)
+            # The checker sees the code as it is saved, without leading whitespace
+            if self._started:
+                self.checker.add(line)
+            elif line.strip():
+                self._started = True
+                self.checker.add(line.lstrip())
@@ -0,0 +1,337 @@
+import re
+import shlex
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from api.models import CommandResponse
+from services.metrics import observe_command, span
+
+# Handler receiving the parsed arguments and the terminal session (or None)
+Handler = Callable[["ParsedArgs", Any], Awaitable[CommandResponse]]
+# Handler yielding output events followed by a final done event
+StreamHandler = Callable[["ParsedArgs", Any], AsyncIterator[Dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class Option:
+    """A --flag or --name value option"""
+    name: str
+    # Converts the value, e.g. int; ignored for flags
+    type: Callable[[str], Any] = str
+    flag: bool = False
+    # Key in ParsedArgs.options, defaults to the name without dashes
+    dest: Optional[str] = None
+    choices: Optional[Tuple[str, ...]] = None
+
+    @property
+    def key(self) -> str:
+        return self.dest or self.name.lstrip("-").replace("-", "_")
+
+
+@dataclass(frozen=True)
+class ArgSchema:
+    """How the text after a command name is parsed"""
+    options: Tuple[Option, ...] = ()
+    # Names of positional arguments, in order
+    positional: Tuple[str, ...] = ()
+    # Number of positional arguments that must be given
+    required: int = 0
+    # Name under which any further positional arguments are collected as a list
+    rest: Optional[str] = None
+    # Free text commands (prompts, code) keep everything after the positionals
+    # that is not an option verbatim in ParsedArgs.text, instead of splitting it
+    # like a shell would
+    free_text: bool = False
+    # Options that may not be combined
+    exclusive: bool = False
+
+
+@dataclass
+class ParsedArgs:
+    """A command's arguments, parsed once by the dispatcher"""
+    command: str
+    name: str
+    raw: str
+    positional: Dict[str, Any] = field(default_factory=dict)
+    options: Dict[str, Any] = field(default_factory=dict)
+    text: str = ""
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return a positional argument or option"""
+        if key in self.positional:
+            return self.positional[key]
+        return self.options.get(key, default)
+
+
+class _CompiledSchema:
+    """An ArgSchema with its lookups prepared at registration time"""
+
+    def __init__(self, schema: ArgSchema):
+        self.schema = schema
+        self.options = {option.name: option for option in schema.options}
+        self.defaults = {option.key: (False if option.flag else None) for option in schema.options}
+        flags = [re.escape(option.name) for option in schema.options if option.flag]
+        # Flags in free text are whole words anywhere in the text
+        self.flag_pattern = re.compile(rf"(?<!\S)({'|'.join(flags)})(?!\S)") if flags else None
+        valued = [re.escape(option.name) for option in schema.options if not option.flag]
+        # Other options in free text are followed by their value, the next word
+        self.value_pattern = re.compile(rf"(?<!\S)({'|'.join(valued)})\s+(\S+)") if valued else None
+
+    def _convert(self, option: Option, value: str) -> Any:
+        """Check and convert an option's value"""
+        if option.choices is not None and value not in option.choices:
+            raise ValueError(f"Invalid value for {option.name}: {value}")
+        try:
+            return option.type(value)
+        except ValueError:
+            raise ValueError(f"Invalid value for {option.name}: {value}")
+
+    def parse(self, raw: str) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+        """
+        Parse the argument text
+
+        Returns:
+            Tuple of (positional arguments, options, free text)
+
+        Raises:
+            ValueError: If the arguments don't match the schema
+        """
+        schema = self.schema
+        options = dict(self.defaults)
+        positional: List[str] = []
+        text = ""
+
+        if schema.free_text:
+            if self.flag_pattern is not None:
+                for match in self.flag_pattern.finditer(raw):
+                    options[self.options[match.group(1)].key] = True
+                raw = self.flag_pattern.sub("", raw)
+            if self.value_pattern is not None:
+                for match in self.value_pattern.finditer(raw):
+                    option = self.options[match.group(1)]
+                    options[option.key] = self._convert(option, match.group(2))
+                raw = self.value_pattern.sub("", raw)
+            # Leading positionals are whitespace separated words, the rest is kept as is
+            text = raw.strip()
+            for _ in schema.positional:
+                if not text:
+                    break
+                words = text.split(None, 1)
+                positional.append(words[0])
+                text = words[1].strip() if len(words) > 1 else ""
+        else:
+            tokens = shlex.split(raw)
+            i = 0
+            while i < len(tokens):
+                token = tokens[i]
+                option = self.options.get(token)
+                if option is None:
+                    if token.startswith("--") and len(token) > 2:
+                        raise ValueError(f"Unknown option: {token}")
+                    positional.append(token)
+                elif option.flag:
+                    options[option.key] = True
+                else:
+                    if i + 1 >= len(tokens):
+                        raise ValueError(f"Missing value for {token}")
+                    options[option.key] = self._convert(option, tokens[i + 1])
+                    i += 1
+                i += 1
+            if len(positional) > len(schema.positional) and schema.rest is None:
+                raise ValueError(f"Unexpected argument: {positional[len(schema.positional)]}")
+
+        if len(positional) < schema.required:
+            raise ValueError(f"Missing {schema.positional[len(positional)]}")
+        if schema.exclusive:
+            given = [o.name for o in schema.options if options[o.key] not in (None, False)]
+            if len(given) > 1:
+                raise ValueError(f"Use only one of {', '.join(given)}")
+        named: Dict[str, Any] = dict(zip(schema.positional, positional))
+        if schema.rest is not None:
+            named[schema.rest] = positional[len(schema.positional):]
+        return named, options, text
+
+
+@dataclass
+class Command:
+    """A registered command"""
+    name: str
+    handler: Handler
+    usage: str = ""
+    # Whether the name is a prefix the arguments follow directly (ai:Hello),
+    # rather than a word followed by whitespace (file:list txt)
+    prefix: bool = False
+    # Whether the arguments may start with a longer command's suffix after whitespace,
+    # which then runs that command ("ai: code: ..." runs ai:code:)
+    nested: bool = False
+    stream: Optional[StreamHandler] = None
+    session_required: bool = False
+    schema: _CompiledSchema = None
+
+
+class _TrieNode:
+    __slots__ = ("children", "command")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.command: Optional[Command] = None
+
+
+class CommandRegistry:
+    """Routes command lines to registered handlers by longest matching name"""
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._commands: Dict[str, Command] = {}
+        self.fallback: Optional[Command] = None
+
+    def register(self,
+                 name: str,
+                 handler: Handler,
+                 schema: ArgSchema = ArgSchema(),
+                 usage: str = "",
+                 prefix: bool = False,
+                 stream: Optional[StreamHandler] = None,
+                 session_required: bool = False,
+                 nested: bool = False) -> Command:
+        """
+        Register a command
+
+        Args:
+            name: Command name, e.g. "file:list" or "ai:"
+            handler: Async handler returning a CommandResponse
+            schema: How the arguments are parsed
+            usage: Usage text shown with argument errors
+            prefix: Arguments follow the name directly instead of after whitespace
+            stream: Optional handler streaming events instead of returning at the end
+            session_required: Only available in a terminal session
+            nested: Whitespace after the name may precede a longer command's suffix, see Command
+
+        Returns:
+            The registered command
+        """
+        command = Command(name=name, handler=handler, usage=usage, prefix=prefix, nested=nested, stream=stream,
+                          session_required=session_required, schema=_CompiledSchema(schema))
+        node = self._root
+        for char in name:
+            node = node.children.setdefault(char, _TrieNode())
+        node.command = command
+        self._commands[name] = command
+        return command
+
+    def command(self, name: str, **kwargs) -> Callable[[Handler], Handler]:
+        """Decorator registering the decorated function as a command's handler, see register"""
+        def decorator(handler: Handler) -> Handler:
+            self.register(name, handler, **kwargs)
+            return handler
+        return decorator
+
+    def set_fallback(self, handler: Handler, schema: ArgSchema = ArgSchema(), usage: str = "",
+                     stream: Optional[StreamHandler] = None) -> Command:
+        """Register the handler for command lines matching no name, given the whole line"""
+        self.fallback = Command(name="", handler=handler, usage=usage, stream=stream,
+                                schema=_CompiledSchema(schema))
+        return self.fallback
+
+    def resolve(self, line: str) -> Tuple[Optional[Command], str]:
+        """
+        Find the command for a line
+
+        Args:
+            line: The command line
+
+        Returns:
+            Tuple of (command or None, argument text after the name)
+        """
+        matches: List[Command] = []
+        node = self._root
+        for char in line:
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.command is not None:
+                matches.append(node.command)
+
+        for command in reversed(matches):
+            rest = line[len(command.name):]
+            if command.prefix or not rest or rest[0].isspace():
+                if command.nested and rest[:1].isspace():
+                    inner, inner_rest = self.resolve(command.name + rest.lstrip())
+                    if inner is not command and inner is not self.fallback:
+                        return inner, inner_rest
+                return command, rest
+        return self.fallback, line
+
+    def _error(self, command: Command, message: str) -> CommandResponse:
+        output = f"Error: {message}"
+        if command.usage:
+            output += f"\n{command.usage}"
+        return CommandResponse(output=output, status=1)
+
+    @staticmethod
+    def _metric_name(command: Optional[Command]) -> str:
+        """Name a command is counted under; shell commands are counted together"""
+        if command is None:
+            return "unknown"
+        return command.name or "shell"
+
+    def _check(self, line: str, session: Any) -> Tuple[Command, Optional[ParsedArgs], Optional[CommandResponse]]:
+        command, raw = self.resolve(line)
+        if command is None:
+            return None, None, CommandResponse(output=f"Unknown command: {line}", status=1)
+        if command.session_required and session is None:
+            name = command.name.rstrip(":") or line.split(" ", 1)[0]
+            return command, None, CommandResponse(
+                output=f"{name}: only available in a terminal session (connect to /api/terminal/ws)",
+                status=1
+            )
+        try:
+            positional, options, text = command.schema.parse(raw)
+        except ValueError as e:
+            return command, None, self._error(command, str(e))
+        return command, ParsedArgs(command=line, name=command.name, raw=raw, positional=positional,
+                                   options=options, text=text), None
+
+    async def execute(self, line: str, session: Any = None) -> CommandResponse:
+        """
+        Run a command line and return its result
+
+        Args:
+            line: The command line
+            session: Terminal session the command runs in, if any
+
+        Returns:
+            CommandResponse with output and status
+        """
+        started = time.perf_counter()
+        with span("dispatch"):
+            command, args, error = self._check(line, session)
+        response = error or await command.handler(args, session)
+        observe_command(self._metric_name(command), response.status, time.perf_counter() - started)
+        return response
+
+    async def stream(self, line: str, session: Any = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run a command line, yielding output events and a final done event
+
+        Commands without a stream handler send their whole output as one event.
+
+        Args:
+            line: The command line
+            session: Terminal session the command runs in, if any
+        """
+        started = time.perf_counter()
+        with span("dispatch"):
+            command, args, error = self._check(line, session)
+        if error is None and command.stream is not None:
+            async for event in command.stream(args, session):
+                if event["type"] == "done":
+                    observe_command(self._metric_name(command), event.get("status", 0),
+                                    time.perf_counter() - started)
+                yield event
+            return
+
+        response = error or await command.handler(args, session)
+        observe_command(self._metric_name(command), response.status, time.perf_counter() - started)
+        yield {"type": "output", "data": response.output}
+        yield {"type": "done", "status": response.status}
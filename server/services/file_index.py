@@ -0,0 +1,184 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("terminal-api")
+
+# Columns file listings may be sorted by
+SORT_COLUMNS = {"name": "name", "size": "size", "mtime": "mtime", "modified": "mtime"}
+
+# Seconds after which a listing rescans the directory even if no file was added or removed,
+# to pick up files edited in place
+RESCAN_INTERVAL = 60
+
+
+class FileIndex:
+    """
+    SQLite index of the generated files directory
+
+    The methods block; FileService calls them through asyncio.to_thread.
+    """
+
+    def __init__(self, directory: str, path: str, rescan_interval: float = RESCAN_INTERVAL):
+        """
+        Args:
+            directory: The directory being indexed
+            path: SQLite file holding the index
+            rescan_interval: Seconds after which sync rescans an unchanged directory
+        """
+        self.directory = directory
+        self.path = path
+        self.rescan_interval = rescan_interval
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # Modification time of the directory as of the last scan, and when that scan was
+        self._version: Optional[int] = None
+        self._scanned_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the index, creating the schema on first use"""
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "  name TEXT PRIMARY KEY,"
+                "  size INTEGER NOT NULL,"
+                "  mtime REAL NOT NULL,"
+                "  extension TEXT NOT NULL,"
+                "  content_hash TEXT,"
+                "  prompt TEXT"
+                ");"
+                "CREATE INDEX IF NOT EXISTS files_mtime ON files (mtime);"
+                "CREATE INDEX IF NOT EXISTS files_size ON files (size);"
+                "CREATE INDEX IF NOT EXISTS files_extension ON files (extension);"
+            )
+            self._db = db
+        return self._db
+
+    def _directory_version(self) -> int:
+        """Return a token that changes whenever an entry is added to or removed from the directory"""
+        return os.stat(self.directory).st_mtime_ns
+
+    def sync(self, force: bool = False) -> None:
+        """
+        Reconcile the index with the directory
+
+        Only rescans when a file was added, removed or renamed outside of
+        record (which changes the directory), when rescan_interval has passed
+        since the last scan, or when forced; so it is cheap to call before
+        every listing. A rescan compares every file's size and modification
+        time with its row, which also picks up files edited in place, and
+        writes only the rows that changed.
+        """
+        with self._lock:
+            version = self._directory_version()
+            now = time.monotonic()
+            if not force and version == self._version and now - self._scanned_at < self.rescan_interval:
+                return
+            db = self._connect()
+            known = {
+                name: (size, mtime)
+                for name, size, mtime in db.execute("SELECT name, size, mtime FROM files")
+            }
+            seen = set()
+            changed = 0
+            for entry in os.scandir(self.directory):
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                seen.add(entry.name)
+                st = entry.stat()
+                if known.get(entry.name) != (st.st_size, st.st_mtime):
+                    changed += 1
+                    db.execute(
+                        "INSERT INTO files (name, size, mtime, extension) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, "
+                        "content_hash = NULL",
+                        (entry.name, st.st_size, st.st_mtime, os.path.splitext(entry.name)[1])
+                    )
+
+            removed = [(name,) for name in known if name not in seen]
+            # Taken before the scan, so changes made during it are found next time
+            self._version, self._scanned_at = version, now
+            if not changed and not removed:
+                return
+            db.executemany("DELETE FROM files WHERE name = ?", removed)
+            db.commit()
+            logger.info(f"Reindexed {self.directory} ({changed} changed, {len(removed)} removed)")
+
+    def record(self, name: str, content_hash: Optional[str] = None, prompt: Optional[str] = None) -> None:
+        """
+        Add or update a file that was just written
+
+        Args:
+            name: File name inside the directory
+            content_hash: Hash of the file content
+            prompt: The prompt the file was generated from, if any
+        """
+        st = os.stat(os.path.join(self.directory, name))
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO files (name, size, mtime, extension, content_hash, prompt) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (name, st.st_size, st.st_mtime, os.path.splitext(name)[1], content_hash, prompt)
+            )
+            db.commit()
+            if self._version is not None:
+                # The write changed the directory, but the index already reflects it
+                self._version = self._directory_version()
+
+    def query(self,
+              extension: Optional[str] = None,
+              match: Optional[str] = None,
+              sort: str = "name",
+              descending: bool = False,
+              limit: int = 50,
+              offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Return one page of indexed files
+
+        Args:
+            extension: Only files whose name ends with this
+            match: Only files whose name or prompt contains this text
+            sort: One of SORT_COLUMNS
+            descending: Reverse the sort order
+            limit: Maximum number of files returned
+            offset: Number of files to skip
+
+        Returns:
+            Tuple of (files on the page, total number of matching files)
+        """
+        self.sync()
+
+        conditions = []
+        params: List[Any] = []
+        if extension:
+            conditions.append("name LIKE ? ESCAPE '\\'")
+            params.append("%" + _escape_like(extension))
+        if match:
+            conditions.append("(name LIKE ? ESCAPE '\\' OR prompt LIKE ? ESCAPE '\\')")
+            pattern = "%" + _escape_like(match) + "%"
+            params.extend([pattern, pattern])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = f"{SORT_COLUMNS[sort]} {'DESC' if descending else 'ASC'}, name ASC"
+
+        with self._lock:
+            db = self._connect()
+            total = db.execute(f"SELECT COUNT(*) FROM files {where}", params).fetchone()[0]
+            rows = db.execute(
+                f"SELECT name, size, mtime, extension, content_hash, prompt FROM files {where} "
+                f"ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+
+        columns = ("name", "size", "mtime", "extension", "content_hash", "prompt")
+        return [dict(zip(columns, row)) for row in rows], total
+
+
+def _escape_like(text: str) -> str:
+    """Escape LIKE wildcards so user input matches literally"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
@@ -1,7 +1,17 @@
 import os
+import uuid
+import asyncio
+import codecs
 import logging
-from typing import Optional
+from datetime import datetime
+from typing import AsyncIterator, Optional, Tuple
 from api.models import CommandResponse
+from core.config import SCRIPT_TIMEOUT, FILE_INDEX_PATH, VIEW_MAX_BYTES, VIEW_DEFAULT_LINES
+from services.worker_pool import run_python_file
+from services.artifact_cache import artifact_cache
+from services.file_index import FileIndex, SORT_COLUMNS
+from services.line_index import load_line_index, read_bytes, iter_bytes
+from services.metrics import span
 
 logger = logging.getLogger("terminal-api")
 
@@ -10,6 +20,60 @@ FILES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "generated_
 os.makedirs(FILES_DIR, exist_ok=True)
 logger.info(f"Files directory: {FILES_DIR}")
 
+# Extensions file:view accepts without appending .py
+VIEWABLE_EXTENSIONS = ['.py', '.txt', '.md', '.json', '.csv']
+
+# Metadata index of the generated files, kept current by create_file
+file_index = FileIndex(FILES_DIR, FILE_INDEX_PATH)
+
+class StagedFile:
+    """
+    A file written line by line while its content is still being generated
+    
+    It is kept under a hidden name in the files directory until
+    FileService.create_file moves it into place. The content is written the
+    way create_file saves it, without leading or trailing whitespace.
+    """
+    
+    def __init__(self):
+        self.path = os.path.join(FILES_DIR, f".staged-{uuid.uuid4().hex}.tmp")
+        self._file = open(self.path, "w")
+        self._started = False
+        # Whitespace held back until more content follows it
+        self._held = ""
+    
+    def write(self, line: str) -> None:
+        """Append a line of content"""
+        body = line.rstrip()
+        if not body:
+            if self._started:
+                self._held += line
+            return
+        if not self._started:
+            body = body.lstrip()
+            self._started = True
+        self._file.write(self._held + body)
+        self._held = line[len(line.rstrip()):]
+    
+    def reset(self) -> None:
+        """Throw away the content written so far"""
+        self._file.seek(0)
+        self._file.truncate()
+        self._started = False
+        self._held = ""
+    
+    def close(self) -> None:
+        """Finish writing, dropping the trailing whitespace"""
+        self._file.close()
+    
+    def discard(self) -> None:
+        """Close and delete the file"""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
 class FileService:
     """Service for managing files"""
     
@@ -17,7 +81,45 @@ class FileService:
     FILES_DIR = FILES_DIR
     
     @staticmethod
-    def create_file(content: str, filename: Optional[str] = None, extension: str = ".py") -> CommandResponse:
+    def target_path(content: str,
+                    filename: Optional[str] = None,
+                    extension: str = ".py") -> Tuple[str, str]:
+        """
+        Work out where create_file saves content
+        
+        Args:
+            content: The content, without leading or trailing whitespace
+            filename: Optional filename (without extension)
+            extension: File extension (default: .py)
+            
+        Returns:
+            Tuple of (filename with extension, full path)
+        """
+        # Extract filename from content if not provided
+        if not filename:
+            # Look for a filename comment in the first 5 lines
+            lines = content.split('\n')[:5]
+            for line in lines:
+                if line.startswith("# filename:") or line.startswith("#filename:"):
+                    filename = line.split(":", 1)[1].strip()
+                    break
+        
+        # If still no filename, generate a random one
+        if not filename:
+            filename = f"ai_generated_{uuid.uuid4().hex[:8]}"
+        
+        # Ensure the filename has the correct extension
+        if not filename.endswith(extension):
+            filename += extension
+        
+        return filename, os.path.join(FILES_DIR, filename)
+    
+    @staticmethod
+    async def create_file(content: str,
+                    filename: Optional[str] = None,
+                    extension: str = ".py",
+                    prompt: Optional[str] = None,
+                    staged: Optional[StagedFile] = None) -> CommandResponse:
         """
         Create a file with the given content
         
@@ -25,6 +127,9 @@ class FileService:
             content: The content to write to the file
             filename: Optional filename (without extension)
             extension: File extension (default: .py)
+            prompt: The prompt the content was generated from, if any
+            staged: The content already written to a staged file, which is moved
+                into place instead of writing the content again
             
         Returns:
             CommandResponse with the result
@@ -33,45 +138,45 @@ class FileService:
             # Clean up the content - remove any leading/trailing whitespace
             content = content.strip()
             
+            filename, file_path = FileService.target_path(content, filename, extension)
+            
             # If it's a Python file, validate the syntax
+            artifact = None
             if extension == ".py":
-                try:
-                    # Try to compile the code to check for syntax errors
-                    compile(content, "<string>", "exec")
-                    logger.info("Python code validation successful")
-                except SyntaxError as e:
-                    logger.warning(f"Python syntax error in generated code: {str(e)}")
+                # Compiles the code (or reuses an earlier compile of the same content)
+                with span("file.compile"):
+                    artifact = artifact_cache.analyze(content, file_path)
+                if artifact.syntax_error:
+                    logger.warning(f"Python syntax error in generated code: {artifact.syntax_error}")
+                    if staged is not None:
+                        staged.discard()
                     # We'll still create the file, but warn the user
                     return CommandResponse(
-                        output=f"⚠️ Warning: The generated Python code contains syntax errors: {str(e)}\n"
+                        output=f"⚠️ Warning: The generated Python code contains syntax errors: {artifact.syntax_error}\n"
                                f"The file will be created, but may not run correctly.",
                         status=1
                     )
-            
-            # Extract filename from content if not provided
-            if not filename:
-                # Look for a filename comment in the first 5 lines
-                lines = content.split('\n')[:5]
-                for line in lines:
-                    if line.startswith("# filename:") or line.startswith("#filename:"):
-                        filename = line.split(":", 1)[1].strip()
-                        break
-            
-            # If still no filename, generate a random one
-            if not filename:
-                import uuid
-                filename = f"ai_generated_{uuid.uuid4().hex[:8]}"
-            
-            # Ensure the filename has the correct extension
-            if not filename.endswith(extension):
-                filename += extension
-            
-            # Create the full path
-            file_path = os.path.join(FILES_DIR, filename)
+                logger.info("Python code validation successful")
             
             # Write the content to the file
-            with open(file_path, 'w') as f:
-                f.write(content)
+            with span("file.write"):
+                if staged is not None:
+                    staged.close()
+                    os.replace(staged.path, file_path)
+                else:
+                    with open(file_path, 'w') as f:
+                        f.write(content)
+            
+            if artifact is not None:
+                artifact_cache.register_file(file_path, artifact)
+            
+            try:
+                content_hash = artifact.content_hash if artifact else artifact_cache.hash_content(content)
+                with span("file.index"):
+                    await asyncio.to_thread(file_index.record, filename, content_hash=content_hash, prompt=prompt)
+            except Exception as e:
+                # The next listing reindexes the directory, so this isn't fatal
+                logger.warning(f"Could not update file index: {str(e)}")
             
             logger.info(f"Created file: {file_path}")
             
@@ -91,39 +196,62 @@ class FileService:
             
         except Exception as e:
             logger.error(f"Error creating file: {str(e)}", exc_info=True)
+            if staged is not None:
+                staged.discard()
             return CommandResponse(
                 output=f"❌ Error creating file: {str(e)}",
                 status=1
             )
     
     @staticmethod
-    def list_files(extension: Optional[str] = None) -> CommandResponse:
+    async def list_files(extension: Optional[str] = None,
+                   page: int = 1,
+                   per_page: int = 50,
+                   sort: str = "name",
+                   descending: bool = False,
+                   match: Optional[str] = None) -> CommandResponse:
         """
-        List all files in the generated files directory
+        List files in the generated files directory
         
         Args:
             extension: Optional file extension filter
+            page: Page number, starting at 1
+            per_page: Number of files per page
+            sort: Sort key (name, size or mtime)
+            descending: Reverse the sort order
+            match: Only files whose name or originating prompt contains this text
             
         Returns:
             CommandResponse with the list of files
         """
         try:
-            files = os.listdir(FILES_DIR)
+            if sort not in SORT_COLUMNS:
+                return CommandResponse(
+                    output=f"Error: Unknown sort key: {sort}. Use one of: name, size, mtime",
+                    status=1
+                )
+            page = max(page, 1)
+            per_page = max(per_page, 1)
             
-            if extension:
-                files = [f for f in files if f.endswith(extension)]
+            files, total = await asyncio.to_thread(
+                file_index.query,
+                extension=extension,
+                match=match,
+                sort=sort,
+                descending=descending,
+                limit=per_page,
+                offset=(page - 1) * per_page
+            )
             
-            if not files:
+            if not total:
                 return CommandResponse(
                     output="No files found.",
                     status=0
                 )
             
-            output = "📁 Generated Files:\n\n"
-            for i, file in enumerate(files, 1):
-                file_path = os.path.join(FILES_DIR, file)
-                size = os.path.getsize(file_path)
-                modified = os.path.getmtime(file_path)
+            lines = ["📁 Generated Files:", ""]
+            for i, file in enumerate(files, (page - 1) * per_page + 1):
+                size = file["size"]
                 
                 # Format the size
                 if size < 1024:
@@ -134,13 +262,17 @@ class FileService:
                     size_str = f"{size/(1024*1024):.1f} MB"
                 
                 # Format the modified time
-                from datetime import datetime
-                modified_str = datetime.fromtimestamp(modified).strftime("%Y-%m-%d %H:%M:%S")
+                modified_str = datetime.fromtimestamp(file["mtime"]).strftime("%Y-%m-%d %H:%M:%S")
                 
-                output += f"{i}. {file} ({size_str}, modified: {modified_str})\n"
+                lines.append(f"{i}. {file['name']} ({size_str}, modified: {modified_str})")
+            
+            pages = (total + per_page - 1) // per_page
+            if pages > 1:
+                lines.append("")
+                lines.append(f"Page {page} of {pages} ({total} files). Use --page N to see more.")
             
             return CommandResponse(
-                output=output,
+                output="\n".join(lines) + "\n",
                 status=0
             )
             
@@ -152,7 +284,161 @@ class FileService:
             )
     
     @staticmethod
-    def run_file(filename: str, demo_mode: bool = False) -> CommandResponse:
+    def _view_path(filename: str) -> Tuple[str, str]:
+        """
+        Resolve the name given to file:view to a path in the files directory
+        
+        Args:
+            filename: The requested file name
+            
+        Returns:
+            Tuple of (filename with extension, full path)
+        """
+        # Ensure the filename has the correct extension if not provided
+        if not any(filename.endswith(ext) for ext in VIEWABLE_EXTENSIONS):
+            filename += '.py'  # Default to Python extension
+        return filename, os.path.join(FILES_DIR, filename)
+    
+    @staticmethod
+    async def _view_span(file_path: str,
+                         lines: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                         byte_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                         head: Optional[int] = None,
+                         tail: Optional[int] = None) -> Tuple[int, int, str]:
+        """
+        Work out which bytes of a file a view covers
+        
+        Args:
+            file_path: The file being viewed
+            lines, byte_range, head, tail: The requested window, see view_file
+            
+        Returns:
+            Tuple of (start offset, end offset, description of the range or "" for the whole file)
+        """
+        size = os.path.getsize(file_path)
+        
+        if byte_range is not None:
+            start = min(max(byte_range[0] or 0, 0), size)
+            end = size if byte_range[1] is None else min(max(byte_range[1], start), size)
+            return start, end, f"bytes {start}-{end} of {size}"
+        
+        if lines is None and head is None and tail is None:
+            if size <= VIEW_MAX_BYTES:
+                return 0, size, ""
+            head = VIEW_DEFAULT_LINES
+        
+        # Line offsets are computed once per file version (off the event loop), so any window is cheap afterwards
+        index = await load_line_index(file_path)
+        total = index.line_count
+        if head is not None:
+            first, last = 0, head
+        elif tail is not None:
+            first, last = max(total - tail, 0), total
+        else:
+            first = max((lines[0] or 1) - 1, 0)
+            last = total if lines[1] is None else lines[1]
+        
+        start, end = index.byte_span(first, last)
+        if start == end:
+            return start, end, f"no lines in range, file has {total} lines"
+        return start, end, f"lines {first + 1}-{min(last, total)} of {total}"
+    
+    @staticmethod
+    async def view_file(filename: str,
+                        lines: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                        byte_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                        head: Optional[int] = None,
+                        tail: Optional[int] = None) -> CommandResponse:
+        """
+        View a file, or a window of it
+        
+        Args:
+            filename: The name of the file to view
+            lines: Optional (first, last) line numbers, 1-based and inclusive
+            byte_range: Optional (start, end) byte offsets
+            head: Optional number of lines from the start
+            tail: Optional number of lines from the end
+            
+        Returns:
+            CommandResponse with the file content
+        """
+        filename, file_path = FileService._view_path(filename)
+        
+        if not os.path.exists(file_path):
+            return CommandResponse(
+                output=f"Error: File not found: {filename}",
+                status=1
+            )
+        
+        try:
+            start, end, description = await FileService._view_span(file_path, lines, byte_range, head, tail)
+            
+            truncated = end - start > VIEW_MAX_BYTES
+            content = read_bytes(file_path, start, min(end, start + VIEW_MAX_BYTES))
+            content = content.decode("utf-8", errors="replace")
+            
+            if not description:
+                return CommandResponse(
+                    output=f"📄 {filename}:\n\n{content}",
+                    status=0
+                )
+            
+            output = f"📄 {filename} ({description}):\n\n{content}"
+            if truncated:
+                output += (f"\n\n⚠️ Output truncated to {VIEW_MAX_BYTES} bytes. "
+                           "Narrow the range with --lines, --bytes, --head or --tail, "
+                           "or use the streaming endpoint.")
+            elif lines is None and byte_range is None and head is None and tail is None:
+                output += "\n\n⚠️ File is large, showing the first lines only. Use --lines A:B, --tail N or --bytes A:B."
+            
+            return CommandResponse(output=output, status=0)
+        except Exception as e:
+            return CommandResponse(
+                output=f"Error reading file: {str(e)}",
+                status=1
+            )
+    
+    @staticmethod
+    async def stream_file(filename: str,
+                          lines: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                          byte_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                          head: Optional[int] = None,
+                          tail: Optional[int] = None) -> AsyncIterator[Tuple[str, int]]:
+        """
+        Stream a file, or a window of it, without size limits
+        
+        Args:
+            Same as view_file
+            
+        Yields:
+            Tuples of (text chunk, status); the status is only meaningful on the last chunk
+        """
+        filename, file_path = FileService._view_path(filename)
+        
+        if not os.path.exists(file_path):
+            yield f"Error: File not found: {filename}", 1
+            return
+        
+        try:
+            size = os.path.getsize(file_path)
+            if lines is None and byte_range is None and head is None and tail is None:
+                # Streaming has no size limit, so the default is the whole file
+                byte_range = (0, size)
+            start, end, description = await FileService._view_span(file_path, lines, byte_range, head, tail)
+            
+            yield f"📄 {filename} ({description}):\n\n", 0
+            
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for chunk in iter_bytes(file_path, start, end):
+                yield decoder.decode(chunk), 0
+                # Let other requests run between chunks
+                await asyncio.sleep(0)
+            yield decoder.decode(b"", final=True), 0
+        except Exception as e:
+            yield f"Error reading file: {str(e)}", 1
+    
+    @staticmethod
+    async def run_file(filename: str, demo_mode: bool = False) -> CommandResponse:
         """
         Run a Python file
         
@@ -177,13 +463,8 @@ class FileService:
                 )
             
             # Check if the file contains input() calls (likely interactive)
-            with open(file_path, 'r') as f:
-                file_content = f.read()
-                is_interactive = 'input(' in file_content
-            
-            # Run the Python file
-            import subprocess
-            import sys
+            artifact = artifact_cache.for_file(file_path)
+            is_interactive = artifact.is_interactive
             
             logger.info(f"Running file: {file_path}")
             
@@ -193,29 +474,24 @@ class FileService:
             # If the script is interactive and demo_mode is requested, run with --demo flag
             if is_interactive and demo_mode:
                 output += "Running in demo mode...\n\n"
-                result = subprocess.run(
-                    [sys.executable, file_path, "--demo"],
-                    capture_output=True,
-                    text=True,
-                    timeout=10  # 10 second timeout
-                )
+                result = await run_python_file(file_path, ["--demo"], timeout=SCRIPT_TIMEOUT,
+                                               code_path=artifact.code_path)
             elif is_interactive:
                 # For interactive scripts without demo mode, warn the user
-                return CommandResponse(
-                    output=output + 
-                           "⚠️ This script appears to be interactive and requires user input.\n" +
+                output += ("⚠️ This script appears to be interactive and requires user input.\n" +
                            "It cannot be run directly from the terminal agent.\n" +
-                           f"To run it manually, use: python {file_path}\n" +
-                           "Or run it in demo mode with: file:run " + filename + " --demo",
-                    status=0
-                )
+                           f"To run it manually, use: python {file_path}")
+                if artifact.has_demo:
+                    output += "\nOr run it in demo mode with: file:run " + filename + " --demo"
+                return CommandResponse(output=output, status=0)
             else:
                 # Run non-interactive scripts normally
-                result = subprocess.run(
-                    [sys.executable, file_path],
-                    capture_output=True,
-                    text=True,
-                    timeout=10  # 10 second timeout
+                result = await run_python_file(file_path, timeout=SCRIPT_TIMEOUT, code_path=artifact.code_path)
+            
+            if result.timed_out:
+                return CommandResponse(
+                    output=f"⚠️ Script execution timed out after {SCRIPT_TIMEOUT} seconds.",
+                    status=124
                 )
             
             # Format the result output
@@ -226,17 +502,13 @@ class FileService:
                     output += "The script ran successfully with no output.\n"
             else:
                 output += f"Error running the script:\n{result.stderr}\n"
+            output += result.truncation_marker()
             
             return CommandResponse(
                 output=output,
                 status=result.returncode
             )
             
-        except subprocess.TimeoutExpired:
-            return CommandResponse(
-                output=f"⚠️ Script execution timed out after 10 seconds.",
-                status=124
-            )
         except Exception as e:
             logger.error(f"Error running file: {str(e)}", exc_info=True)
             return CommandResponse(
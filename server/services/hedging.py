@@ -0,0 +1,101 @@
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from core.config import AI_HEDGE_MAX_RATIO, AI_HEDGE_MIN_DELAY, AI_HEDGE_MIN_SAMPLES, AI_HEDGE_PERCENTILE
+
+# Recent latencies kept for each kind of request, and recent requests the hedge ratio is counted over
+LATENCY_WINDOW = 200
+HEDGE_WINDOW = 200
+
+
+class HedgePolicy:
+    """
+    Decides when a request to the AI API gets a duplicate (a hedge) so that a
+    slow response doesn't hold up the answer
+
+    The time to the first response is tracked per kind of request (model, and
+    whether it streams). A request that has waited longer than the given
+    percentile of recent requests of its kind is sent again, and whichever
+    response arrives first is used. At most max_ratio of recent requests are
+    hedged, so that an API that is slow for everyone isn't sent twice the load.
+    """
+
+    def __init__(self, percentile: float, min_samples: int = 20, min_delay: float = 0.25,
+                 max_ratio: float = 0.1):
+        """
+        Args:
+            percentile: Latency percentile after which to hedge, 0 to never hedge
+            min_samples: Latencies needed for a kind of request before it is hedged
+            min_delay: Least time to wait before hedging, in seconds
+            max_ratio: Largest fraction of recent requests that may be hedged
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self._latencies: Dict[str, Deque[float]] = {}
+        # Whether each recent request was hedged
+        self._recent: Deque[bool] = deque(maxlen=HEDGE_WINDOW)
+        self.requests = 0
+        self.hedged = 0
+        # Hedged requests answered first by the duplicate
+        self.hedge_wins = 0
+        self.denied = 0
+
+    @staticmethod
+    def key(payload: Dict[str, Any]) -> str:
+        """Return the kind of a chat completion request; streamed answers start much sooner"""
+        return f"{payload.get('model')}:{'stream' if payload.get('stream') else 'full'}"
+
+    def delay(self, key: str) -> Optional[float]:
+        """Return the seconds to wait for a response before hedging, None to not hedge"""
+        if self.percentile <= 0:
+            return None
+        samples = self._latencies.get(key)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        return max(ordered[index], self.min_delay)
+
+    def observe(self, key: str, seconds: float) -> None:
+        """Record how long a request waited for its first response"""
+        samples = self._latencies.get(key)
+        if samples is None:
+            samples = self._latencies[key] = deque(maxlen=LATENCY_WINDOW)
+        samples.append(seconds)
+
+    def allow(self) -> bool:
+        """Whether another request may be hedged now, see max_ratio"""
+        if sum(self._recent) >= self.max_ratio * len(self._recent):
+            self.denied += 1
+            return False
+        return True
+
+    def finish(self, hedged: bool, hedge_won: bool = False) -> None:
+        """Count a request once it has a response"""
+        self.requests += 1
+        self._recent.append(hedged)
+        if hedged:
+            self.hedged += 1
+        if hedge_won:
+            self.hedge_wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hedging counters and the current hedge delay of each kind of request"""
+        return {
+            "enabled": self.percentile > 0,
+            "percentile": self.percentile,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "denied": self.denied,
+            # Seconds each kind of request waits before it is hedged, None until it has enough samples
+            "delays": {key: self._rounded(self.delay(key)) for key in self._latencies},
+        }
+
+    @staticmethod
+    def _rounded(delay: Optional[float]) -> Optional[float]:
+        return round(delay, 3) if delay is not None else None
+
+
+hedge_policy = HedgePolicy(AI_HEDGE_PERCENTILE, AI_HEDGE_MIN_SAMPLES, AI_HEDGE_MIN_DELAY, AI_HEDGE_MAX_RATIO)
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Optional
+from core.config import (
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_DNS_CACHE_TTL,
+)
+from services.metrics import record
+
+if TYPE_CHECKING:
+    # Imported on first use, so commands that never make HTTP requests don't pay for loading them
+    import ssl
+    import aiohttp
+
+logger = logging.getLogger("terminal-api")
+
+
+def _timing_trace() -> "aiohttp.TraceConfig":
+    """Trace that records DNS lookups and new connections (including the TLS handshake) as stages"""
+    import aiohttp
+    trace = aiohttp.TraceConfig()
+
+    def timer(stage: str):
+        async def start(session, context, params) -> None:
+            setattr(context, stage, time.perf_counter())
+
+        async def end(session, context, params) -> None:
+            started = getattr(context, stage, None)
+            if started is not None:
+                record(stage, time.perf_counter() - started)
+        return start, end
+
+    dns_start, dns_end = timer("http.dns")
+    trace.on_dns_resolvehost_start.append(dns_start)
+    trace.on_dns_resolvehost_end.append(dns_end)
+    connect_start, connect_end = timer("http.connect")
+    trace.on_connection_create_start.append(connect_start)
+    trace.on_connection_create_end.append(connect_end)
+    return trace
+
+
+class HTTPClient:
+    """Application-scoped aiohttp session with a pooled keep-alive connector"""
+
+    _ssl_context: Optional["ssl.SSLContext"] = None
+    _session: Optional["aiohttp.ClientSession"] = None
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def ssl_context(cls) -> "ssl.SSLContext":
+        """
+        Return the SSL context, parsing certifi's CA bundle only once
+
+        Returns:
+            The shared SSL context
+        """
+        if cls._ssl_context is None:
+            import ssl
+            import certifi
+            cls._ssl_context = ssl.create_default_context(cafile=certifi.where())
+        return cls._ssl_context
+
+    @classmethod
+    def preload(cls) -> None:
+        """Load aiohttp and the CA bundle ahead of the first request, e.g. in a background thread"""
+        import aiohttp
+        cls.ssl_context()
+
+    @classmethod
+    async def start(cls) -> "aiohttp.ClientSession":
+        """
+        Create the shared session if it doesn't exist yet
+
+        Returns:
+            The shared ClientSession
+        """
+        loop = asyncio.get_running_loop()
+        if cls._session is not None and not cls._session.closed and cls._loop is loop:
+            return cls._session
+
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(
+            ssl=cls.ssl_context(),
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            use_dns_cache=True,
+        )
+        cls._session = aiohttp.ClientSession(connector=connector, trace_configs=[_timing_trace()])
+        cls._loop = loop
+        logger.info(
+            f"HTTP client started (pool limit: {HTTP_POOL_LIMIT}, "
+            f"per host: {HTTP_POOL_LIMIT_PER_HOST})"
+        )
+        return cls._session
+
+    @classmethod
+    async def get_session(cls) -> "aiohttp.ClientSession":
+        """
+        Return the shared session, creating it on first use
+
+        Returns:
+            The shared ClientSession
+        """
+        return await cls.start()
+
+    @classmethod
+    async def close(cls) -> None:
+        """Close the shared session and its pooled connections"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+            logger.info("HTTP client closed")
+        cls._session = None
+        cls._loop = None
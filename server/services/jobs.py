@@ -0,0 +1,565 @@
+import asyncio
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from core.config import (
+    JOB_DB_PATH,
+    JOB_MAX_QUEUED,
+    JOB_POLL_INTERVAL,
+    JOB_RETENTION,
+    JOB_WORKERS,
+    OPENAI_MODEL,
+    SHARED_STATE_PATH,
+)
+from services.ai_service import AIService
+from services.rate_limiter import current_user
+from services.shared_state import run_in_thread
+
+logger = logging.getLogger("terminal-api")
+
+# Queue order of the priority names, lower runs first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+# Seconds between heartbeats of a process's running jobs, and after which a running
+# job without one is taken to be orphaned by a process that exited, and queued again
+HEARTBEAT_INTERVAL = 10
+ORPHAN_AFTER = 60
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+@dataclass
+class Job:
+    """An ai:code generation (and optional run) executed in the background"""
+    id: str
+    prompt: str
+    model: str
+    priority: str = "normal"
+    auto_run: bool = True
+    use_cache: bool = True
+    # Code candidates to generate, None for AI_CODE_CANDIDATES
+    candidates: Optional[int] = None
+    state: str = QUEUED
+    output: str = ""
+    status: Optional[int] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+# This process's pid and owner token
+_owner_token: Optional[Tuple[int, str]] = None
+
+
+def _owner() -> str:
+    """
+    Return the token that marks the jobs this process runs
+
+    Unlike the pid, it is never reused by a later process.
+    """
+    global _owner_token
+    if _owner_token is None or _owner_token[0] != os.getpid():
+        # Forked processes get their own
+        _owner_token = (os.getpid(), f"{os.getpid()}-{secrets.token_hex(8)}")
+    return _owner_token[1]
+
+
+class JobStore:
+    """
+    SQLite table of jobs, so queued jobs survive a restart and the worker
+    processes of a multi-process server can share them
+
+    Each running job records the process running it (owner) and when that
+    process last confirmed it still is (heartbeat_at), and a job only
+    starts once a process has claimed it, so no job runs twice. The methods
+    block; JobQueue calls them through run_in_thread once it is running.
+    """
+
+    COLUMNS = ("id", "prompt", "model", "priority", "auto_run", "use_cache", "candidates", "state",
+               "output", "status", "created_at", "started_at", "finished_at")
+    # Columns added after the table was first created, with their types
+    ADDED_COLUMNS = {"owner": "TEXT", "candidates": "INTEGER", "heartbeat_at": "REAL"}
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite file holding the jobs
+        """
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the store, creating the schema on first use"""
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "  id TEXT PRIMARY KEY,"
+                "  prompt TEXT NOT NULL,"
+                "  model TEXT NOT NULL,"
+                "  priority TEXT NOT NULL,"
+                "  auto_run INTEGER NOT NULL,"
+                "  use_cache INTEGER NOT NULL,"
+                "  candidates INTEGER,"
+                "  state TEXT NOT NULL,"
+                "  output TEXT NOT NULL,"
+                "  status INTEGER,"
+                "  created_at REAL NOT NULL,"
+                "  started_at REAL,"
+                "  finished_at REAL,"
+                "  owner TEXT,"
+                "  heartbeat_at REAL"
+                ");"
+                "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);"
+                "CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);"
+            )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in self.ADDED_COLUMNS.items():
+                if column in columns:
+                    continue
+                try:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+                except sqlite3.OperationalError:
+                    # Another process added it first
+                    pass
+            self._db = db
+        return self._db
+
+    def _job(self, row: tuple) -> Job:
+        job = Job(**dict(zip(self.COLUMNS, row)))
+        job.auto_run, job.use_cache = bool(job.auto_run), bool(job.use_cache)
+        return job
+
+    def save(self, job: Job) -> None:
+        """Insert or update a job, keeping its owner"""
+        values = job.to_dict()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in self.COLUMNS)}) "
+                f"ON CONFLICT (id) DO UPDATE SET "
+                f"{', '.join(f'{column} = excluded.{column}' for column in self.COLUMNS[1:])}",
+                tuple(values[column] for column in self.COLUMNS)
+            )
+            db.commit()
+
+    def claim(self, job: Job) -> bool:
+        """
+        Mark a queued job as running in this process
+
+        Returns:
+            True if it was claimed, False if it is no longer queued (e.g. another process claimed it)
+        """
+        with self._lock:
+            db = self._connect()
+            cursor = db.execute(
+                "UPDATE jobs SET state = ?, started_at = ?, owner = ?, heartbeat_at = ? WHERE id = ? AND state = ?",
+                (RUNNING, job.started_at, _owner(), time.time(), job.id, QUEUED)
+            )
+            db.commit()
+        return cursor.rowcount == 1
+
+    def cancel(self, job_id: str) -> None:
+        """Cancel a job that is queued or running, whichever process has it"""
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "UPDATE jobs SET state = ?, output = ?, status = ?, finished_at = ? WHERE id = ? AND state IN (?, ?)",
+                (CANCELLED, "Job cancelled", 130, time.time(), job_id, QUEUED, RUNNING)
+            )
+            db.commit()
+
+    def heartbeat(self, job_ids: List[str]) -> None:
+        """Record that this process is still running jobs it claimed"""
+        if not job_ids:
+            return
+        now, owner = time.time(), _owner()
+        with self._lock:
+            db = self._connect()
+            db.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND state = ? AND owner = ?",
+                [(now, job_id, RUNNING, owner) for job_id in job_ids]
+            )
+            db.commit()
+
+    def requeue_orphans(self, stale_after: float) -> int:
+        """
+        Queue again running jobs whose process stopped sending heartbeats, returning how many
+
+        Args:
+            stale_after: Seconds without a heartbeat after which a job is orphaned
+        """
+        with self._lock:
+            db = self._connect()
+            cursor = db.execute(
+                "UPDATE jobs SET state = ?, started_at = NULL, owner = NULL, heartbeat_at = NULL "
+                "WHERE state = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (QUEUED, RUNNING, time.time() - stale_after)
+            )
+            db.commit()
+        return cursor.rowcount
+
+    def count(self, state: str) -> int:
+        """Return the number of jobs in a state"""
+        with self._lock:
+            row = self._connect().execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (state,)).fetchone()
+        return row[0]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job, or None if there is no such job"""
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._job(row) if row is not None else None
+
+    def list(self, state: Optional[str] = None, limit: int = 50) -> List[Job]:
+        """Return the most recently created jobs, optionally only those in one state"""
+        query = f"SELECT {', '.join(self.COLUMNS)} FROM jobs"
+        params: tuple = ()
+        if state is not None:
+            query += " WHERE state = ?"
+            params = (state,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._connect().execute(query, params + (limit,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def queued(self) -> List[Job]:
+        """Return jobs waiting to run, oldest first"""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE state = ? ORDER BY created_at", (QUEUED,)
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def prune(self, before: float) -> int:
+        """Delete jobs that finished before a time, returning how many were deleted"""
+        with self._lock:
+            db = self._connect()
+            cursor = db.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?, ?) AND finished_at < ?", FINISHED + (before,)
+            )
+            db.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class JobQueue:
+    """Priority queue of ai:code jobs run by a fixed number of workers"""
+
+    def __init__(self, store: JobStore, workers: int = 2, max_queued: int = 1000, retention: float = 86400,
+                 shared: bool = False, poll_interval: float = 1.0):
+        """
+        Args:
+            store: Where jobs are persisted
+            workers: Number of jobs run at the same time
+            max_queued: Maximum number of jobs waiting to run
+            retention: Seconds finished jobs are kept
+            shared: Whether other processes use the same store; the queue then
+                also runs their jobs and follows changes they make
+            poll_interval: Seconds between looks at the store for such changes
+        """
+        self.store = store
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self.shared = shared
+        self.poll_interval = poll_interval
+        # Queued and running jobs; finished ones are only kept in the store
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        # Ties between equal priorities are broken in submission order
+        self._sequence = 0
+        self._running: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self._workers: List[asyncio.Task] = []
+        self._poller: Optional[asyncio.Task] = None
+        self._keeper: Optional[asyncio.Task] = None
+        # Jobs queued in the store at the last poll, when shared
+        self._shared_queued = 0
+
+    def _enqueue(self, job: Job) -> None:
+        self._sequence += 1
+        self._jobs[job.id] = job
+        self._queue.put_nowait((PRIORITIES[job.priority], self._sequence, job.id))
+
+    async def _update(self, job: Job) -> None:
+        """Persist a job's new state and tell its subscribers"""
+        await run_in_thread(self.store.save, job)
+        event = job.to_dict()
+        for queue in self._subscribers.get(job.id, []):
+            queue.put_nowait(event)
+        if job.finished:
+            self._jobs.pop(job.id, None)
+
+    async def submit(self, prompt: str, priority: str = "normal", model: Optional[str] = None,
+                     auto_run: bool = True, use_cache: bool = True, candidates: Optional[int] = None) -> Job:
+        """
+        Queue a code generation job
+
+        Args:
+            prompt: Description of the code to generate
+            priority: "high", "normal" or "low"
+            model: The model to use (defaults to config value)
+            auto_run: Whether to run the generated code
+            use_cache: Whether a cached response may be used
+            candidates: Code candidates to generate, see AIService.generate_and_save_code
+
+        Returns:
+            The queued job
+
+        Raises:
+            ValueError: If the priority is unknown
+            RuntimeError: If the queue is not running or is full
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority} (use {', '.join(PRIORITIES)})")
+        if self._queue is None:
+            raise RuntimeError("The job queue is not running")
+        if self._queue.qsize() >= self.max_queued:
+            raise RuntimeError("Too many queued jobs")
+
+        job = Job(id=secrets.token_hex(8), prompt=prompt, model=model or OPENAI_MODEL,
+                  priority=priority, auto_run=auto_run, use_cache=use_cache, candidates=candidates)
+        await run_in_thread(self.store.save, job)
+        self._enqueue(job)
+        logger.info(f"Queued job {job.id} ({priority})")
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Return a job, or None if there is no such job"""
+        # Another process may have run or cancelled it
+        job = None if self.shared else self._jobs.get(job_id)
+        return job or await run_in_thread(self.store.get, job_id)
+
+    async def list(self, state: Optional[str] = None, limit: int = 50) -> List[Job]:
+        """Return the most recently submitted jobs"""
+        return await run_in_thread(self.store.list, state, limit)
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a queued or running job; finished jobs are left as they are
+
+        Args:
+            job_id: The job to cancel
+
+        Returns:
+            The job, or None if there is no such job
+        """
+        task = self._running.get(job_id)
+        if task is not None:
+            # The worker records the cancellation once the task has unwound
+            task.cancel()
+            await asyncio.wait({task})
+            return await self.get(job_id)
+
+        job = self._jobs.get(job_id)
+        if job is None:
+            if self.shared:
+                # Queued or running in another process, which notices and stops it
+                await run_in_thread(self.store.cancel, job_id)
+            return await run_in_thread(self.store.get, job_id)
+
+        # Still in the queue, the worker skips it when it comes up
+        job.state = CANCELLED
+        job.finished_at = time.time()
+        await self._update(job)
+        return job
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield a job's state now and after every change until it has finished
+
+        Args:
+            job_id: The job to follow; nothing is yielded for an unknown job
+        """
+        job = await self.get(job_id)
+        if job is None:
+            return
+        yield job.to_dict()
+        if job.finished:
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        subscribers = self._subscribers.setdefault(job_id, [])
+        subscribers.append(queue)
+        last = job.to_dict()
+        try:
+            while True:
+                try:
+                    # Changes made by other processes are only seen in the store
+                    event = await asyncio.wait_for(queue.get(), self.poll_interval if self.shared else None)
+                except asyncio.TimeoutError:
+                    job = await run_in_thread(self.store.get, job_id)
+                    if job is None:
+                        return
+                    event = job.to_dict()
+                    if event == last:
+                        continue
+                last = event
+                yield event
+                if event["state"] in FINISHED:
+                    return
+        finally:
+            subscribers.remove(queue)
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+
+    async def _execute(self, job: Job) -> None:
+        # Background jobs share upstream capacity fairly with interactive users, as one user
+        current_user.set("jobs")
+        response = await AIService.generate_and_save_code(job.prompt, model=job.model,
+                                                          auto_run=job.auto_run, use_cache=job.use_cache,
+                                                          candidates=job.candidates)
+        job.output, job.status = response.output, response.status
+        job.state = SUCCEEDED if response.status == 0 else FAILED
+
+    async def _work(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.state != QUEUED:
+                continue
+
+            job.started_at = time.time()
+            if not await run_in_thread(self.store.claim, job):
+                # Cancelled or taken by another process
+                self._jobs.pop(job.id, None)
+                continue
+            job.state = RUNNING
+            await self._update(job)
+            task = asyncio.ensure_future(self._execute(job))
+            self._running[job.id] = task
+            try:
+                await self._wait(job, task)
+            finally:
+                self._running.pop(job.id, None)
+            if task.cancelled():
+                if self._queue is None:
+                    # Shutting down: leave the job running in the store so it is requeued on start
+                    return
+                job.state, job.output, job.status = CANCELLED, "Job cancelled", 130
+            elif task.exception() is not None:
+                job.state, job.output, job.status = FAILED, f"Error: {str(task.exception())}", 1
+            job.finished_at = time.time()
+            await self._update(job)
+            logger.info(f"Job {job.id} {job.state}")
+
+    async def _wait(self, job: Job, task: asyncio.Task) -> None:
+        """Wait for a job's task, cancelling it if another process cancelled the job"""
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=self.poll_interval if self.shared else None)
+            if done:
+                return
+            stored = await run_in_thread(self.store.get, job.id)
+            if stored is not None and stored.state == CANCELLED:
+                task.cancel()
+
+    async def _poll(self) -> None:
+        """Pick up jobs queued by other processes"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                queued = await run_in_thread(self.store.queued)
+                self._shared_queued = len(queued)
+                for job in queued:
+                    if job.id not in self._jobs:
+                        self._enqueue(job)
+            except Exception as e:
+                logger.warning(f"Error looking for queued jobs: {str(e)}")
+
+    async def _keep_alive(self) -> None:
+        """Send heartbeats for the running jobs, and queue again those of processes that exited"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await run_in_thread(self.store.heartbeat, list(self._running))
+                requeued = await run_in_thread(self.store.requeue_orphans, ORPHAN_AFTER)
+                if requeued:
+                    logger.info(f"Requeued {requeued} orphaned job(s)")
+                    for job in await run_in_thread(self.store.queued):
+                        if job.id not in self._jobs:
+                            self._enqueue(job)
+            except Exception as e:
+                logger.warning(f"Error sending job heartbeats: {str(e)}")
+
+    def start(self) -> None:
+        """Requeue jobs left unfinished by the last run and start the workers"""
+        if self._queue is not None:
+            return
+        self._queue = asyncio.PriorityQueue()
+        pruned = self.store.prune(time.time() - self.retention)
+        if pruned:
+            logger.info(f"Pruned {pruned} finished job(s)")
+
+        # A job interrupted while running starts over. Without other processes, every
+        # running job was interrupted; with them, only those that stopped heartbeating.
+        requeued = self.store.requeue_orphans(ORPHAN_AFTER if self.shared else 0)
+        for job in self.store.queued():
+            self._enqueue(job)
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted job(s)")
+
+        self._workers = [asyncio.ensure_future(self._work()) for _ in range(max(self.workers, 1))]
+        if self.shared:
+            self._poller = asyncio.ensure_future(self._poll())
+        self._keeper = asyncio.ensure_future(self._keep_alive())
+
+    async def close(self) -> None:
+        """Stop the workers; queued and interrupted jobs stay in the store for the next start"""
+        if self._queue is None:
+            return
+        self._queue = None
+        for task in list(self._running.values()):
+            task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        for task in (self._poller, self._keeper):
+            if task is not None:
+                task.cancel()
+                self._workers.append(task)
+        self._poller = self._keeper = None
+        await asyncio.gather(*self._workers, *self._running.values(), return_exceptions=True)
+        self._workers = []
+        self._jobs.clear()
+        self._running.clear()
+        self.store.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Return job counts"""
+        return {
+            "queued": self._shared_queued if self.shared else
+            sum(1 for job in self._jobs.values() if job.state == QUEUED),
+            "running": len(self._running),
+        }
+
+
+# Shared ai:code job queue
+job_queue = JobQueue(JobStore(JOB_DB_PATH), JOB_WORKERS, JOB_MAX_QUEUED, JOB_RETENTION,
+                     shared=bool(SHARED_STATE_PATH), poll_interval=JOB_POLL_INTERVAL)
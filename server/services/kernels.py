@@ -0,0 +1,322 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from core.config import (
+    KERNEL_IDLE_TIMEOUT,
+    KERNEL_MAX,
+    KERNEL_MEMORY_LIMIT_MB,
+    NODE_BINARY,
+    OUTPUT_MAX_BYTES,
+)
+from services.metrics import SUBPROCESS_SPAWNS
+from services.process_runner import ProcessResult
+
+logger = logging.getLogger("terminal-api")
+
+PYTHON_KERNEL_SCRIPT = os.path.join(os.path.dirname(__file__), "python_kernel.py")
+NODE_KERNEL_SCRIPT = os.path.join(os.path.dirname(__file__), "node_kernel.js")
+
+# Names accepted for each kernel language
+LANGUAGES = {
+    "python": "python", "python3": "python", "py": "python",
+    "node": "node", "js": "node", "javascript": "node",
+}
+
+# Seconds a kernel gets to answer after it was interrupted, before it is killed
+INTERRUPT_GRACE_PERIOD = 2
+
+# How often idle kernels are looked for, in seconds
+REAP_INTERVAL = 30
+
+# Longest protocol line accepted from a kernel; results carry up to
+# OUTPUT_MAX_BYTES of output, which JSON escaping can grow several times
+MAX_RESULT_LINE = 6 * OUTPUT_MAX_BYTES + 64 * 1024
+
+
+class Kernel:
+    """Handle on one persistent REPL process"""
+
+    def __init__(self, language: str, process: asyncio.subprocess.Process):
+        self.language = language
+        self.process = process
+        self.started_at = time.time()
+        self.last_used = time.monotonic()
+        self.evaluations = 0
+        # Evaluations running or waiting for the one before them
+        self.pending = 0
+        # One request and its reply at a time on stdin and stdout
+        self._lock = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    @property
+    def busy(self) -> bool:
+        return self.pending > 0
+
+    async def _read_result(self, timeout: float) -> Dict[str, Any]:
+        line = await asyncio.wait_for(self.process.stdout.readline(), timeout)
+        if not line:
+            raise RuntimeError(f"{self.language} kernel exited unexpectedly")
+        return json.loads(line)
+
+    async def evaluate(self, code: str, timeout: float, cwd: Optional[str] = None) -> Tuple[ProcessResult, bool]:
+        """
+        Evaluate code, keeping the kernel's state
+
+        Args:
+            code: The source to evaluate
+            timeout: Seconds before the evaluation is interrupted
+            cwd: Working directory to evaluate in
+
+        Returns:
+            Tuple of (result, whether the kernel survived)
+        """
+        self.pending += 1
+        try:
+            async with self._lock:
+                if not self.alive:
+                    # Stopped by the evaluation before this one
+                    raise RuntimeError(f"{self.language} kernel exited unexpectedly")
+                return await self._evaluate(code, timeout, cwd)
+        finally:
+            self.pending -= 1
+
+    async def _evaluate(self, code: str, timeout: float, cwd: Optional[str]) -> Tuple[ProcessResult, bool]:
+        payload = {"code": code, "cwd": cwd, "timeout": timeout, "max_output_bytes": OUTPUT_MAX_BYTES}
+        self.last_used = time.monotonic()
+        try:
+            self.process.stdin.write(json.dumps(payload).encode("utf-8") + b"\n")
+            await self.process.stdin.drain()
+
+            timed_out = False
+            try:
+                result = await self._read_result(timeout)
+            except asyncio.TimeoutError:
+                # Interrupt the code but keep the kernel, as Ctrl-C would in a REPL
+                timed_out = True
+                try:
+                    self.process.send_signal(signal.SIGINT)
+                    result = await self._read_result(INTERRUPT_GRACE_PERIOD)
+                except (asyncio.TimeoutError, ProcessLookupError, RuntimeError, ValueError):
+                    await self.stop()
+                    return ProcessResult(returncode=124, timed_out=True), False
+        except BaseException:
+            # Cancelled mid-evaluation or the reply was unreadable, the kernel's state is unknown
+            await self.stop()
+            raise
+        finally:
+            self.last_used = time.monotonic()
+
+        self.evaluations += 1
+        stdout, stderr = result.get("stdout", ""), result.get("stderr", "")
+        return ProcessResult(
+            returncode=124 if timed_out else result.get("status", 0),
+            stdout=stdout,
+            stderr=stderr,
+            timed_out=timed_out,
+            # Kernels report the two streams separately, not interleaved
+            output=stdout + stderr,
+            omitted_bytes=result.get("omitted_bytes", 0),
+        ), True
+
+    async def stop(self) -> None:
+        if self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            await self.process.wait()
+
+
+class KernelManager:
+    """Persistent REPL kernels, one per session and language, reclaimed when idle"""
+
+    def __init__(self, max_kernels: int, idle_timeout: float, memory_limit_mb: int):
+        """
+        Args:
+            max_kernels: Maximum number of kernels running at once
+            idle_timeout: Seconds an unused kernel is kept
+            memory_limit_mb: Memory limit for each kernel (0 for no limit)
+        """
+        self.max_kernels = max_kernels
+        self.idle_timeout = idle_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self._kernels: "OrderedDict[Tuple[str, str], Kernel]" = OrderedDict()
+        self._reaper: Optional[asyncio.Task] = None
+
+    def _command(self, language: str) -> List[str]:
+        if language == "python":
+            return [sys.executable, "-u", PYTHON_KERNEL_SCRIPT, str(self.memory_limit_mb)]
+        command = [NODE_BINARY]
+        if self.memory_limit_mb > 0:
+            command.append(f"--max-old-space-size={self.memory_limit_mb}")
+        return command + [NODE_KERNEL_SCRIPT]
+
+    async def _spawn(self, language: str, cwd: Optional[str], env: Optional[Dict[str, str]]) -> Kernel:
+        """Start a kernel and wait until it is ready"""
+        process = await asyncio.create_subprocess_exec(
+            *self._command(language),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            cwd=cwd,
+            env=env,
+            start_new_session=True,
+            limit=MAX_RESULT_LINE,
+        )
+        SUBPROCESS_SPAWNS.inc(kind=f"{language}_kernel")
+        kernel = Kernel(language, process)
+        try:
+            ready = await asyncio.wait_for(process.stdout.readline(), 30)
+        except BaseException:
+            await kernel.stop()
+            raise
+        if not ready:
+            await kernel.stop()
+            raise RuntimeError(f"{language} kernel failed to start")
+        return kernel
+
+    async def _evict(self) -> None:
+        """Stop least recently used idle kernels until there is room for one more"""
+        while len(self._kernels) >= self.max_kernels:
+            key = next((k for k, kernel in self._kernels.items() if not kernel.busy), None)
+            if key is None:
+                raise RuntimeError("Too many kernels running")
+            kernel = self._kernels.pop(key)
+            logger.info(f"Evicting {kernel.language} kernel of session {key[0]}")
+            await kernel.stop()
+
+    async def get(self, session_id: str, language: str,
+                  cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None) -> Kernel:
+        """
+        Return the session's kernel for a language, starting it if needed
+
+        Args:
+            session_id: The owning session
+            language: "python" or "node"
+            cwd: Working directory for a new kernel
+            env: Environment for a new kernel
+
+        Returns:
+            The running kernel
+        """
+        key = (session_id, language)
+        kernel = self._kernels.get(key)
+        if kernel is not None and kernel.alive:
+            self._kernels.move_to_end(key)
+            return kernel
+        self._kernels.pop(key, None)
+
+        await self._evict()
+        kernel = await self._spawn(language, cwd, env)
+        existing = self._kernels.get(key)
+        if existing is not None and existing.alive:
+            # Another command started one in the meantime
+            await kernel.stop()
+            return existing
+        self._kernels[key] = kernel
+        logger.info(f"Started {language} kernel for session {session_id}")
+        return kernel
+
+    async def evaluate(self, session_id: str, language: str, code: str, timeout: float,
+                       cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None) -> Tuple[ProcessResult, bool]:
+        """
+        Evaluate code in the session's kernel for a language
+
+        Args:
+            session_id: The owning session
+            language: "python" or "node"
+            code: The source to evaluate
+            timeout: Seconds before the evaluation is interrupted
+            cwd: Working directory to evaluate in
+            env: Environment for a newly started kernel
+
+        Returns:
+            Tuple of (result, whether the kernel's state was kept)
+        """
+        kernel = await self.get(session_id, language, cwd, env)
+        result, survived = await kernel.evaluate(code, timeout, cwd)
+        if not survived:
+            self._kernels.pop((session_id, language), None)
+        return result, survived
+
+    async def stop(self, session_id: str, language: Optional[str] = None) -> int:
+        """
+        Stop a session's kernels
+
+        Args:
+            session_id: The owning session
+            language: Only stop this language's kernel
+
+        Returns:
+            Number of kernels stopped
+        """
+        keys = [k for k in self._kernels if k[0] == session_id and (language is None or k[1] == language)]
+        for key in keys:
+            await self._kernels.pop(key).stop()
+        return len(keys)
+
+    def list(self, session_id: str) -> List[Dict[str, Any]]:
+        """Describe the session's running kernels"""
+        now = time.monotonic()
+        return [
+            {
+                "language": language,
+                "pid": kernel.process.pid,
+                "evaluations": kernel.evaluations,
+                "idle_seconds": int(now - kernel.last_used),
+            }
+            for (owner, language), kernel in self._kernels.items()
+            if owner == session_id and kernel.alive
+        ]
+
+    async def reap(self) -> None:
+        """Stop kernels that have been unused for longer than the idle timeout"""
+        now = time.monotonic()
+        expired = [
+            key for key, kernel in self._kernels.items()
+            if not kernel.alive or (not kernel.busy and now - kernel.last_used > self.idle_timeout)
+        ]
+        for key in expired:
+            kernel = self._kernels.pop(key)
+            logger.info(f"Stopping idle {kernel.language} kernel of session {key[0]}")
+            await kernel.stop()
+
+    async def _reap_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            await self.reap()
+
+    def start(self) -> None:
+        """Start reclaiming idle kernels in the background"""
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.ensure_future(self._reap_periodically())
+
+    async def close(self) -> None:
+        """Stop the background reaper and every kernel"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        kernels = list(self._kernels.values())
+        self._kernels.clear()
+        for kernel in kernels:
+            await kernel.stop()
+
+    def stats(self) -> Dict[str, int]:
+        """Return kernel counts"""
+        return {
+            "kernels": len(self._kernels),
+            "busy": sum(1 for k in self._kernels.values() if k.busy),
+        }
+
+
+# Shared REPL kernels for terminal sessions
+kernel_manager = KernelManager(KERNEL_MAX, KERNEL_IDLE_TIMEOUT, KERNEL_MEMORY_LIMIT_MB)
@@ -0,0 +1,155 @@
+import asyncio
+import mmap
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Iterator, Optional, Tuple
+
+# Number of files whose line offsets are kept in memory
+MAX_INDEXED_FILES = 32
+
+# Size of the chunks yielded when streaming a range
+CHUNK_SIZE = 1024 * 1024
+
+
+class LineIndex:
+    """Byte offsets of every line start in a file, read through a memory map"""
+
+    def __init__(self, path: str):
+        """
+        Scan the file once and record where each line starts
+
+        Args:
+            path: The file to index
+        """
+        st = os.stat(path)
+        self.path = path
+        self.version = (st.st_mtime_ns, st.st_size)
+        self.size = st.st_size
+        self.offsets = array("q")
+
+        # mmap refuses empty files, which have no lines anyway
+        if self.size:
+            self.offsets.append(0)
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = mm.find(b"\n")
+                while pos != -1:
+                    self.offsets.append(pos + 1)
+                    pos = mm.find(b"\n", pos + 1)
+
+            # A trailing newline doesn't start another line
+            if self.offsets[-1] == self.size:
+                self.offsets.pop()
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines in the file"""
+        return len(self.offsets)
+
+    def byte_span(self, start: int, end: int) -> Tuple[int, int]:
+        """
+        Return the byte span covering a range of lines
+
+        Args:
+            start: First line, 0-based
+            end: Line after the last one, 0-based
+
+        Returns:
+            Tuple of (start offset, end offset)
+        """
+        start = min(max(start, 0), self.line_count)
+        end = min(max(end, start), self.line_count)
+        if start == end:
+            return 0, 0
+        stop = self.offsets[end] if end < self.line_count else self.size
+        return self.offsets[start], stop
+
+
+def read_bytes(path: str, start: int, end: int) -> bytes:
+    """
+    Read a byte range from a file through a memory map
+
+    Args:
+        path: The file to read
+        start: First byte offset
+        end: Offset after the last byte
+
+    Returns:
+        The bytes in the range
+    """
+    if end <= start:
+        return b""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return mm[start:end]
+
+
+def iter_bytes(path: str, start: int, end: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yield a byte range from a file in chunks, without loading all of it
+
+    Args:
+        path: The file to read
+        start: First byte offset
+        end: Offset after the last byte
+        chunk_size: Maximum size of each chunk
+
+    Yields:
+        Consecutive chunks of the range
+    """
+    if end <= start:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for offset in range(start, end, chunk_size):
+            yield mm[offset:min(offset + chunk_size, end)]
+
+
+_indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def cached_line_index(path: str) -> Optional[LineIndex]:
+    """Return the line index kept for a file's current content, None if there is none"""
+    st = os.stat(path)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is not None and index.version == (st.st_mtime_ns, st.st_size):
+            _indexes.move_to_end(path)
+            return index
+    return None
+
+
+def get_line_index(path: str) -> LineIndex:
+    """
+    Return the line index for a file, rebuilding it only when the file changed
+
+    Args:
+        path: The file to index
+
+    Returns:
+        The LineIndex for the file's current content
+    """
+    index = cached_line_index(path)
+    if index is not None:
+        return index
+
+    index = LineIndex(path)
+    with _indexes_lock:
+        _indexes[path] = index
+        _indexes.move_to_end(path)
+        while len(_indexes) > MAX_INDEXED_FILES:
+            _indexes.popitem(last=False)
+    return index
+
+
+async def load_line_index(path: str) -> LineIndex:
+    """
+    Return the line index for a file, see get_line_index
+
+    Building an index scans the whole file, so a missing or outdated one is
+    built in a thread instead of blocking the event loop.
+    """
+    index = cached_line_index(path)
+    if index is None:
+        index = await asyncio.get_running_loop().run_in_executor(None, get_line_index, path)
+    return index
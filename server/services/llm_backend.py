@@ -0,0 +1,90 @@
+from typing import Any, Dict, Optional
+from core.config import AI_BASE_URL, AI_PROVIDER, OPENAI_API_KEY
+
+
+class ChatBackend:
+    """An OpenAI-compatible chat completions API that AI commands are sent to"""
+
+    def __init__(self, provider: str, base_url: str, api_key: str = "", requires_key: bool = True):
+        """
+        Args:
+            provider: Name of the provider, see PROVIDERS
+            base_url: API root the /chat/completions path is appended to
+            api_key: Bearer token sent with every request
+            requires_key: Whether requests are refused while no key is configured
+        """
+        self.provider = provider
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.requires_key = requires_key
+
+    @property
+    def chat_url(self) -> str:
+        return f"{self.base_url}/chat/completions"
+
+    def missing_key_error(self) -> Optional[str]:
+        """Return the error to report when a key is needed but not configured, else None"""
+        if self.requires_key and not self.api_key:
+            return "Error: OpenAI API key not configured. Set the OPENAI_API_KEY environment variable."
+        return None
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def payload(self, prompt: str, model: str, temperature: float, max_tokens: int,
+                stream: bool = False) -> Dict[str, Any]:
+        """Build the request body for a single-prompt completion"""
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def cache_model(self, model: str) -> str:
+        """Return the model name used in cache keys, so answers from different backends never mix"""
+        if self.provider == "openai":
+            return model
+        return f"{self.provider}:{self.base_url}:{model}"
+
+
+# Default base URL and whether an API key is required, per provider
+PROVIDERS = {
+    # api.openai.com
+    "openai": ("https://api.openai.com/v1", True),
+    # Any server speaking the OpenAI chat completions protocol (vLLM, Ollama, LiteLLM, ...)
+    "compatible": ("http://127.0.0.1:8000/v1", False),
+    # The bundled mock server, tools/mock_openai.py
+    "mock": ("http://127.0.0.1:8001/v1", False),
+}
+
+
+def create_backend(provider: str, base_url: str = "", api_key: str = "") -> ChatBackend:
+    """
+    Create the backend for a provider
+
+    Args:
+        provider: One of PROVIDERS
+        base_url: API root, the provider's default if empty
+        api_key: Bearer token for the API
+
+    Returns:
+        The backend
+
+    Raises:
+        ValueError: If the provider is unknown
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown AI provider: {provider} (use {', '.join(PROVIDERS)})")
+    default_url, requires_key = PROVIDERS[provider]
+    return ChatBackend(provider, base_url or default_url, api_key, requires_key)
+
+
+# Backend the AI commands use, chosen by AI_PROVIDER and AI_BASE_URL
+llm_backend = create_backend(AI_PROVIDER, AI_BASE_URL, OPENAI_API_KEY)
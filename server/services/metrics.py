@@ -0,0 +1,182 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Timing breakdown of the current request, when one was asked for (see collect_timings)
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("timings", default=None)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """A monotonically increasing count, per combination of label values"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, per combination of label values"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> (count per bucket, sum, count)
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket = _format_labels(self.labels, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            bucket = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics exported in the Prometheus text format"""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: List[Any] = []
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(self.prefix + name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(self.prefix + name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, gauges: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """
+        Return every metric in the Prometheus text exposition format
+
+        Args:
+            gauges: Point-in-time values to export as well, as {group: {name: value}},
+                e.g. the /api/stats dictionaries; values that aren't numbers are skipped
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for group, values in (gauges or {}).items():
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"{self.prefix}{group}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of the whole application, served at /metrics
+metrics = MetricsRegistry("terminal_")
+
+COMMANDS = metrics.counter("commands_total", "Terminal commands run, by command and outcome", ("command", "status"))
+COMMAND_SECONDS = metrics.histogram("command_duration_seconds", "Time to run a terminal command", ("command",))
+STAGE_SECONDS = metrics.histogram("stage_duration_seconds", "Time spent in each stage of handling a command",
+                                  ("stage",))
+SUBPROCESS_SPAWNS = metrics.counter("subprocess_spawns_total", "Processes started, by kind", ("kind",))
+SCRIPT_RUNS = metrics.counter("script_runs_total", "Python files run, by runner", ("runner",))
+CODE_STREAMS = metrics.counter("ai_code_streams_total", "Code generations streamed into a file, by how they ended",
+                               ("outcome",))
+CODE_CANDIDATES = metrics.counter("ai_code_candidates_total",
+                                  "Code candidates generated in parallel, by whether they were chosen, "
+                                  "rejected or cancelled once another passed", ("outcome",))
+
+
+def record(stage: str, seconds: float) -> None:
+    """Record time spent in a stage, in the stage histogram and the current timing breakdown"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds * 1000
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the block as a stage, see record"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """
+    Collect the stages recorded while the block runs
+
+    Yields:
+        Milliseconds spent per stage, filled in as stages complete; stages
+        run more than once (e.g. retried requests) are added up
+    """
+    timings: Dict[str, float] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def observe_command(name: str, status: int, seconds: float) -> None:
+    """Count a finished command and record its duration"""
+    COMMANDS.inc(command=name, status="ok" if status == 0 else "error")
+    COMMAND_SECONDS.observe(seconds, command=name)
+    record("command", seconds)
@@ -0,0 +1,119 @@
+/*
+ * Persistent Node.js REPL kernel used by services/kernels.py
+ *
+ * Reads one JSON request per line from stdin, evaluates the code in a vm
+ * context that is kept between requests and writes one JSON result per line
+ * to stdout. Like the node REPL, the value of the last expression is printed
+ * and a returned promise is awaited. Console and process.stdout/stderr output
+ * is captured per request.
+ */
+const fs = require('fs');
+const readline = require('readline');
+const util = require('util');
+const vm = require('vm');
+
+let captured = { stdout: [], stderr: [] };
+
+const capture = (stream) => (chunk, encoding, callback) => {
+  captured[stream].push(typeof chunk === 'string' ? chunk : Buffer.from(chunk).toString('utf8'));
+  if (typeof encoding === 'function') encoding();
+  if (typeof callback === 'function') callback();
+  return true;
+};
+
+// Evaluated code must not write to the protocol channel
+process.stdout.write = capture('stdout');
+process.stderr.write = capture('stderr');
+
+const kernelConsole = new console.Console({ stdout: process.stdout, stderr: process.stderr });
+
+const sandbox = {
+  console: kernelConsole,
+  require,
+  process,
+  Buffer,
+  URL,
+  URLSearchParams,
+  TextEncoder,
+  TextDecoder,
+  setTimeout,
+  clearTimeout,
+  setInterval,
+  clearInterval,
+  setImmediate,
+  clearImmediate,
+  module: { exports: {} },
+};
+sandbox.global = sandbox;
+const context = vm.createContext(sandbox);
+
+const send = (message) => {
+  fs.writeSync(1, JSON.stringify(message) + '\n');
+};
+
+const withTimeout = (promise, ms) => {
+  let timer;
+  const expired = new Promise((_, reject) => {
+    timer = setTimeout(() => reject(new Error(`Promise not settled after ${ms} ms`)), ms);
+  });
+  return Promise.race([promise, expired]).finally(() => clearTimeout(timer));
+};
+
+const evaluate = async (request) => {
+  const timeout = Math.max(1, Math.round((request.timeout || 10) * 1000));
+  let status = 0;
+  try {
+    if (request.cwd) {
+      try {
+        process.chdir(request.cwd);
+      } catch (e) {
+        // Keep the previous directory
+      }
+    }
+    let value = vm.runInContext(request.code || '', context, {
+      filename: '<input>',
+      timeout,
+      breakOnSigint: true,
+    });
+    if (value && typeof value.then === 'function') {
+      value = await withTimeout(value, timeout);
+    }
+    if (value !== undefined) {
+      sandbox._ = value;
+      captured.stdout.push(util.inspect(value, { colors: false }) + '\n');
+    }
+  } catch (e) {
+    status = 1;
+    captured.stderr.push(((e && e.stack) || String(e)) + '\n');
+  }
+  return status;
+};
+
+const clip = (text, room) => {
+  const data = Buffer.from(text, 'utf8');
+  if (room === null || data.length <= room) return [text, 0, data.length];
+  return [data.subarray(0, room).toString('utf8'), data.length - room, room];
+};
+
+const main = async () => {
+  send({ ready: true });
+  const lines = readline.createInterface({ input: process.stdin, terminal: false });
+  for await (const line of lines) {
+    let request;
+    try {
+      request = JSON.parse(line);
+    } catch (e) {
+      continue;
+    }
+    captured = { stdout: [], stderr: [] };
+    const status = await evaluate(request);
+
+    const maxBytes = request.max_output_bytes === undefined ? null : request.max_output_bytes;
+    const [stdout, omittedOut, used] = clip(captured.stdout.join(''), maxBytes);
+    const [stderr, omittedErr] = clip(captured.stderr.join(''), maxBytes === null ? null : maxBytes - used);
+    captured = { stdout: [], stderr: [] };
+    send({ status, stdout, stderr, omitted_bytes: omittedOut + omittedErr });
+  }
+};
+
+main();
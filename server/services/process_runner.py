@@ -0,0 +1,233 @@
+import asyncio
+import codecs
+import os
+import signal
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from core.config import MAX_CONCURRENT_PROCESSES, OUTPUT_MAX_BYTES
+from services.metrics import SUBPROCESS_SPAWNS, span
+
+logger = logging.getLogger("terminal-api")
+
+# Semaphore limiting concurrent subprocesses, created lazily per event loop
+_semaphore: Optional[asyncio.Semaphore] = None
+_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Size of each read from a process pipe
+READ_CHUNK_SIZE = 64 * 1024
+
+# Callback receiving ("stdout" | "stderr", text) as output is produced
+OutputCallback = Callable[[str, str], Awaitable[None]]
+
+
+@dataclass
+class ProcessResult:
+    """Result of a finished (or killed) subprocess"""
+    returncode: int
+    stdout: str = ""
+    stderr: str = ""
+    timed_out: bool = False
+    # stdout and stderr interleaved in the order they were produced
+    output: str = ""
+    # Bytes produced beyond the capture limit and not kept
+    omitted_bytes: int = 0
+
+    @property
+    def truncated(self) -> bool:
+        """Whether output beyond the capture limit was dropped"""
+        return self.omitted_bytes > 0
+
+    def truncation_marker(self) -> str:
+        """
+        Return a note describing truncated output, or "" if nothing was dropped
+        """
+        if not self.truncated:
+            return ""
+        return f"\n... [output truncated: {self.omitted_bytes} more bytes not shown]\n"
+
+
+class _OutputCapture:
+    """Collects process output incrementally up to a byte limit"""
+
+    def __init__(self, max_bytes: Optional[int], on_output: Optional[OutputCallback]):
+        self.max_bytes = max_bytes
+        self.on_output = on_output
+        self.captured = 0
+        self.omitted = 0
+        self.parts: Dict[str, List[str]] = {"stdout": [], "stderr": []}
+        self.interleaved: List[str] = []
+
+    async def read(self, stream_name: str, reader: asyncio.StreamReader) -> None:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            data = await reader.read(READ_CHUNK_SIZE)
+            final = not data
+
+            # Keep only what still fits under the limit, but always drain the pipe
+            if self.max_bytes is not None:
+                room = max(self.max_bytes - self.captured, 0)
+                self.omitted += max(len(data) - room, 0)
+                data = data[:room]
+            self.captured += len(data)
+
+            text = decoder.decode(data, final=final)
+            if text:
+                self.parts[stream_name].append(text)
+                self.interleaved.append(text)
+                if self.on_output is not None:
+                    await self.on_output(stream_name, text)
+            if final:
+                return
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """
+    Return the process semaphore for the running event loop
+
+    Returns:
+        The semaphore bounding concurrent subprocesses
+    """
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_PROCESSES)
+        _semaphore_loop = loop
+    return _semaphore
+
+
+async def _kill(process: asyncio.subprocess.Process) -> None:
+    """
+    Kill a subprocess together with any children it spawned
+
+    Args:
+        process: The process to kill
+    """
+    if process.returncode is not None:
+        return
+    try:
+        # The process runs in its own session, so kill the whole group
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+    await process.wait()
+
+
+async def run_process(args: List[str],
+                      timeout: float,
+                      cwd: Optional[str] = None,
+                      env: Optional[Dict[str, str]] = None,
+                      max_output_bytes: Optional[int] = OUTPUT_MAX_BYTES,
+                      on_output: Optional[OutputCallback] = None) -> ProcessResult:
+    """
+    Run a command without blocking the event loop
+
+    Output is read incrementally as it is produced. At most max_output_bytes
+    (stdout and stderr combined) are kept, anything beyond is counted and
+    discarded so a chatty command can't exhaust memory.
+
+    Args:
+        args: The command and its arguments
+        timeout: Seconds to wait before the process is killed
+        cwd: Optional working directory
+        env: Optional environment for the process
+        max_output_bytes: Capture limit, None for no limit
+        on_output: Optional callback receiving each piece of output as it arrives
+
+    Returns:
+        ProcessResult with the captured output and exit code
+    """
+    async with _get_semaphore():
+        with span("process.spawn"):
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd,
+                env=env,
+                start_new_session=True,
+            )
+        SUBPROCESS_SPAWNS.inc(kind="command")
+
+        capture = _OutputCapture(max_output_bytes, on_output)
+        timed_out = False
+        io = asyncio.gather(
+            capture.read("stdout", process.stdout),
+            capture.read("stderr", process.stderr),
+            process.wait(),
+        )
+        # Mark the result as seen, so cancelling or timing out doesn't log an unretrieved exception
+        io.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            await asyncio.wait_for(io, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Process timed out after {timeout} seconds: {args[0]}")
+            timed_out = True
+            await _kill(process)
+        except asyncio.CancelledError:
+            # The client went away, don't leave the process running
+            await _kill(process)
+            raise
+
+        return ProcessResult(
+            returncode=124 if timed_out else process.returncode,
+            stdout="".join(capture.parts["stdout"]),
+            stderr="".join(capture.parts["stderr"]),
+            timed_out=timed_out,
+            output="".join(capture.interleaved),
+            omitted_bytes=capture.omitted,
+        )
+
+
+async def stream_process(args: List[str],
+                         timeout: float,
+                         cwd: Optional[str] = None,
+                         env: Optional[Dict[str, str]] = None,
+                         max_output_bytes: Optional[int] = OUTPUT_MAX_BYTES
+                         ) -> AsyncIterator[Union[Tuple[str, str], ProcessResult]]:
+    """
+    Run a command and yield its output while it runs
+
+    Args:
+        args: The command and its arguments
+        timeout: Seconds to wait before the process is killed
+        cwd: Optional working directory
+        env: Optional environment for the process
+        max_output_bytes: Output limit, None for no limit
+
+    Yields:
+        ("stdout" | "stderr", text) tuples in the order the output is
+        produced, followed by the final ProcessResult
+    """
+    # A small queue applies backpressure: a slow client pauses reading from the pipes
+    queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+
+    async def forward(stream_name: str, text: str) -> None:
+        await queue.put((stream_name, text))
+
+    task = asyncio.ensure_future(
+        run_process(args, timeout, cwd=cwd, env=env, max_output_bytes=max_output_bytes, on_output=forward)
+    )
+    getter: Optional[asyncio.Future] = None
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+                continue
+            getter.cancel()
+            break
+
+        while not queue.empty():
+            yield queue.get_nowait()
+        yield task.result()
+    finally:
+        if getter is not None:
+            getter.cancel()
+        if not task.done():
+            task.cancel()
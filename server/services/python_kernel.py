@@ -0,0 +1,116 @@
+"""
+Persistent Python REPL kernel used by services.kernels
+
+Run as a standalone script. The kernel reads one JSON request per line from
+stdin, evaluates the code in a namespace that is kept between requests and
+writes one JSON result per line to stdout. Like the interactive interpreter,
+the value of a trailing expression is printed. Output is captured at the file
+descriptor level, so output of C extensions and child processes is included.
+SIGINT interrupts the running code without losing the namespace.
+"""
+import ast
+import json
+import os
+import sys
+import tempfile
+import traceback
+
+# File name shown in tracebacks for evaluated code
+INPUT_NAME = "<input>"
+
+
+def _limit_memory(memory_limit_mb: int) -> None:
+    if memory_limit_mb > 0:
+        try:
+            import resource
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            pass
+
+
+def _evaluate(source: str, namespace: dict) -> int:
+    """Run the code, printing the value of a trailing expression; returns the status"""
+    try:
+        tree = ast.parse(source, INPUT_NAME, "exec")
+        last = None
+        if tree.body and isinstance(tree.body[-1], ast.Expr):
+            last = ast.Expression(tree.body.pop().value)
+        exec(compile(tree, INPUT_NAME, "exec"), namespace)
+        if last is not None:
+            value = eval(compile(last, INPUT_NAME, "eval"), namespace)
+            if value is not None:
+                namespace["_"] = value
+                print(repr(value))
+        return 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        etype, value, tb = sys.exc_info()
+        # Drop the kernel's own frame so the traceback starts at the user's code
+        if tb is not None and tb.tb_frame.f_code.co_filename == __file__:
+            tb = tb.tb_next
+        traceback.print_exception(etype, value, tb)
+        return 1
+
+
+def _collect(fd: int, max_bytes) -> tuple:
+    """Return (text, bytes kept, bytes omitted) written to a capture file, then empty it"""
+    size = os.fstat(fd).st_size
+    keep = size if max_bytes is None else min(size, max(max_bytes, 0))
+    data = os.pread(fd, keep, 0) if keep else b""
+    os.ftruncate(fd, 0)
+    os.lseek(fd, 0, os.SEEK_SET)
+    return data.decode("utf-8", errors="replace"), keep, size - keep
+
+
+def main() -> None:
+    _limit_memory(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+
+    # Keep private copies of the protocol channels, then point the standard
+    # descriptors at capture files (and stdin at /dev/null) for evaluated code
+    channel_in = os.fdopen(os.dup(0), "rb")
+    channel_out = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    for fd in (1, 2):
+        capture = tempfile.TemporaryFile()
+        os.dup2(capture.fileno(), fd)
+        capture.close()
+
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    channel_out.write(b'{"ready": true}\n')
+    channel_out.flush()
+
+    while True:
+        try:
+            line = channel_in.readline()
+            if not line:
+                return
+            request = json.loads(line)
+            if request.get("cwd"):
+                try:
+                    os.chdir(request["cwd"])
+                except OSError:
+                    pass
+
+            status = _evaluate(request.get("code", ""), namespace)
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+            # The output limit covers stdout and stderr together
+            max_bytes = request.get("max_output_bytes")
+            stdout, kept, omitted_out = _collect(1, max_bytes)
+            stderr, _, omitted_err = _collect(2, None if max_bytes is None else max_bytes - kept)
+            result = {"status": status, "stdout": stdout, "stderr": stderr,
+                      "omitted_bytes": omitted_out + omitted_err}
+            channel_out.write(json.dumps(result).encode("utf-8") + b"\n")
+            channel_out.flush()
+        except KeyboardInterrupt:
+            # An interrupt that arrived between requests
+            continue
+
+
+if __name__ == "__main__":
+    main()
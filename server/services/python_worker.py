@@ -0,0 +1,213 @@
+"""
+Pre-warmed Python worker used by services.worker_pool
+
+Run as a standalone script. The worker imports commonly used modules once,
+then reads one JSON request per line from stdin, runs the requested file in
+a forked child (so every run starts from the warm, clean interpreter state)
+and writes one JSON result per line to stdout, preceded by a line with the
+child's pid once it has started. When the request carries a
+precompiled code object the child executes it directly instead of parsing
+the source again.
+"""
+import builtins
+import io
+import json
+import marshal
+import os
+import selectors
+import signal
+import sys
+import time
+import traceback
+import types
+
+# Modules generated scripts commonly import, loaded once before forking
+PRELOAD_MODULES = (
+    "argparse", "collections", "datetime", "functools", "itertools", "json",
+    "math", "random", "re", "runpy", "string", "textwrap", "typing",
+)
+
+
+def _preload() -> None:
+    for name in PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+
+def _load_code(code_path: str):
+    """Load a code object written by services.artifact_cache, or None"""
+    try:
+        with open(code_path, "rb") as f:
+            marshal.load(f)  # facts header
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def _exec_code(code, path: str) -> None:
+    """Execute a precompiled script as the __main__ module"""
+    module = types.ModuleType("__main__")
+    module.__file__ = path
+    module.__builtins__ = builtins
+    sys.modules["__main__"] = module
+    exec(code, module.__dict__)
+
+
+def _run_child(path: str, code_path: str, args: list, memory_limit_mb: int,
+               stdout_fd: int, stderr_fd: int) -> None:
+    """Body of the forked child: isolate, redirect output and run the script"""
+    import runpy
+
+    code = 0
+    try:
+        os.setsid()
+        if memory_limit_mb > 0:
+            import resource
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        sys.stdin = io.TextIOWrapper(os.fdopen(0, "rb"), encoding="utf-8")
+        sys.stdout = io.TextIOWrapper(os.fdopen(1, "wb"), encoding="utf-8", errors="replace")
+        sys.stderr = io.TextIOWrapper(os.fdopen(2, "wb"), encoding="utf-8", errors="replace",
+                                      line_buffering=True)
+        sys.argv = [path] + list(args)
+        sys.path[0] = os.path.dirname(path)
+
+        code_object = _load_code(code_path) if code_path else None
+        if code_object is not None:
+            _exec_code(code_object, path)
+        else:
+            runpy.run_path(path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        etype, value, tb = sys.exc_info()
+        # Hide the worker's own frames so the traceback looks like a normal run
+        while tb is not None and tb.tb_frame.f_code.co_filename != path:
+            tb = tb.tb_next
+        traceback.print_exception(etype, value, tb)
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _run(request: dict, channel_out) -> dict:
+    """Fork a child for one request and collect its output"""
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+        os.close(out_r)
+        os.close(err_r)
+        _run_child(request["path"], request.get("code_path"), request.get("args", []),
+                   request.get("memory_limit_mb", 0), out_w, err_w)
+
+    os.close(out_w)
+    os.close(err_w)
+    # The pool kills the child's process group itself if it stops waiting for the result
+    channel_out.write(json.dumps({"started": pid}).encode("utf-8") + b"\n")
+    channel_out.flush()
+
+    deadline = time.monotonic() + request.get("timeout", 10)
+    max_bytes = request.get("max_output_bytes")
+    captured = 0
+    omitted = 0
+    chunks = {out_r: [], err_r: []}
+    selector = selectors.DefaultSelector()
+    selector.register(out_r, selectors.EVENT_READ)
+    selector.register(err_r, selectors.EVENT_READ)
+    timed_out = False
+
+    while selector.get_map():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in selector.select(remaining):
+            data = os.read(key.fd, 65536)
+            if not data:
+                selector.unregister(key.fd)
+                continue
+            # Keep only what fits under the limit, but keep draining the pipe
+            if max_bytes is not None:
+                room = max(max_bytes - captured, 0)
+                omitted += max(len(data) - room, 0)
+                data = data[:room]
+            captured += len(data)
+            if data:
+                chunks[key.fd].append(data)
+
+    # Output is closed, but the child may still be running
+    status = None
+    while not timed_out:
+        waited, status = os.waitpid(pid, os.WNOHANG)
+        if waited:
+            break
+        if time.monotonic() >= deadline:
+            timed_out = True
+            break
+        time.sleep(0.005)
+
+    if timed_out:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        _, status = os.waitpid(pid, 0)
+
+    selector.close()
+    os.close(out_r)
+    os.close(err_r)
+
+    return {
+        "returncode": 124 if timed_out else _exit_code(status),
+        "stdout": b"".join(chunks[out_r]).decode("utf-8", errors="replace"),
+        "stderr": b"".join(chunks[err_r]).decode("utf-8", errors="replace"),
+        "timed_out": timed_out,
+        "omitted_bytes": omitted,
+    }
+
+
+def main() -> None:
+    _preload()
+    channel_in = sys.stdin.buffer
+    channel_out = sys.stdout.buffer
+
+    channel_out.write(b'{"ready": true}\n')
+    channel_out.flush()
+
+    for line in channel_in:
+        try:
+            result = _run(json.loads(line), channel_out)
+        except Exception as e:
+            result = {"returncode": 1, "stdout": "", "stderr": f"Worker error: {e}",
+                      "timed_out": False, "omitted_bytes": 0}
+        channel_out.write(json.dumps(result).encode("utf-8") + b"\n")
+        channel_out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Deque, Dict, Mapping, Optional
+from core.config import (
+    AI_BACKOFF_BASE,
+    AI_BACKOFF_MAX,
+    AI_MAX_IN_FLIGHT,
+    AI_MAX_RETRIES,
+    AI_REQUESTS_PER_MINUTE,
+    AI_TOKENS_PER_MINUTE,
+    SERVER_WORKERS,
+)
+from services.shared_state import SharedState, run_in_thread, shared_state
+
+logger = logging.getLogger("terminal-api")
+
+# Who the current request is made on behalf of; upstream slots are shared fairly between users
+current_user: ContextVar[str] = ContextVar("current_user", default="anonymous")
+
+# Upstream statuses worth retrying after a pause
+RETRYABLE_STATUSES = (408, 409, 429, 500, 502, 503, 504)
+
+# Seconds between exchanges of rate limit use with the other worker processes, while requests are active
+SHARED_SYNC_INTERVAL = 0.25
+
+
+class TokenBucket:
+    """Allows up to a number of units per minute, in bursts of at most a minute's worth"""
+
+    def __init__(self, per_minute: float):
+        """
+        Args:
+            per_minute: Units refilled per minute (0 for no limit)
+        """
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.available = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Return the seconds until amount units are available, 0 if they are now"""
+        if self.capacity <= 0:
+            return 0
+        self._refill()
+        # A request larger than the whole bucket waits for a full bucket instead of forever
+        missing = min(amount, self.capacity) - self.available
+        return missing / self.rate if missing > 0 else 0
+
+    def take(self, amount: float) -> None:
+        if self.capacity > 0:
+            self._refill()
+            self.available -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        """Return units that were taken but not used"""
+        if self.capacity > 0:
+            self._refill()
+            self.available = min(self.capacity, self.available + amount)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    A TokenBucket kept in the shared state, so its limit applies to all worker processes together
+
+    Decisions are made on an in-memory copy of the bucket, so the event loop
+    never waits for SQLite. sync() adds what this process used since the last
+    sync to the shared bucket and refreshes the copy from it. Between syncs
+    the processes together may go over the limit by what they take in that time.
+    """
+
+    def __init__(self, per_minute: float, state: SharedState, name: str):
+        """
+        Args:
+            per_minute: Units refilled per minute (0 for no limit)
+            state: Where the bucket is kept
+            name: The bucket's name in the shared state
+        """
+        super().__init__(per_minute)
+        self.state = state
+        self.name = name
+        # Units taken here (or given back, if negative) since the last sync
+        self.unsynced = 0.0
+
+    def take(self, amount: float) -> None:
+        super().take(amount)
+        if self.capacity > 0:
+            self.unsynced += min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        """Return units that were taken but not used"""
+        super().give_back(amount)
+        if self.capacity > 0:
+            self.unsynced -= amount
+
+    async def sync(self) -> None:
+        """Add this process's use to the shared bucket and refresh the copy, in a thread"""
+        if self.capacity <= 0:
+            return
+        used, self.unsynced = self.unsynced, 0.0
+        try:
+            available = await run_in_thread(self.state.adjust_bucket, self.name, -used, self.capacity, self.rate)
+        except BaseException:
+            self.unsynced += used
+            raise
+        # Anything taken while the shared bucket was being updated isn't in it yet
+        self.available = min(self.capacity, available - self.unsynced)
+        self._updated = time.monotonic()
+
+
+class UpstreamScheduler:
+    """
+    Admits requests to the upstream API within a concurrency limit and
+    request and token rate limits, serving waiting users round-robin
+    """
+
+    def __init__(self,
+                 max_in_flight: int = 8,
+                 requests_per_minute: float = 0,
+                 tokens_per_minute: float = 0,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 30,
+                 state: Optional[SharedState] = None):
+        """
+        Args:
+            max_in_flight: Requests allowed upstream at the same time
+            requests_per_minute: Request rate limit (0 for no limit)
+            tokens_per_minute: Token rate limit (0 for no limit)
+            max_retries: Retries of a throttled or failed request
+            backoff_base: First retry delay in seconds, doubled for every further retry
+            backoff_max: Longest retry delay in seconds
+            state: Shared state of a multi-process server; the rate limits and pauses then
+                apply to all processes together, the concurrency limit still to each one
+        """
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.state = state
+        if state is not None:
+            self.requests: TokenBucket = SharedTokenBucket(requests_per_minute, state, "upstream_requests")
+            self.tokens: TokenBucket = SharedTokenBucket(tokens_per_minute, state, "upstream_tokens")
+        else:
+            self.requests = TokenBucket(requests_per_minute)
+            self.tokens = TokenBucket(tokens_per_minute)
+        self.in_flight = 0
+        # Waiting requests per user, as (future, tokens); users take turns in this order
+        self._waiting: "OrderedDict[str, Deque[Any]]" = OrderedDict()
+        # No request is admitted before this time, set when upstream asks us to back off
+        self._paused_until = 0.0
+        # The same for all processes (seconds since the epoch), as of the last sync with the shared state
+        self._shared_paused_until = 0.0
+        self._syncer: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self.admitted = 0
+        self.retries = 0
+        self.throttled = 0
+
+    def _schedule_wakeup(self, delay: float) -> None:
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+        self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _pause_remaining(self) -> float:
+        """Return the seconds left of a pause asked for by upstream"""
+        remaining = self._paused_until - time.monotonic()
+        if self.state is not None:
+            remaining = max(remaining, self._shared_paused_until - time.time())
+        return remaining
+
+    async def _sync(self) -> None:
+        """Exchange rate limit use and pauses with the other worker processes"""
+        await self.requests.sync()
+        await self.tokens.sync()
+        self._shared_paused_until = await run_in_thread(self.state.get_time, "upstream_paused_until")
+
+    async def _sync_periodically(self) -> None:
+        """Keep syncing while requests are waiting or in flight, then stop until the next one"""
+        while True:
+            await asyncio.sleep(SHARED_SYNC_INTERVAL)
+            try:
+                await self._sync()
+            except Exception as e:
+                logger.warning(f"Error syncing shared rate limits: {str(e)}")
+            self._dispatch()
+            if not self._waiting and not self.in_flight and not self.requests.unsynced and not self.tokens.unsynced:
+                return
+
+    async def _start_sync(self) -> None:
+        """Sync with the other processes before admitting a request, unless syncs are already running"""
+        if self._syncer is not None and not self._syncer.done():
+            return
+        try:
+            await self._sync()
+        except Exception as e:
+            logger.warning(f"Error syncing shared rate limits: {str(e)}")
+        if self._syncer is None or self._syncer.done():
+            self._syncer = asyncio.ensure_future(self._sync_periodically())
+
+    async def _share_pause(self, until: float) -> None:
+        try:
+            await run_in_thread(self.state.extend_time, "upstream_paused_until", until)
+        except Exception as e:
+            logger.warning(f"Error sharing upstream pause: {str(e)}")
+
+    def _dispatch(self) -> None:
+        """Admit waiting requests, one user at a time, while limits allow"""
+        self._wakeup = None
+        while self._waiting and self.in_flight < self.max_in_flight:
+            user, queue = next(iter(self._waiting.items()))
+            future, tokens = queue[0]
+            if future.done():
+                # Cancelled while waiting
+                queue.popleft()
+                if not queue:
+                    del self._waiting[user]
+                continue
+
+            delay = max(self._pause_remaining(), self.requests.delay(1), self.tokens.delay(tokens))
+            if delay > 0:
+                self._schedule_wakeup(delay)
+                return
+
+            queue.popleft()
+            # The user goes to the back of the line
+            del self._waiting[user]
+            if queue:
+                self._waiting[user] = queue
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            self.admitted += 1
+            future.set_result(None)
+
+    async def _acquire(self, tokens: int, user: str) -> None:
+        if self.state is not None:
+            await self._start_sync()
+        future = asyncio.get_running_loop().create_future()
+        queue = self._waiting.get(user)
+        if queue is None:
+            queue = self._waiting[user] = deque()
+        queue.append((future, tokens))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller gave up
+                self._release()
+            elif (future, tokens) in queue:
+                queue.remove((future, tokens))
+                if not queue and self._waiting.get(user) is queue:
+                    del self._waiting[user]
+            raise
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0, user: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        Wait for a turn to send one upstream request, held until the block exits
+
+        Args:
+            tokens: Estimated tokens the request will use
+            user: Whose request it is, the current user by default
+        """
+        await self._acquire(tokens, user or current_user.get())
+        try:
+            yield
+        finally:
+            self._release()
+
+    def settle(self, estimated: int, used: int) -> None:
+        """Correct the token bucket once a request's actual usage is known"""
+        if used < estimated:
+            self.tokens.give_back(estimated - used)
+        elif used > estimated:
+            self.tokens.take(used - estimated)
+
+    def pause(self, seconds: float) -> None:
+        """Admit no requests for a while, e.g. after upstream answered 429"""
+        self.throttled += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self.state is not None:
+            # The other processes share the quota that ran out
+            until = time.time() + seconds
+            self._shared_paused_until = max(self._shared_paused_until, until)
+            asyncio.ensure_future(self._share_pause(until))
+        logger.warning(f"Upstream throttled, pausing requests for {seconds:.1f}s")
+
+    @staticmethod
+    def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+        """
+        Return the delay upstream asked for, in seconds
+
+        Understands retry-after-ms as well as Retry-After in seconds or as an HTTP date.
+        """
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            try:
+                return max(float(value) / 1000, 0)
+            except ValueError:
+                pass
+        value = headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Return how long to wait before retrying
+
+        Args:
+            attempt: Number of retries already made
+            retry_after: Delay upstream asked for, if any
+
+        Returns:
+            Seconds to wait: the requested delay plus a little jitter, or
+            otherwise a random delay up to an exponentially growing limit
+        """
+        self.retries += 1
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return scheduler counters"""
+        return {
+            "in_flight": self.in_flight,
+            "waiting": sum(len(queue) for queue in self._waiting.values()),
+            "waiting_users": len(self._waiting),
+            "admitted": self.admitted,
+            "retries": self.retries,
+            "throttled": self.throttled,
+        }
+
+
+# Shared limits for requests to the OpenAI API; with several worker processes
+# each one gets its share of the concurrency limit
+upstream_scheduler = UpstreamScheduler(
+    max(AI_MAX_IN_FLIGHT // SERVER_WORKERS, 1),
+    AI_REQUESTS_PER_MINUTE,
+    AI_TOKENS_PER_MINUTE,
+    AI_MAX_RETRIES,
+    AI_BACKOFF_BASE,
+    AI_BACKOFF_MAX,
+    shared_state,
+)
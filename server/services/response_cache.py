@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from core.config import AI_CACHE_ENABLED, AI_CACHE_MAX_ENTRIES, AI_CACHE_TTL, AI_CACHE_PATH
+
+logger = logging.getLogger("terminal-api")
+
+
+class ResponseCache:
+    """Two-tier cache for AI responses: an in-memory LRU plus an optional SQLite file"""
+
+    def __init__(self,
+                 enabled: bool = True,
+                 max_entries: int = 256,
+                 ttl: float = 3600,
+                 path: str = ""):
+        """
+        Args:
+            enabled: Whether the cache stores and returns anything
+            max_entries: Maximum number of entries kept in memory
+            ttl: Seconds an entry stays valid
+            path: SQLite file for the on-disk tier (empty disables it)
+        """
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    @staticmethod
+    def make_key(model: str, prompt: str, temperature: float, max_tokens: int) -> str:
+        """
+        Build the cache key for a request
+
+        Args:
+            model: The model name
+            prompt: The full prompt sent to the model
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens in the response
+
+        Returns:
+            A hex digest identifying the request
+        """
+        raw = json.dumps([model, prompt, temperature, max_tokens])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the on-disk tier, creating the table on first use"""
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            # Worker processes of a multi-process server read and write the file at the same time
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+        return self._db
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, str]]:
+        with self._db_lock:
+            row = self._connect().execute(
+                "SELECT expires_at, value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[0] < time.time():
+            return None
+        return row[0], row[1]
+
+    def _disk_set(self, key: str, value: str, expires_at: float) -> None:
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            db.commit()
+
+    def _remember(self, key: str, expires_at: float, value: str) -> None:
+        """Put an entry in the memory tier, evicting the least recently used ones"""
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response
+
+        Args:
+            key: Key from make_key
+
+        Returns:
+            The cached response text, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry[0] >= time.time():
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._memory[key]
+
+        if self.path:
+            try:
+                entry = await asyncio.get_running_loop().run_in_executor(None, self._disk_get, key)
+            except Exception as e:
+                logger.warning(f"AI cache disk lookup failed: {str(e)}")
+                entry = None
+            if entry is not None:
+                self._remember(key, *entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry[1]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        """
+        Store a response
+
+        Args:
+            key: Key from make_key
+            value: The response text
+        """
+        if not self.enabled:
+            return
+
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, value)
+
+        if self.path:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._disk_set, key, value, expires_at
+                )
+            except Exception as e:
+                logger.warning(f"AI cache disk write failed: {str(e)}")
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers"""
+        self._memory.clear()
+        if self.path:
+            with self._db_lock:
+                db = self._connect()
+                db.execute("DELETE FROM responses")
+                db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return hit/miss counters for the cache
+
+        Returns:
+            Dictionary of cache statistics
+        """
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Shared cache used by AIService
+response_cache = ResponseCache(
+    enabled=AI_CACHE_ENABLED,
+    max_entries=AI_CACHE_MAX_ENTRIES,
+    ttl=AI_CACHE_TTL,
+    path=AI_CACHE_PATH,
+)
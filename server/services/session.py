@@ -0,0 +1,366 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+from core.config import MAX_SESSIONS, SESSION_HISTORY_SIZE, SESSION_IDLE_TIMEOUT, SHARED_STATE_PATH
+from services.kernels import kernel_manager
+from services.shared_state import SharedState, run_in_thread, shared_state
+
+logger = logging.getLogger("terminal-api")
+
+# How often idle sessions are looked for, in seconds
+REAP_INTERVAL = 60
+
+# Seconds a worker process's lease on a session lasts; it is renewed while commands run
+SESSION_LEASE_TTL = 30
+# Seconds between attempts to take a session's lease held by another worker process
+SESSION_LEASE_POLL = 0.05
+
+
+class TerminalSession:
+    """State kept for one terminal between commands"""
+
+    def __init__(self, session_id: str, cwd: Optional[str] = None):
+        """
+        Args:
+            session_id: Identifier the client uses to reconnect
+            cwd: Initial working directory, the server's by default
+        """
+        self.id = session_id
+        self.cwd = cwd or os.getcwd()
+        # Variables set with export, applied on top of the server environment
+        self.env: Dict[str, str] = {}
+        self.history: Deque[str] = deque(maxlen=SESSION_HISTORY_SIZE)
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        # When the state was last saved to or loaded from the session store
+        self.synced_at = 0.0
+        # Number of open connections using the session
+        self.connections = 0
+        # Serializes commands so they see each other's cd and export
+        self.lock = asyncio.Lock()
+
+    def touch(self) -> None:
+        """Mark the session as used now"""
+        self.last_used = time.monotonic()
+
+    def environment(self) -> Dict[str, str]:
+        """Return the environment processes started from this session run with"""
+        env = dict(os.environ)
+        env.update(self.env)
+        env["PWD"] = self.cwd
+        return env
+
+    def change_directory(self, path: str) -> None:
+        """
+        Change the session's working directory
+
+        Args:
+            path: Absolute path, or relative to the current directory; ~ is expanded
+
+        Raises:
+            FileNotFoundError: If the path does not exist
+            NotADirectoryError: If the path is not a directory
+        """
+        target = os.path.normpath(os.path.join(self.cwd, os.path.expanduser(path)))
+        if not os.path.exists(target):
+            raise FileNotFoundError(f"No such directory: {path}")
+        if not os.path.isdir(target):
+            raise NotADirectoryError(f"Not a directory: {path}")
+        self.cwd = target
+
+    async def close(self) -> None:
+        """Release everything the session holds, including its REPL kernels"""
+        self.history.clear()
+        await kernel_manager.stop(self.id)
+
+
+class SessionStore:
+    """
+    SQLite table of session state (working directory, environment and
+    history), so the worker processes of a multi-process server all see it
+
+    The methods block; SessionManager calls them through run_in_thread.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite file holding the sessions
+        """
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the store, creating the schema on first use"""
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "  id TEXT PRIMARY KEY,"
+                "  cwd TEXT NOT NULL,"
+                "  env TEXT NOT NULL,"
+                "  history TEXT NOT NULL,"
+                "  updated_at REAL NOT NULL"
+                ");"
+                "CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);"
+            )
+            self._db = db
+        return self._db
+
+    def save(self, session: TerminalSession) -> float:
+        """Store a session's state, returning the time it was stored at"""
+        updated_at = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO sessions (id, cwd, env, history, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (session.id, session.cwd, json.dumps(session.env), json.dumps(list(session.history)), updated_at)
+            )
+            db.commit()
+        return updated_at
+
+    def load(self, session_id: str) -> Optional[Tuple[str, Dict[str, str], Any, float]]:
+        """Return a session's (cwd, env, history, updated_at), or None if it isn't stored"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT cwd, env, history, updated_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), json.loads(row[2]), row[3]
+
+    def prune(self, before: float) -> int:
+        """Delete sessions not used since a time, returning how many were deleted"""
+        with self._lock:
+            db = self._connect()
+            cursor = db.execute("DELETE FROM sessions WHERE updated_at < ?", (before,))
+            db.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class SessionManager:
+    """Keeps terminal sessions alive between connections and reclaims idle ones"""
+
+    def __init__(self, max_sessions: int = 100, idle_timeout: float = 1800, store: Optional[SessionStore] = None,
+                 state: Optional[SharedState] = None):
+        """
+        Args:
+            max_sessions: Maximum number of sessions kept at once
+            idle_timeout: Seconds a session without connections is kept
+            store: Where session state is shared with other worker processes, if anywhere
+            state: Where the other worker processes are told a session is in use, if anywhere
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.store = store
+        self.state = state
+        self._sessions: "OrderedDict[str, TerminalSession]" = OrderedDict()
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def get(self, session_id: Optional[str]) -> Optional[TerminalSession]:
+        """
+        Return an existing session
+
+        Args:
+            session_id: The session identifier
+
+        Returns:
+            The session, or None if there is no such session
+        """
+        session = self._sessions.get(session_id) if session_id else None
+        if self.store is not None and session_id:
+            session = await self._load(session_id, session)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            session.touch()
+        return session
+
+    async def _load(self, session_id: str, session: Optional[TerminalSession]) -> Optional[TerminalSession]:
+        """Bring a session up to date with what other processes stored, picking it up if it is new here"""
+        row = await run_in_thread(self.store.load, session_id)
+        if row is None:
+            return session
+        cwd, env, history, updated_at = row
+        if session is None:
+            # Another request may have picked it up meanwhile
+            session = self._sessions.get(session_id)
+        if session is None:
+            session = TerminalSession(session_id, cwd)
+            self._sessions[session_id] = session
+        if updated_at > session.synced_at:
+            session.cwd, session.env = cwd, env
+            session.history = deque(history, maxlen=SESSION_HISTORY_SIZE)
+            session.synced_at = updated_at
+        return session
+
+    async def save(self, session: TerminalSession) -> None:
+        """Share a session's state with the other worker processes, if there are any"""
+        if self.store is not None:
+            session.synced_at = await run_in_thread(self.store.save, session)
+
+    @asynccontextmanager
+    async def use(self, session: TerminalSession, command: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        Hold the session for running commands, saving its state afterwards
+
+        With shared state, the session is also held against the other worker
+        processes, and its state is reloaded once it is, so that a command
+        sent to another worker meanwhile (e.g. cd or export) isn't lost.
+
+        Args:
+            session: The session
+            command: Command line to add to the history, if any
+        """
+        async with session.lock, self._lease(session):
+            if self.store is not None:
+                await self._load(session.id, session)
+            if command:
+                session.history.append(command)
+            try:
+                yield
+            finally:
+                await self.save(session)
+
+    @asynccontextmanager
+    async def _lease(self, session: TerminalSession) -> AsyncIterator[None]:
+        """Hold a session's lease in the shared state, waiting while another process holds it"""
+        if self.state is None:
+            yield
+            return
+        name = f"session:{session.id}"
+        owner = await run_in_thread(self.state.acquire_lease, name, SESSION_LEASE_TTL)
+        while owner is None:
+            await asyncio.sleep(SESSION_LEASE_POLL)
+            owner = await run_in_thread(self.state.acquire_lease, name, SESSION_LEASE_TTL)
+        renewer = asyncio.ensure_future(self._renew_lease(name, owner))
+        try:
+            yield
+        finally:
+            renewer.cancel()
+            await run_in_thread(self.state.release_lease, name, owner)
+
+    async def _renew_lease(self, name: str, owner: str) -> None:
+        """Keep a lease from expiring while long commands run"""
+        while True:
+            await asyncio.sleep(SESSION_LEASE_TTL / 3)
+            try:
+                if not await run_in_thread(self.state.renew_lease, name, owner, SESSION_LEASE_TTL):
+                    logger.warning(f"Lost the lease on {name}")
+                    return
+            except Exception as e:
+                logger.warning(f"Error renewing the lease on {name}: {str(e)}")
+
+    async def create(self) -> TerminalSession:
+        """
+        Create a new session, evicting the least recently used idle one if full
+
+        Returns:
+            The new session
+
+        Raises:
+            RuntimeError: If every session slot is held by an open connection
+        """
+        await self.reap()
+        if len(self._sessions) >= self.max_sessions:
+            idle = next((s for s in self._sessions.values() if s.connections == 0), None)
+            if idle is None:
+                raise RuntimeError("Too many active terminal sessions")
+            await self._close(idle)
+
+        session = TerminalSession(secrets.token_urlsafe(16))
+        self._sessions[session.id] = session
+        await self.save(session)
+        logger.info(f"Opened terminal session {session.id}")
+        return session
+
+    async def attach(self, session_id: Optional[str] = None) -> TerminalSession:
+        """
+        Resume a session for a new connection, or create one
+
+        Args:
+            session_id: Session to resume, None for a new one
+
+        Returns:
+            The attached session
+        """
+        session = await self.get(session_id) or await self.create()
+        session.connections += 1
+        return session
+
+    def detach(self, session: TerminalSession) -> None:
+        """
+        Release a connection's hold on a session; it is kept until it goes idle
+
+        Args:
+            session: The session the connection was using
+        """
+        session.connections = max(session.connections - 1, 0)
+        session.touch()
+
+    async def _close(self, session: TerminalSession) -> None:
+        self._sessions.pop(session.id, None)
+        try:
+            await session.close()
+        except Exception as e:
+            logger.warning(f"Error closing terminal session {session.id}: {str(e)}")
+        logger.info(f"Closed terminal session {session.id}")
+
+    async def reap(self) -> None:
+        """Close sessions without connections that have been idle too long"""
+        now = time.monotonic()
+        expired = [
+            s for s in self._sessions.values()
+            if s.connections == 0 and now - s.last_used > self.idle_timeout
+        ]
+        for session in expired:
+            await self._close(session)
+        if self.store is not None:
+            await run_in_thread(self.store.prune, time.time() - self.idle_timeout)
+
+    async def _reap_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            await self.reap()
+
+    def start(self) -> None:
+        """Start reclaiming idle sessions in the background"""
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.ensure_future(self._reap_periodically())
+
+    async def close(self) -> None:
+        """Stop the background reaper and close every session"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for session in list(self._sessions.values()):
+            await self._close(session)
+        if self.store is not None:
+            self.store.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Return session counts"""
+        return {
+            "sessions": len(self._sessions),
+            "connected": sum(1 for s in self._sessions.values() if s.connections > 0),
+        }
+
+
+# Shared terminal sessions
+session_manager = SessionManager(MAX_SESSIONS, SESSION_IDLE_TIMEOUT,
+                                 SessionStore(SHARED_STATE_PATH) if SHARED_STATE_PATH else None, shared_state)
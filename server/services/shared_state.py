@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional, TypeVar
+from core.config import SHARED_STATE_PATH
+
+logger = logging.getLogger("terminal-api")
+
+T = TypeVar("T")
+
+
+async def run_in_thread(function: Callable[..., T], *args: Any) -> T:
+    """
+    Run a blocking call, e.g. a SQLite statement, in the default executor
+
+    Statements on a file shared by several processes may wait (up to the
+    connection's timeout) for another process's write lock, which must not
+    stall the event loop.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+class SharedState:
+    """
+    SQLite file (in WAL mode) holding the state the worker processes of a
+    multi-process server share: leases on in-flight work, rate limit buckets
+    and timestamps. Every update is a single statement, so it is atomic
+    across processes.
+
+    The methods block, so code on the event loop calls them through run_in_thread.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite file shared by the worker processes
+        """
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the file, creating the schema on first use"""
+        if self._db is None:
+            db = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "  name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL"
+                ");"
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "  name TEXT PRIMARY KEY, available REAL NOT NULL, updated_at REAL NOT NULL"
+                ");"
+                "CREATE TABLE IF NOT EXISTS times (name TEXT PRIMARY KEY, value REAL NOT NULL);"
+            )
+            self._db = db
+        return self._db
+
+    def acquire_lease(self, name: str, ttl: float) -> Optional[str]:
+        """
+        Take a named lease unless another holder's lease is still valid
+
+        Args:
+            name: What the lease is for
+            ttl: Seconds the lease is valid, so a crashed holder doesn't keep it forever
+
+        Returns:
+            A token to release the lease with, or None if it is held elsewhere
+        """
+        owner = f"{os.getpid()}-{secrets.token_hex(4)}"
+        now = time.time()
+        with self._lock:
+            cursor = self._connect().execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at < ?",
+                (name, owner, now + ttl, now)
+            )
+        return owner if cursor.rowcount == 1 else None
+
+    def release_lease(self, name: str, owner: str) -> None:
+        """Give up a lease taken with acquire_lease"""
+        with self._lock:
+            self._connect().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def renew_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Extend a lease taken with acquire_lease, returning False if it has been lost"""
+        with self._lock:
+            cursor = self._connect().execute(
+                "UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ?", (time.time() + ttl, name, owner)
+            )
+        return cursor.rowcount == 1
+
+    def lease_held(self, name: str) -> bool:
+        """Return whether a valid lease with this name exists"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT 1 FROM leases WHERE name = ? AND expires_at >= ?", (name, time.time())
+            ).fetchone()
+        return row is not None
+
+    def adjust_bucket(self, name: str, amount: float, capacity: float, rate: float) -> float:
+        """
+        Refill a token bucket for the time passed, then add amount to it
+
+        Args:
+            name: The bucket; a new bucket starts full
+            amount: Units to add, negative to take them; taking may leave the bucket below zero
+            capacity: Most units the bucket holds
+            rate: Units refilled per second
+
+        Returns:
+            The units now available
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connect().execute(
+                "INSERT INTO buckets (name, available, updated_at) VALUES (?, MIN(?, ? + ?), ?) "
+                "ON CONFLICT (name) DO UPDATE SET "
+                "  available = MIN(?, MIN(?, available + MAX(? - updated_at, 0) * ?) + ?), updated_at = ? "
+                "RETURNING available",
+                (name, capacity, capacity, amount, now, capacity, capacity, now, rate, amount, now)
+            ).fetchone()
+        return row[0]
+
+    def extend_time(self, name: str, value: float) -> None:
+        """Set a named timestamp (seconds since the epoch), unless it is already later"""
+        with self._lock:
+            self._connect().execute(
+                "INSERT INTO times (name, value) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)",
+                (name, value)
+            )
+
+    def get_time(self, name: str) -> float:
+        """Return a named timestamp, 0 if it was never set"""
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM times WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else 0.0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+# State shared between worker processes, None when the server runs as a single process
+shared_state = SharedState(SHARED_STATE_PATH) if SHARED_STATE_PATH else None
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger("terminal-api")
+
+
+class SingleFlight:
+    """Makes concurrent calls with the same key share a single execution"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.executions = 0
+        self.deduplicated = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn, or wait for the run already in flight for the same key
+
+        The shared call is shielded, so a caller that gives up (e.g. the
+        client disconnects) doesn't cancel it for the other waiters.
+
+        Args:
+            key: Identifies calls that can share a result
+            fn: Coroutine factory performing the actual work
+
+        Returns:
+            The result of the (possibly shared) call
+        """
+        self.calls += 1
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+            logger.debug(f"Joined in-flight call for key {key[:12]}")
+            return await asyncio.shield(future)
+
+        self.executions += 1
+        future = asyncio.ensure_future(fn())
+        self._inflight[key] = future
+
+        def _forget(done: asyncio.Future) -> None:
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+
+        future.add_done_callback(_forget)
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return call counters
+
+        Returns:
+            Dictionary with total calls, upstream executions and deduplicated calls
+        """
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "deduplicated": self.deduplicated,
+            "in_flight": len(self._inflight),
+        }
@@ -1,20 +1,46 @@
-import subprocess
 import shlex
 import os
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from api.models import CommandResponse
-from core.config import COMMAND_TIMEOUT, OPENAI_MODEL
+from core.config import COMMAND_TIMEOUT, KERNEL_TIMEOUT, OPENAI_MODEL
 from core.security import ALLOWED_COMMANDS
 from utils.helpers import get_help_text
-from services.ai_service import AIService
+from services.ai_service import AIService, AIServiceError
+from services.commands import ArgSchema, CommandRegistry, Option, ParsedArgs
 from services.file_service import FileService
+from services.jobs import CANCELLED, Job, job_queue
+from services.kernels import LANGUAGES, kernel_manager
+from services.process_runner import ProcessResult, run_process, stream_process
+from services.session import TerminalSession
 
-async def execute_terminal_command(command: str) -> CommandResponse:
+# Every terminal command, looked up by name
+commands = CommandRegistry()
+
+# Inner width of the box drawn around AI responses
+BOX_WIDTH = 48
+
+def box_top() -> str:
+    """Return the top border of the AI response box"""
+    return "┌" + "─" * (BOX_WIDTH + 2) + "┐\n"
+
+def box_bottom() -> str:
+    """Return the bottom border of the AI response box"""
+    return "└" + "─" * (BOX_WIDTH + 2) + "┘"
+
+def box_line(text: str) -> str:
+    """
+    Format a single line of text (at most BOX_WIDTH characters) inside the box
+    """
+    return "│ " + text.ljust(BOX_WIDTH) + " │\n"
+
+async def execute_terminal_command(command: str, session: Optional[TerminalSession] = None) -> CommandResponse:
     """
     Execute a terminal command and return the result
     
     Args:
         command: The command to execute
-        
+        session: Terminal session the command runs in, if any
+    
     Returns:
         CommandResponse with output and status
     """
@@ -22,125 +48,418 @@ async def execute_terminal_command(command: str) -> CommandResponse:
     if not command:
         return CommandResponse(output="", status=0)
     
-    # Handle help command
-    if command == "help":
-        return CommandResponse(output=get_help_text(), status=0)
+    return await commands.execute(command, session)
+
+async def stream_terminal_command(command: str,
+                                  session: Optional[TerminalSession] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Execute a terminal command and stream its output as events
     
-    # Handle clear command
-    if command == "clear":
-        return CommandResponse(output="__CLEAR__", status=0)
+    Shell commands stream their output as the process produces it, AI
+    prompts are streamed as the model generates them and file:view is
+    streamed in chunks straight from disk; every other command is sent
+    as a single output event once it completes.
     
-    # Handle AI commands
-    if command.startswith("ai:"):
-        return await handle_ai_command(command[3:].strip())
+    Args:
+        command: The command to execute
+        session: Terminal session the command runs in, if any
     
-    # Handle file commands
-    if command.startswith("file:"):
-        return await handle_file_command(command[5:].strip())
+    Yields:
+        Events of the form {"type": "output", "data": ...} followed by
+        a final {"type": "done", "status": ...}
+    """
+    if not command:
+        yield {"type": "output", "data": ""}
+        yield {"type": "done", "status": 0}
+        return
     
-    # Parse the command to check if it's allowed
+    async for event in commands.stream(command, session):
+        yield event
+
+# Built-in commands
+
+@commands.command("help")
+async def handle_help(args: ParsedArgs, session: Optional[TerminalSession]) -> CommandResponse:
+    """Show the help text"""
+    return CommandResponse(output=get_help_text(), status=0)
+
+@commands.command("clear")
+async def handle_clear(args: ParsedArgs, session: Optional[TerminalSession]) -> CommandResponse:
+    """Tell the client to clear the screen"""
+    return CommandResponse(output="__CLEAR__", status=0)
+
+# Session commands
+
+@commands.command("cd", schema=ArgSchema(positional=("directory",)), usage="Usage: cd [directory]",
+                  session_required=True)
+async def handle_cd(args: ParsedArgs, session: TerminalSession) -> CommandResponse:
+    """Change the session's working directory"""
     try:
-        args = shlex.split(command)
-        base_command = args[0]
-        
-        if base_command not in ALLOWED_COMMANDS:
-            return CommandResponse(
-                output=f"Command not allowed: {base_command}\nType 'help' to see available commands.",
-                status=1
-            )
+        session.change_directory(args.get("directory") or "~")
+    except (FileNotFoundError, NotADirectoryError) as e:
+        return CommandResponse(output=f"cd: {str(e)}", status=1)
+    return CommandResponse(output=session.cwd, status=0)
+
+@commands.command("export", schema=ArgSchema(rest="assignments"), usage="Usage: export NAME=value",
+                  session_required=True)
+async def handle_export(args: ParsedArgs, session: TerminalSession) -> CommandResponse:
+    """Set environment variables for later commands"""
+    assignments = args.get("assignments")
+    if not assignments:
+        return CommandResponse(output="Usage: export NAME=value", status=1)
+    for assignment in assignments:
+        key, sep, value = assignment.partition("=")
+        if not sep or not key.isidentifier():
+            return CommandResponse(output=f"export: invalid assignment: {assignment}", status=1)
+        session.env[key] = value
+    return CommandResponse(output="", status=0)
+
+@commands.command("unset", schema=ArgSchema(rest="names"), session_required=True)
+async def handle_unset(args: ParsedArgs, session: TerminalSession) -> CommandResponse:
+    """Remove variables set with export"""
+    for key in args.get("names"):
+        session.env.pop(key, None)
+    return CommandResponse(output="", status=0)
+
+@commands.command("env", session_required=True)
+async def handle_env(args: ParsedArgs, session: TerminalSession) -> CommandResponse:
+    """List variables set with export"""
+    output = "\n".join(f"{key}={value}" for key, value in sorted(session.env.items()))
+    return CommandResponse(output=output, status=0)
+
+@commands.command("history", schema=ArgSchema(positional=("count",)), usage="Usage: history [N]",
+                  session_required=True)
+async def handle_history(args: ParsedArgs, session: TerminalSession) -> CommandResponse:
+    """Show the session's most recent commands"""
+    entries = list(session.history)
+    count = args.get("count")
+    if count is not None:
+        if not count.isdigit():
+            return CommandResponse(output="Usage: history [N]", status=1)
+        entries = entries[-int(count):] if int(count) else []
+    first = len(session.history) - len(entries) + 1
+    output = "\n".join(f"{first + i:5}  {entry}" for i, entry in enumerate(entries))
+    return CommandResponse(output=output, status=0)
+
+# Shell commands
+
+def _parse_shell_command(command: str) -> List[str]:
+    """
+    Split a shell command and make sure it is allowed
+    
+    Args:
+        command: The command line
+    
+    Returns:
+        The command split into arguments
+    
+    Raises:
+        PermissionError: If the command is not in ALLOWED_COMMANDS
+    """
+    args = shlex.split(command)
+    base_command = args[0]
+    
+    if base_command not in ALLOWED_COMMANDS:
+        raise PermissionError(f"Command not allowed: {base_command}\nType 'help' to see available commands.")
+    return args
+
+def _session_context(session: Optional[TerminalSession]) -> Tuple[Optional[str], Optional[Dict[str, str]]]:
+    """Return the working directory and environment for processes started from a session"""
+    if session is None:
+        return None, None
+    return session.cwd, session.environment()
+
+async def stream_shell_command(args: ParsedArgs,
+                               session: Optional[TerminalSession] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run one of the allowed shell commands, streaming output as it is produced
+    
+    stdout and stderr are interleaved in the order the process writes them;
+    each output event carries a "stream" field saying which one it came from.
+    
+    Args:
+        args: The parsed command line
+        session: Terminal session providing the working directory and environment
+    
+    Yields:
+        Output events followed by a final done event
+    """
+    try:
+        argv = _parse_shell_command(args.text)
+    except PermissionError as e:
+        yield {"type": "output", "data": str(e)}
+        yield {"type": "done", "status": 1}
+        return
+    except ValueError as e:
+        yield {"type": "output", "data": f"Error executing command: {str(e)}"}
+        yield {"type": "done", "status": 1}
+        return
+    
+    try:
+        cwd, env = _session_context(session)
+        async for item in stream_process(argv, timeout=COMMAND_TIMEOUT, cwd=cwd, env=env):
+            if isinstance(item, ProcessResult):
+                if item.truncated:
+                    yield {"type": "output", "stream": "stdout", "data": item.truncation_marker()}
+                if item.timed_out:
+                    yield {"type": "output", "stream": "stderr",
+                           "data": f"\nCommand timed out after {COMMAND_TIMEOUT} seconds"}
+                yield {"type": "done", "status": item.returncode}
+            else:
+                stream_name, text = item
+                yield {"type": "output", "stream": stream_name, "data": text}
+    except Exception as e:
+        yield {"type": "output", "data": f"Error executing command: {str(e)}"}
+        yield {"type": "done", "status": 1}
+
+async def run_shell_command(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
+    """
+    Run one of the allowed shell commands
+    
+    Args:
+        args: The parsed command line
+        session: Terminal session providing the working directory and environment
+    
+    Returns:
+        CommandResponse with output and status
+    """
+    try:
+        argv = _parse_shell_command(args.text)
         
         # Execute the command
-        process = subprocess.run(
-            args,
-            capture_output=True,
-            text=True,
-            timeout=COMMAND_TIMEOUT,
-        )
+        cwd, env = _session_context(session)
+        process = await run_process(argv, timeout=COMMAND_TIMEOUT, cwd=cwd, env=env)
         
         output = process.stdout
         if process.stderr:
             output += f"\nError: {process.stderr}"
-            
-        return CommandResponse(output=output, status=process.returncode)
+        output += process.truncation_marker()
         
-    except subprocess.TimeoutExpired:
-        return CommandResponse(
-            output=f"Command timed out after {COMMAND_TIMEOUT} seconds",
-            status=124
-        )
+        if process.timed_out:
+            # Keep whatever the command printed before it was killed
+            timeout_message = f"Command timed out after {COMMAND_TIMEOUT} seconds"
+            output = f"{output}\n{timeout_message}" if output else timeout_message
+        
+        return CommandResponse(output=output, status=process.returncode)
+    
+    except PermissionError as e:
+        return CommandResponse(output=str(e), status=1)
     except Exception as e:
         return CommandResponse(
             output=f"Error executing command: {str(e)}",
             status=1
         )
 
-async def handle_ai_command(prompt: str) -> CommandResponse:
+# Anything that isn't a registered command is run as a shell command
+commands.set_fallback(run_shell_command, schema=ArgSchema(free_text=True), stream=stream_shell_command)
+
+# REPL kernel commands
+
+KERNEL_USAGE = """Usage:
+  kernel:python <code>       Evaluate Python code (also kernel:py)
+  kernel:node <code>         Evaluate JavaScript code (also kernel:js)
+  kernel:list                List this session's kernels
+  kernel:restart <language>  Start a language's kernel afresh
+  kernel:stop [language]     Stop one or all of this session's kernels"""
+
+async def handle_kernel_eval(args: ParsedArgs, session: TerminalSession) -> CommandResponse:
     """
-    Handle AI commands by sending them to the OpenAI API
+    Evaluate code in the session's persistent REPL for the command's language
     
     Args:
-        prompt: The prompt to send to the AI model
-        
+        args: The parsed command, e.g. kernel:python <code>
+        session: Terminal session owning the kernel
+    
     Returns:
-        CommandResponse with the AI's response
+        CommandResponse with output and status
     """
-    # Check for empty prompt
-    if not prompt:
-        return CommandResponse(
-            output="Error: Empty prompt. Usage: ai:<your prompt here>",
-            status=1
+    language = LANGUAGES[args.name[len("kernel:"):]]
+    if not args.text:
+        return CommandResponse(output=f"Error: No code given\n{KERNEL_USAGE}", status=1)
+    
+    try:
+        result, survived = await kernel_manager.evaluate(
+            session.id, language, args.text, KERNEL_TIMEOUT, *_session_context(session)
         )
+    except Exception as e:
+        return CommandResponse(output=f"Error running {language} kernel: {str(e)}", status=1)
     
-    # Handle code generation command
-    if prompt.startswith("code:"):
-        # Check if auto-run is disabled with --no-run flag
-        auto_run = True
-        if "--no-run" in prompt:
-            auto_run = False
-            prompt = prompt.replace("--no-run", "").strip()
-        
-        code_prompt = prompt[5:].strip()
-        processing_message = "🤖 Generating Python code...\n"
-        processing_message += f"Prompt: \"{code_prompt}\"\n\n"
-        
-        response = await AIService.generate_and_save_code(code_prompt, model=OPENAI_MODEL, auto_run=auto_run)
-        
-        # If successful, return the response
-        if response.status == 0:
-            return CommandResponse(
-                output=processing_message + response.output,
-                status=0
-            )
-        
-        # If there was an error, return it
-        return response
+    output = result.output + result.truncation_marker()
+    if result.timed_out:
+        output += f"\nEvaluation timed out after {KERNEL_TIMEOUT:g} seconds"
+        if not survived:
+            output += f", the {language} kernel was restarted and its state lost"
+    return CommandResponse(output=output, status=result.returncode)
+
+for _alias in LANGUAGES:
+    commands.register(f"kernel:{_alias}", handle_kernel_eval, schema=ArgSchema(free_text=True),
+                      usage=KERNEL_USAGE, session_required=True)
+
+@commands.command("kernel:list", session_required=True)
+async def handle_kernel_list(args: ParsedArgs, session: TerminalSession) -> CommandResponse:
+    """List the session's kernels"""
+    kernels = kernel_manager.list(session.id)
+    if not kernels:
+        return CommandResponse(output="No kernels running", status=0)
+    output = "\n".join(
+        f"{k['language']:8} pid {k['pid']:<8} {k['evaluations']} evaluation(s), idle {k['idle_seconds']}s"
+        for k in kernels
+    )
+    return CommandResponse(output=output, status=0)
+
+@commands.command("kernel:restart", schema=ArgSchema(positional=("language",), required=1),
+                  usage=KERNEL_USAGE, session_required=True)
+async def handle_kernel_restart(args: ParsedArgs, session: TerminalSession) -> CommandResponse:
+    """Start a language's kernel afresh"""
+    language = LANGUAGES.get(args.get("language"))
+    if language is None:
+        return CommandResponse(output=f"Error: Unknown kernel language: {args.get('language')}\n{KERNEL_USAGE}",
+                               status=1)
+    await kernel_manager.stop(session.id, language)
+    try:
+        await kernel_manager.get(session.id, language, *_session_context(session))
+    except Exception as e:
+        return CommandResponse(output=f"Error starting {language} kernel: {str(e)}", status=1)
+    return CommandResponse(output=f"Restarted {language} kernel", status=0)
+
+@commands.command("kernel:stop", schema=ArgSchema(positional=("language",)), usage=KERNEL_USAGE,
+                  session_required=True)
+async def handle_kernel_stop(args: ParsedArgs, session: TerminalSession) -> CommandResponse:
+    """Stop one or all of the session's kernels"""
+    name = args.get("language")
+    language = LANGUAGES.get(name) if name else None
+    if name and language is None:
+        return CommandResponse(output=f"Error: Unknown kernel language: {name}\n{KERNEL_USAGE}", status=1)
+    stopped = await kernel_manager.stop(session.id, language)
+    return CommandResponse(output=f"Stopped {stopped} kernel(s)", status=0)
+
+@commands.command("kernel:", schema=ArgSchema(free_text=True), prefix=True, session_required=True)
+async def handle_kernel_unknown(args: ParsedArgs, session: TerminalSession) -> CommandResponse:
+    """Catch kernel: commands that match no registered name"""
+    if not args.text:
+        return CommandResponse(output=KERNEL_USAGE, status=1)
+    action = args.text.split(None, 1)[0]
+    return CommandResponse(output=f"Error: Unknown kernel command: {action}\n{KERNEL_USAGE}", status=1)
+
+# AI commands
+
+AI_SCHEMA = ArgSchema(options=(Option("--no-cache", flag=True),), free_text=True)
+AI_MODEL_SCHEMA = ArgSchema(options=(Option("--no-cache", flag=True),), positional=("model",), free_text=True)
+AI_CODE_SCHEMA = ArgSchema(options=(Option("--no-cache", flag=True), Option("--no-run", flag=True),
+                                    Option("--background", flag=True), Option("--candidates", type=int)),
+                           free_text=True)
+
+def _ai_request(args: ParsedArgs) -> Tuple[Optional[str], str, Optional[str]]:
+    """
+    Work out the model and prompt of an ai: or ai:model: command
+    
+    Returns:
+        Tuple of (model or None for the default, prompt, error message or None)
+    """
+    if args.name == "ai:model:":
+        if not args.text:
+            return None, "", "Error: Missing prompt after model selection. Usage: ai:model:<model_name> <prompt>"
+        return args.get("model"), args.text, None
+    
+    if not args.text:
+        return None, "", "Error: Empty prompt. Usage: ai:<your prompt here>"
+    return None, args.text, None
+
+async def stream_ai_command(args: ParsedArgs, session: Optional[TerminalSession] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream an AI response, formatting the box line by line as text arrives
+    
+    Args:
+        args: The parsed ai: or ai:model: command
+        session: Terminal session the command runs in, if any
+    
+    Yields:
+        Output events followed by a final done event
+    """
+    model, prompt, error = _ai_request(args)
+    if error:
+        yield {"type": "output", "data": error}
+        yield {"type": "done", "status": 1}
+        return
+    
+    processing_message = "🤖 Processing your request...\n"
+    if model:
+        processing_message += f"Using model: {model}\n"
+    else:
+        processing_message += f"Using default model: {OPENAI_MODEL}\n"
+    processing_message += f"Prompt: \"{prompt}\"\n\n"
+    
+    yield {"type": "output", "data": processing_message}
+    
+    started = False
+    pending = ""
+    try:
+        async for delta in AIService.stream_response(prompt, model=model, use_cache=not args.get("no_cache")):
+            if not started:
+                yield {"type": "output", "data": box_top()}
+                started = True
+            
+            pending += delta
+            formatted = ""
+            
+            # Emit every complete line, wrapping long ones as soon as they overflow
+            while True:
+                newline = pending.find("\n")
+                if newline != -1 and newline <= BOX_WIDTH:
+                    formatted += box_line(pending[:newline])
+                    pending = pending[newline + 1:]
+                elif len(pending) > BOX_WIDTH and (newline == -1 or newline > BOX_WIDTH):
+                    formatted += box_line(pending[:BOX_WIDTH])
+                    pending = pending[BOX_WIDTH:]
+                else:
+                    break
+            
+            if formatted:
+                yield {"type": "output", "data": formatted}
+    
+    except AIServiceError as e:
+        if started:
+            yield {"type": "output", "data": box_line(pending) + box_bottom() + "\n"}
+        yield {"type": "output", "data": str(e)}
+        yield {"type": "done", "status": 1}
+        return
+    
+    if not started:
+        yield {"type": "output", "data": box_top()}
+    yield {"type": "output", "data": box_line(pending) + box_bottom()}
+    yield {"type": "done", "status": 0}
+
+async def handle_ai_command(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
+    """
+    Handle AI commands by sending them to the OpenAI API
+    
+    Args:
+        args: The parsed ai: or ai:model: command
+        session: Terminal session the command runs in, if any
+    
+    Returns:
+        CommandResponse with the AI's response
+    """
+    model, prompt, error = _ai_request(args)
+    if error:
+        return CommandResponse(output=error, status=1)
+    use_cache = not args.get("no_cache")
     
     # Print a message indicating that the AI is processing
     processing_message = "🤖 Processing your request...\n"
     
-    # Special case for model selection
-    if prompt.startswith("model:"):
-        parts = prompt.split(" ", 1)
-        if len(parts) < 2:
-            return CommandResponse(
-                output="Error: Missing prompt after model selection. Usage: ai:model:<model_name> <prompt>",
-                status=1
-            )
-        
-        model = parts[0][6:]  # Remove "model:" prefix
-        user_prompt = parts[1]
-        
+    if model:
         # Print what we're doing
         processing_message += f"Using model: {model}\n"
-        processing_message += f"Prompt: \"{user_prompt}\"\n\n"
+        processing_message += f"Prompt: \"{prompt}\"\n\n"
         
-        response = await AIService.generate_response(user_prompt, model=model)
+        response = await AIService.generate_response(prompt, model=model, use_cache=use_cache)
     else:
         # Default case - use default model
         processing_message += f"Using default model: {OPENAI_MODEL}\n"
         processing_message += f"Prompt: \"{prompt}\"\n\n"
         
-        response = await AIService.generate_response(prompt)
+        response = await AIService.generate_response(prompt, use_cache=use_cache)
     
     # If successful, format the output nicely
     if response.status == 0:
@@ -151,114 +470,216 @@ async def handle_ai_command(prompt: str) -> CommandResponse:
         
         # Format the output with a nice border
         formatted_output = processing_message
-        formatted_output += "┌" + "─" * 50 + "┐\n"
+        formatted_output += box_top()
         
         # Split the response into lines and add borders
         for line in ai_response.split('\n'):
             # Handle long lines by wrapping them
-            while len(line) > 48:
-                formatted_output += "│ " + line[:48] + " │\n"
-                line = line[48:]
-            formatted_output += "│ " + line.ljust(48) + " │\n"
+            while len(line) > BOX_WIDTH:
+                formatted_output += box_line(line[:BOX_WIDTH])
+                line = line[BOX_WIDTH:]
+            formatted_output += box_line(line)
         
-        formatted_output += "└" + "─" * 50 + "┘"
+        formatted_output += box_bottom()
         
         return CommandResponse(output=formatted_output, status=0)
     
     # If there was an error, return it as is
-    return response 
+    return response
+
+# "ai: code: ..." and "ai: model:..." still reach their own commands, as they did before the registry
+commands.register("ai:", handle_ai_command, schema=AI_SCHEMA, prefix=True, stream=stream_ai_command, nested=True)
+commands.register("ai:model:", handle_ai_command, schema=AI_MODEL_SCHEMA, prefix=True, stream=stream_ai_command)
 
-async def handle_file_command(command: str) -> CommandResponse:
+@commands.command("ai:code:", schema=AI_CODE_SCHEMA, prefix=True)
+async def handle_ai_code(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
     """
-    Handle file-related commands
+    Generate Python code from a description, save it and (unless --no-run) run it
     
     Args:
-        command: The file command to execute
-        
+        args: The parsed ai:code: command
+        session: Terminal session the command runs in, if any
+    
     Returns:
-        CommandResponse with the result
+        CommandResponse with the generated code and its output
     """
-    # Check for empty command
-    if not command:
+    code_prompt = args.text
+    if args.get("background"):
+        try:
+            job = await job_queue.submit(code_prompt, auto_run=not args.get("no_run"),
+                                         use_cache=not args.get("no_cache"), candidates=args.get("candidates"))
+        except RuntimeError as e:
+            return CommandResponse(output=f"Error: {str(e)}", status=1)
+        return CommandResponse(
+            output=f"Queued job {job.id}\nCheck on it with: job:status {job.id}",
+            status=0
+        )
+    
+    processing_message = "🤖 Generating Python code...\n"
+    processing_message += f"Prompt: \"{code_prompt}\"\n\n"
+    
+    response = await AIService.generate_and_save_code(code_prompt, model=OPENAI_MODEL,
+                                                      auto_run=not args.get("no_run"),
+                                                      use_cache=not args.get("no_cache"),
+                                                      candidates=args.get("candidates"))
+    
+    # If successful, return the response
+    if response.status == 0:
+        return CommandResponse(
+            output=processing_message + response.output,
+            status=0
+        )
+    
+    # If there was an error, return it
+    return response
+
+# Background job commands
+
+JOB_USAGE = """Usage:
+  job:list [state]   List recent jobs (queued, running, succeeded, failed, cancelled)
+  job:status <id>    Show a job's state and, once finished, its output
+  job:cancel <id>    Cancel a queued or running job"""
+
+def _job_summary(job: Job) -> str:
+    """Return one line describing a job"""
+    prompt = job.prompt if len(job.prompt) <= 40 else job.prompt[:37] + "..."
+    return f"{job.id}  {job.state:10} {job.priority:7} {prompt}"
+
+@commands.command("job:list", schema=ArgSchema(positional=("state",)), usage=JOB_USAGE)
+async def handle_job_list(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
+    """List recent jobs"""
+    jobs = await job_queue.list(args.get("state"))
+    if not jobs:
+        return CommandResponse(output="No jobs", status=0)
+    return CommandResponse(output="\n".join(_job_summary(job) for job in jobs), status=0)
+
+@commands.command("job:status", schema=ArgSchema(positional=("id",), required=1), usage=JOB_USAGE)
+async def handle_job_status(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
+    """Show a job's state and output"""
+    job = await job_queue.get(args.get("id"))
+    if job is None:
+        return CommandResponse(output=f"Error: Unknown job: {args.get('id')}", status=1)
+    output = _job_summary(job)
+    if job.finished:
+        output += f"\n\n{job.output}"
+    return CommandResponse(output=output, status=0)
+
+@commands.command("job:cancel", schema=ArgSchema(positional=("id",), required=1), usage=JOB_USAGE)
+async def handle_job_cancel(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
+    """Cancel a queued or running job"""
+    job = await job_queue.cancel(args.get("id"))
+    if job is None:
+        return CommandResponse(output=f"Error: Unknown job: {args.get('id')}", status=1)
+    return CommandResponse(output=_job_summary(job), status=0 if job.state == CANCELLED else 1)
+
+@commands.command("job:", schema=ArgSchema(free_text=True), prefix=True)
+async def handle_job_unknown(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
+    """Catch job: commands that match no registered name"""
+    if not args.text:
+        return CommandResponse(output=JOB_USAGE, status=1)
+    action = args.text.split(None, 1)[0]
+    return CommandResponse(output=f"Error: Unknown job command: {action}\n{JOB_USAGE}", status=1)
+
+# File commands
+
+FILE_COMMANDS = "create, list, view, cat, run"
+
+LIST_USAGE = "Usage: file:list [extension] [--page N] [--per-page N] [--sort name|size|mtime] [--desc] [--match TEXT]"
+
+VIEW_USAGE = "Usage: file:view <filename> [--lines A:B] [--bytes A:B] [--head N] [--tail N]"
+
+def _parse_range(value: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Parse an "A:B" range where either side may be left out
+    """
+    if ":" not in value:
+        raise ValueError(f"Invalid range: {value}")
+    first, last = value.split(":", 1)
+    return (int(first) if first else None, int(last) if last else None)
+
+VIEW_SCHEMA = ArgSchema(
+    options=(
+        Option("--lines", type=_parse_range),
+        Option("--bytes", type=_parse_range, dest="byte_range"),
+        Option("--head", type=int),
+        Option("--tail", type=int),
+    ),
+    positional=("filename",),
+    required=1,
+    exclusive=True,
+)
+
+def _given(args: ParsedArgs) -> Dict[str, Any]:
+    """Return the options that were given on the command line"""
+    return {key: value for key, value in args.options.items() if value is not None}
+
+@commands.command("file:create", schema=ArgSchema(free_text=True))
+async def handle_file_create(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
+    """Create a file with the given content"""
+    if not args.text:
         return CommandResponse(
-            output="Error: Empty file command. Available commands: create, list, view, cat, run",
+            output="Error: Missing file content. Usage: file:create <content>",
             status=1
         )
+    return await FileService.create_file(args.text)
+
+@commands.command("file:list", usage=LIST_USAGE, schema=ArgSchema(
+    options=(
+        Option("--page", type=int),
+        Option("--per-page", type=int),
+        Option("--sort"),
+        Option("--desc", flag=True, dest="descending"),
+        Option("--match"),
+    ),
+    positional=("extension",),
+))
+async def handle_file_list(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
+    """List generated files, one page at a time"""
+    return await FileService.list_files(extension=args.get("extension"), **_given(args))
+
+async def stream_file_view(args: ParsedArgs, session: Optional[TerminalSession] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream a file (or a window of it) in chunks
     
-    # Split the command into parts
-    parts = command.split(" ", 1)
-    action = parts[0].lower()
-    
-    if action == "create":
-        if len(parts) < 2:
-            return CommandResponse(
-                output="Error: Missing file content. Usage: file:create <content>",
-                status=1
-            )
-        return FileService.create_file(parts[1])
-    
-    elif action == "list":
-        extension = None
-        if len(parts) > 1:
-            extension = parts[1]
-        return FileService.list_files(extension)
-    
-    elif action == "view" or action == "cat":
-        if len(parts) < 2:
-            return CommandResponse(
-                output="Error: Missing filename. Usage: file:view <filename>",
-                status=1
-            )
-        
-        filename = parts[1]
-        # Ensure the filename has the correct extension if not provided
-        if not any(filename.endswith(ext) for ext in ['.py', '.txt', '.md', '.json', '.csv']):
-            filename += '.py'  # Default to Python extension
-        
-        file_path = os.path.join(FILES_DIR, filename)
-        
-        if not os.path.exists(file_path):
-            return CommandResponse(
-                output=f"Error: File not found: {filename}",
-                status=1
-            )
-        
-        try:
-            with open(file_path, 'r') as f:
-                content = f.read()
-            
-            return CommandResponse(
-                output=f"📄 {filename}:\n\n{content}",
-                status=0
-            )
-        except Exception as e:
-            return CommandResponse(
-                output=f"Error reading file: {str(e)}",
-                status=1
-            )
-    
-    elif action == "run":
-        if len(parts) < 2:
-            return CommandResponse(
-                output="Error: Missing filename. Usage: file:run <filename> [--demo]",
-                status=1
-            )
-        
-        # Check for demo mode flag
-        demo_mode = False
-        filename = parts[1]
-        if len(parts) > 2 and "--demo" in parts[1]:
-            # Handle case where filename and flag are in the same part
-            filename = parts[1].replace("--demo", "").strip()
-            demo_mode = True
-        elif len(parts) > 2 and "--demo" in " ".join(parts[2:]):
-            # Handle case where flag is a separate part
-            demo_mode = True
-        
-        return FileService.run_file(filename, demo_mode)
+    Args:
+        args: The parsed file:view command
+        session: Terminal session the command runs in, if any
     
-    else:
+    Yields:
+        Output events followed by a final done event
+    """
+    status = 0
+    async for chunk, status in FileService.stream_file(args.get("filename"), **_given(args)):
+        if chunk:
+            yield {"type": "output", "data": chunk}
+    yield {"type": "done", "status": status}
+
+async def handle_file_view(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
+    """View a file, or a window of it"""
+    return await FileService.view_file(args.get("filename"), **_given(args))
+
+for _name in ("file:view", "file:cat"):
+    commands.register(_name, handle_file_view, schema=VIEW_SCHEMA, usage=VIEW_USAGE, stream=stream_file_view)
+
+@commands.command("file:run", usage="Usage: file:run <filename> [--demo]", schema=ArgSchema(
+    options=(Option("--demo", flag=True),),
+    positional=("filename",),
+    required=1,
+))
+async def handle_file_run(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
+    """Run a generated Python file"""
+    return await FileService.run_file(args.get("filename"), args.get("demo"))
+
+@commands.command("file:", schema=ArgSchema(free_text=True), prefix=True)
+async def handle_file_unknown(args: ParsedArgs, session: Optional[TerminalSession] = None) -> CommandResponse:
+    """Catch file: commands that match no registered name"""
+    if not args.text:
         return CommandResponse(
-            output=f"Unknown file command: {action}\nAvailable commands: create, list, view, cat, run",
+            output=f"Error: Empty file command. Available commands: {FILE_COMMANDS}",
             status=1
-        ) 
\ No newline at end of file
+        )
+    action = args.text.split(None, 1)[0]
+    return CommandResponse(
+        output=f"Unknown file command: {action}\nAvailable commands: {FILE_COMMANDS}",
+        status=1
+    )
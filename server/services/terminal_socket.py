@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+from fastapi import WebSocket, WebSocketDisconnect
+from core.config import CORS_ORIGINS
+from services.session import TerminalSession, session_manager
+from services.terminal import stream_terminal_command
+
+logger = logging.getLogger("terminal-api")
+
+# Exit status reported for a command cancelled by the client (as after Ctrl-C)
+CANCELLED_STATUS = 130
+
+# Close code for a connection refused by policy
+POLICY_VIOLATION = 1008
+
+
+async def _run_command(websocket: WebSocket, session: TerminalSession, command: str, request_id: Any) -> None:
+    """Run one command in the session, sending its events as they are produced"""
+    async with session_manager.use(session, command):
+        async for event in stream_terminal_command(command, session):
+            event["id"] = request_id
+            await websocket.send_json(event)
+
+
+async def serve_terminal_socket(websocket: WebSocket, session_id: Optional[str] = None) -> None:
+    """
+    Serve a terminal session over a WebSocket
+
+    The client sends {"command": ..., "id": ...} messages and receives the
+    same events as /api/terminal/stream, tagged with the id. Commands run one
+    after another; {"type": "cancel"} stops the one currently running.
+
+    Browsers send an Origin header but don't apply CORS to WebSockets, so a
+    connection from a page not in CORS_ORIGINS is refused; otherwise any
+    site the user visits could run commands.
+
+    Args:
+        websocket: The connection
+        session_id: Session to resume, a new one is created if unknown
+    """
+    origin = websocket.headers.get("origin")
+    if origin is not None and origin not in CORS_ORIGINS and "*" not in CORS_ORIGINS:
+        logger.warning(f"Refused terminal WebSocket from origin {origin}")
+        await websocket.close(code=POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    try:
+        session = await session_manager.attach(session_id)
+    except RuntimeError as e:
+        await websocket.close(code=1013, reason=str(e))
+        return
+
+    commands: asyncio.Queue = asyncio.Queue()
+    running: Optional[asyncio.Future] = None
+
+    async def run_commands() -> None:
+        nonlocal running
+        while True:
+            message: Dict[str, Any] = await commands.get()
+            request_id = message.get("id")
+            running = asyncio.ensure_future(
+                _run_command(websocket, session, str(message.get("command", "")).strip(), request_id)
+            )
+            # wait() doesn't raise when the command is cancelled, only when this loop is
+            await asyncio.wait({running})
+            if running.cancelled():
+                await websocket.send_json({"type": "done", "status": CANCELLED_STATUS, "id": request_id})
+            elif running.exception() is not None:
+                logger.error(f"Error in terminal session {session.id}: {str(running.exception())}")
+                await websocket.send_json({"type": "output", "data": f"Error: {str(running.exception())}",
+                                           "id": request_id})
+                await websocket.send_json({"type": "done", "status": 1, "id": request_id})
+            running = None
+
+    runner = asyncio.ensure_future(run_commands())
+    try:
+        await websocket.send_json({"type": "session", "session_id": session.id, "cwd": session.cwd})
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                await websocket.send_json({"type": "error", "data": "Expected a JSON object"})
+                continue
+
+            if message.get("type") == "cancel":
+                if running is not None:
+                    running.cancel()
+                continue
+            await commands.put(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        runner.cancel()
+        if running is not None:
+            running.cancel()
+        session_manager.detach(session)
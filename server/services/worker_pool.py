@@ -0,0 +1,268 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+import logging
+from typing import List, Optional, Set
+from core.config import (
+    PYTHON_WORKER_POOL_SIZE,
+    PYTHON_WORKER_MAX_RUNS,
+    PYTHON_WORKER_MEMORY_LIMIT_MB,
+    OUTPUT_MAX_BYTES,
+)
+from services.metrics import SCRIPT_RUNS, SUBPROCESS_SPAWNS, span
+from services.process_runner import ProcessResult, run_process
+
+logger = logging.getLogger("terminal-api")
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "python_worker.py")
+
+# Extra seconds the pool waits for a worker beyond the script timeout
+WORKER_GRACE_PERIOD = 5
+
+# Longest result line accepted from a worker; a result carries the run's whole
+# output, so asyncio's 64 KB default readline limit is far too small
+MAX_RESULT_LINE = 64 * 1024 * 1024
+
+
+class _Worker:
+    """Handle on one pre-warmed worker interpreter"""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.runs = 0
+        # Pid (and process group) of the script being run, while there is one
+        self.child: Optional[int] = None
+
+    async def request(self, payload: dict, timeout: float) -> dict:
+        self.process.stdin.write(json.dumps(payload).encode("utf-8") + b"\n")
+        await self.process.stdin.drain()
+        return await asyncio.wait_for(self._result(), timeout)
+
+    async def _result(self) -> dict:
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                raise RuntimeError("Worker exited unexpectedly")
+            message = json.loads(line)
+            if "started" not in message:
+                self.child = None
+                return message
+            self.child = message["started"]
+
+    def kill_run(self) -> None:
+        """
+        Kill the script being run and any processes it started
+
+        The worker enforces the script's timeout, so a script left behind by a
+        stopped worker would run forever.
+        """
+        child, self.child = self.child, None
+        if child is None:
+            return
+        try:
+            # The script runs in its own session, so kill the whole group
+            os.killpg(child, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        try:
+            # In case it was killed before it started its session
+            os.kill(child, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    async def stop(self) -> None:
+        self.kill_run()
+        if self.process.returncode is None:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+            await self.process.wait()
+
+
+class PythonWorkerPool:
+    """Pool of pre-forked, pre-warmed Python interpreters that run generated files"""
+
+    def __init__(self, size: int, max_runs: int, memory_limit_mb: int):
+        """
+        Args:
+            size: Number of worker interpreters
+            max_runs: Runs after which a worker is replaced with a fresh one
+            memory_limit_mb: Address-space limit for each run (0 for no limit)
+        """
+        self.size = size
+        self.max_runs = max_runs
+        self.memory_limit_mb = memory_limit_mb
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[_Worker] = []
+        # Replacements of retired workers still under way
+        self._replacing: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0 and hasattr(os, "fork")
+
+    async def _spawn(self) -> _Worker:
+        """Start a worker and wait until it has finished pre-warming"""
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-u", WORKER_SCRIPT,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=MAX_RESULT_LINE,
+        )
+        SUBPROCESS_SPAWNS.inc(kind="worker")
+        worker = _Worker(process)
+        self._workers.append(worker)
+        ready = await asyncio.wait_for(process.stdout.readline(), 30)
+        if not ready:
+            raise RuntimeError("Python worker failed to start")
+        return worker
+
+    async def _replace(self, worker: _Worker) -> None:
+        """Retire a worker and put a fresh one in the idle queue"""
+        if worker in self._workers:
+            self._workers.remove(worker)
+        await worker.stop()
+        if self._idle is None:
+            # The pool was closed in the meantime
+            return
+        try:
+            self._idle.put_nowait(await self._spawn())
+        except Exception as e:
+            logger.error(f"Failed to replace Python worker: {str(e)}")
+
+    def _replace_later(self, worker: _Worker) -> None:
+        task = asyncio.ensure_future(self._replace(worker))
+        self._replacing.add(task)
+        task.add_done_callback(self._replacing.discard)
+
+    async def start(self) -> None:
+        """Spawn the workers if the pool isn't running on this event loop yet"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._idle = None
+            self._workers = []
+            self._replacing = set()
+
+        async with self._lock:
+            if self._idle is not None:
+                return
+            try:
+                workers = await asyncio.gather(*[self._spawn() for _ in range(self.size)])
+            except Exception:
+                for worker in self._workers:
+                    await worker.stop()
+                self._workers = []
+                raise
+
+            self._idle = asyncio.Queue()
+            for worker in workers:
+                self._idle.put_nowait(worker)
+            logger.info(f"Started {self.size} Python worker(s)")
+
+    async def close(self) -> None:
+        """Stop every worker"""
+        # A replacement finishing later would start a worker nobody stops
+        replacing, self._replacing = list(self._replacing), set()
+        for task in replacing:
+            task.cancel()
+        await asyncio.gather(*replacing, return_exceptions=True)
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            await worker.stop()
+        self._idle = None
+        self._loop = None
+
+    async def run(self, path: str, args: List[str], timeout: float,
+                  code_path: Optional[str] = None) -> ProcessResult:
+        """
+        Run a Python file on an idle worker
+
+        Args:
+            path: Path of the file to run
+            args: Command line arguments for the script
+            timeout: Seconds before the run is killed
+            code_path: Optional precompiled code for the file (see ArtifactCache)
+
+        Returns:
+            ProcessResult with the captured output and exit code
+        """
+        await self.start()
+        worker = await self._idle.get()
+        payload = {
+            "path": path,
+            "code_path": code_path,
+            "args": args,
+            "timeout": timeout,
+            "memory_limit_mb": self.memory_limit_mb,
+            "max_output_bytes": OUTPUT_MAX_BYTES,
+        }
+
+        try:
+            result = await worker.request(payload, timeout + WORKER_GRACE_PERIOD)
+        except BaseException:
+            # The worker's state is unknown, so never hand it out again. Its
+            # script is killed right away, even if the run was cancelled.
+            worker.kill_run()
+            self._replace_later(worker)
+            raise
+
+        worker.runs += 1
+        if worker.runs >= self.max_runs:
+            self._replace_later(worker)
+        else:
+            self._idle.put_nowait(worker)
+
+        return ProcessResult(
+            returncode=result["returncode"],
+            stdout=result["stdout"],
+            stderr=result["stderr"],
+            timed_out=result["timed_out"],
+            # Workers report the two streams separately, not interleaved
+            output=result["stdout"] + result["stderr"],
+            omitted_bytes=result.get("omitted_bytes", 0),
+        )
+
+
+# Shared pool used for running generated files
+worker_pool = PythonWorkerPool(
+    size=PYTHON_WORKER_POOL_SIZE,
+    max_runs=PYTHON_WORKER_MAX_RUNS,
+    memory_limit_mb=PYTHON_WORKER_MEMORY_LIMIT_MB,
+)
+
+
+async def run_python_file(path: str,
+                          args: Optional[List[str]] = None,
+                          timeout: float = 10,
+                          code_path: Optional[str] = None) -> ProcessResult:
+    """
+    Run a Python file, on a pre-warmed worker when the pool is available
+
+    Args:
+        path: Path of the file to run
+        args: Optional command line arguments
+        timeout: Seconds before the run is killed
+        code_path: Optional precompiled code for the file, lets workers skip compiling
+
+    Returns:
+        ProcessResult with the captured output and exit code
+    """
+    args = args or []
+    with span("script.run"):
+        if worker_pool.enabled:
+            try:
+                await worker_pool.start()
+            except Exception as e:
+                logger.warning(f"Python worker pool unavailable, spawning a new interpreter: {str(e)}")
+            else:
+                SCRIPT_RUNS.inc(runner="pool")
+                return await worker_pool.run(path, args, timeout, code_path)
+        SCRIPT_RUNS.inc(runner="process")
+        return await run_process([sys.executable, path] + args, timeout=timeout)
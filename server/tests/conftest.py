@@ -0,0 +1,25 @@
+import time
+
+import pytest
+
+
+def _alive(pid: int) -> bool:
+    """Whether a process is running, counting zombies as gone"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.fixture
+def wait_gone():
+    """Wait up to a timeout for processes to exit, returning whether they all did"""
+    def wait(pids, timeout: float = 5) -> bool:
+        deadline = time.monotonic() + timeout
+        while any(_alive(pid) for pid in pids):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+    return wait
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from api.models import BatchCommand
+from services.batch import execute_batch, prepare_batch
+from services.kernels import kernel_manager
+from services.session import TerminalSession
+
+
+def commands(*lines, **depends_on):
+    return [BatchCommand(command=line, depends_on=depends_on.get(str(index), []))
+            for index, line in enumerate(lines)]
+
+
+def test_prepare_batch_rejects_cycles():
+    with pytest.raises(ValueError):
+        prepare_batch(commands("echo a", "echo b", **{"0": ["1"], "1": ["0"]}))
+
+
+def test_session_commands_run_one_at_a_time():
+    async def main():
+        session = TerminalSession("batch-test")
+        batch = commands(
+            "kernel:python x = 1",
+            "kernel:python import time; time.sleep(0.3); x += 1",
+            "kernel:python x",
+        )
+        try:
+            return await execute_batch(batch, max_concurrency=4, session=session)
+        finally:
+            await kernel_manager.close()
+
+    results = asyncio.run(main())
+    assert [result.status for result in results] == [0, 0, 0]
+    assert results[2].output.strip() == "2"
@@ -0,0 +1,55 @@
+import asyncio
+import os
+
+from services import ai_service
+from services.ai_service import AIService, CodeAnswer
+from services.file_service import FILES_DIR
+from services.worker_pool import worker_pool
+
+SPIN_SCRIPT = """\
+import subprocess
+sleeper = subprocess.Popen(["sleep", "60"])
+with open({pid_file!r}, "w") as f:
+    f.write(f"{{__import__('os').getpid()}} {{sleeper.pid}}")
+while True:
+    pass
+"""
+
+PASSING_SCRIPT = "print('candidate test passed')"
+
+
+def test_losing_candidate_dry_run_is_killed(tmp_path, monkeypatch, wait_gone):
+    pid_file = tmp_path / "pids"
+    sources = [SPIN_SCRIPT.format(pid_file=str(pid_file)), PASSING_SCRIPT]
+
+    async def stream_answer(prompt, model, temperature, max_tokens, staged):
+        source = sources.pop(0)
+        if source == PASSING_SCRIPT:
+            # Pass only once the other candidate's dry run is under way
+            while not (pid_file.exists() and pid_file.read_text()):
+                await asyncio.sleep(0.05)
+        staged.write(source)
+        staged.close()
+        return CodeAnswer(text=f"```python\n{source}\n```", code=source, complete=True)
+
+    async def set_cached(key, value):
+        pass
+
+    monkeypatch.setattr(AIService, "_stream_answer", staticmethod(stream_answer))
+    monkeypatch.setattr(ai_service.response_cache, "set", set_cached)
+
+    async def main():
+        try:
+            return await AIService._generate_candidates("key", "prompt", "model", 0.2, 100, "request",
+                                                        count=2, dry_run=True)
+        finally:
+            await worker_pool.close()
+
+    response, chosen = asyncio.run(main())
+    try:
+        assert response.status == 0
+        assert chosen.answer.code == PASSING_SCRIPT
+        assert wait_gone([int(pid) for pid in pid_file.read_text().split()])
+    finally:
+        if chosen is not None and chosen.filename:
+            os.remove(os.path.join(FILES_DIR, chosen.filename))
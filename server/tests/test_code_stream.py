@@ -0,0 +1,125 @@
+from services.code_stream import CodeExtractor, SyntaxChecker, extract_code
+
+
+def check(source: str) -> SyntaxChecker:
+    checker = SyntaxChecker()
+    for line in source.splitlines(keepends=True):
+        checker.add(line)
+    # A trailing statement is checked once the next one starts
+    checker.add("pass\n")
+    return checker
+
+
+def stream(answer: str, size: int = 7):
+    """Feed an answer to a CodeExtractor in small pieces, returning whether it restarted and the code"""
+    extractor = CodeExtractor()
+    restarted, code = False, []
+    pieces = [answer[i:i + size] for i in range(0, len(answer), size)]
+    for piece in pieces:
+        restart, lines = extractor.feed(piece)
+        if restart:
+            restarted, code = True, []
+        code += lines
+    restart, lines = extractor.finish()
+    if restart:
+        restarted, code = True, []
+    return restarted, "".join(code + lines)
+
+
+def test_fenced_answer():
+    restarted, code = stream("```python\nprint(1)\n```\nThis prints 1.")
+    assert not restarted
+    assert code == "print(1)\n"
+
+
+def test_prose_before_fence():
+    answer = "Here is the script:\n\n```python\nx = 1\nprint(x)\n```\nIt prints 1."
+    restarted, code = stream(answer)
+    assert restarted
+    assert code == "x = 1\nprint(x)\n"
+    assert extract_code(answer) == code
+
+
+def test_unclosed_fence_after_prose():
+    answer = "Here is the script:\n```python\nx = 1\nprint(x)\n"
+    restarted, code = stream(answer)
+    assert restarted
+    assert code == "Here is the script:\n\nx = 1\nprint(x)\n"
+
+
+def test_unclosed_fence():
+    restarted, code = stream("```python\nx = 1\nprint(x)\n")
+    assert not restarted
+    assert code == "x = 1\nprint(x)\n"
+
+
+def test_closing_fence_without_newline():
+    extractor = CodeExtractor()
+    extractor.feed("```\nprint(1)\n```")
+    assert extractor.done
+
+
+def test_answer_without_fences():
+    assert extract_code("import os\nprint(os.getcwd())\n") == "import os\nprint(os.getcwd())\n"
+
+
+def test_statements_are_checked():
+    checker = check("import os\n\nx = 1\ny = [\n1,\n2,\n]\n")
+    assert checker.error is None
+    assert checker.statements == 3
+
+
+def test_syntax_error_line_number():
+    checker = check("x = 1\ny = = 2\nz = 3\n")
+    assert checker.error is not None
+    assert "line 2" in checker.error
+
+
+def test_decorator():
+    checker = check("@staticmethod\ndef f():\n    pass\n")
+    assert checker.error is None
+
+
+def test_multi_line_decorator():
+    source = (
+        "@app.route(\n"
+        "    \"/items\",\n"
+        "    methods=[\"GET\"],\n"
+        ")\n"
+        "@login_required\n"
+        "async def items():\n"
+        "    return []\n"
+        "\n"
+        "@dataclass(\n"
+        "    frozen=True\n"
+        ")\n"
+        "class Item:\n"
+        "    name: str\n"
+    )
+    checker = check(source)
+    assert checker.error is None
+    assert checker.statements == 2
+
+
+def test_backslash_continuation():
+    checker = check("total = 1 + \\\n2\nassert total == 3, \\\n\"wrong\"\n")
+    assert checker.error is None
+    assert checker.statements == 2
+
+
+def test_continuation_keywords():
+    source = (
+        "if x:\n"
+        "    pass\n"
+        "else:\n"
+        "    pass\n"
+        "try:\n"
+        "    pass\n"
+        "except ValueError:\n"
+        "    pass\n"
+        "finally:\n"
+        "    pass\n"
+    )
+    checker = check(source)
+    assert checker.error is None
+    assert checker.statements == 2
@@ -0,0 +1,38 @@
+import pytest
+
+from core.config import ConfigError, load_settings
+
+
+def test_defaults():
+    settings = load_settings({})
+    assert settings.command_timeout == 10
+    assert settings.ai_hedge_percentile == 0
+
+
+def test_reports_every_bad_setting():
+    with pytest.raises(ConfigError) as error:
+        load_settings({"COMMAND_TIMEOUT": "soon", "LOG_FORMAT": "xml"})
+    assert "COMMAND_TIMEOUT" in str(error.value)
+    assert "LOG_FORMAT" in str(error.value)
+
+
+def test_log_levels_and_rates():
+    settings = load_settings({"LOG_LEVELS": "aiohttp=warning, terminal-api.ai=DEBUG",
+                              "LOG_SAMPLE_RATES": "terminal-api.ai.payloads=0.5"})
+    assert settings.log_levels == "aiohttp=warning, terminal-api.ai=DEBUG"
+    assert settings.log_sample_rates == "terminal-api.ai.payloads=0.5"
+
+
+@pytest.mark.parametrize("name, value", [
+    ("LOG_LEVELS", "aiohttp=LOUD"),
+    ("LOG_LEVELS", "aiohttp"),
+    ("LOG_SAMPLE_RATES", "terminal-api.ai.payloads=often"),
+    ("LOG_SAMPLE_RATES", "terminal-api.ai.payloads=1.5"),
+    ("LOG_SAMPLE_RATES", "=0.5"),
+])
+def test_bad_log_settings(name, value):
+    with pytest.raises(ConfigError) as error:
+        load_settings({name: value, "LOG_FORMAT": "xml"})
+    # Reported with the other bad settings
+    assert name in str(error.value)
+    assert "LOG_FORMAT" in str(error.value)
@@ -0,0 +1,57 @@
+import os
+
+from services.file_index import FileIndex
+
+
+def make_index(tmp_path, **kwargs) -> FileIndex:
+    directory = tmp_path / "files"
+    directory.mkdir()
+    return FileIndex(str(directory), str(tmp_path / "index.sqlite3"), **kwargs)
+
+
+def names(index: FileIndex, **kwargs):
+    files, _ = index.query(**kwargs)
+    return [file["name"] for file in files]
+
+
+def test_record_and_query(tmp_path):
+    index = make_index(tmp_path)
+    for name, prompt in (("a.py", "say hello"), ("b.txt", None)):
+        (tmp_path / "files" / name).write_text(name)
+        index.record(name, prompt=prompt)
+    assert names(index) == ["a.py", "b.txt"]
+    assert names(index, extension=".py") == ["a.py"]
+    assert names(index, match="hello") == ["a.py"]
+
+
+def test_picks_up_files_added_and_removed_outside_record(tmp_path):
+    index = make_index(tmp_path)
+    (tmp_path / "files" / "a.py").write_text("a")
+    assert names(index) == ["a.py"]
+    (tmp_path / "files" / "b.py").write_text("b")
+    os.remove(tmp_path / "files" / "a.py")
+    assert names(index) == ["b.py"]
+
+
+def test_unchanged_directory_is_not_rescanned(tmp_path):
+    index = make_index(tmp_path)
+    path = tmp_path / "files" / "a.py"
+    path.write_text("a")
+    index.sync()
+    # Editing a file in place doesn't change the directory
+    path.write_text("longer content")
+    files, _ = index.query()
+    assert files[0]["size"] == 1
+    index.sync(force=True)
+    files, _ = index.query()
+    assert files[0]["size"] == len("longer content")
+
+
+def test_rescans_after_interval(tmp_path):
+    index = make_index(tmp_path, rescan_interval=0)
+    path = tmp_path / "files" / "a.py"
+    path.write_text("a")
+    index.sync()
+    path.write_text("longer content")
+    files, _ = index.query()
+    assert files[0]["size"] == len("longer content")
@@ -0,0 +1,44 @@
+import os
+
+from services.jobs import QUEUED, RUNNING, Job, JobStore
+
+
+def claimed_job(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job = Job(id="job-1", prompt="print 1", model="model")
+    store.save(job)
+    assert store.claim(job)
+    return store, job
+
+
+def test_running_job_is_not_requeued_while_heartbeating(tmp_path):
+    store, job = claimed_job(tmp_path)
+    try:
+        store.heartbeat([job.id])
+        assert store.requeue_orphans(60) == 0
+        assert store.get(job.id).state == RUNNING
+    finally:
+        store.close()
+
+
+def test_job_without_heartbeats_is_requeued(tmp_path):
+    store, job = claimed_job(tmp_path)
+    try:
+        # The owner token names this process, which is still alive; only the heartbeat counts
+        owner = store._connect().execute("SELECT owner FROM jobs WHERE id = ?", (job.id,)).fetchone()[0]
+        assert owner.startswith(f"{os.getpid()}-")
+        store._connect().execute("UPDATE jobs SET heartbeat_at = heartbeat_at - 120")
+        assert store.requeue_orphans(60) == 1
+        assert store.get(job.id).state == QUEUED
+    finally:
+        store.close()
+
+
+def test_heartbeat_ignores_jobs_claimed_elsewhere(tmp_path):
+    store, job = claimed_job(tmp_path)
+    try:
+        store._connect().execute("UPDATE jobs SET owner = 'other', heartbeat_at = heartbeat_at - 120")
+        store.heartbeat([job.id])
+        assert store.requeue_orphans(60) == 1
+    finally:
+        store.close()
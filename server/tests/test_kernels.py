@@ -0,0 +1,20 @@
+import asyncio
+
+from services.kernels import kernel_manager
+
+
+def test_concurrent_evaluations_take_turns():
+    async def main():
+        try:
+            await kernel_manager.evaluate("kernels-test", "python", "x = 0", timeout=10)
+            return await asyncio.gather(*[
+                kernel_manager.evaluate("kernels-test", "python",
+                                        "import time; time.sleep(0.05); x += 1; x", timeout=10)
+                for _ in range(5)
+            ])
+        finally:
+            await kernel_manager.close()
+
+    results = asyncio.run(main())
+    assert all(survived for _, survived in results)
+    assert sorted(int(result.stdout) for result, _ in results) == [1, 2, 3, 4, 5]
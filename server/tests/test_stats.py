@@ -0,0 +1,14 @@
+from fastapi.testclient import TestClient
+
+from app import app
+
+client = TestClient(app)
+
+
+def test_metrics_export_the_stats():
+    stats = client.get("/api/stats").json()
+    body = client.get("/metrics").text
+    for group, values in stats.items():
+        for key, value in values.items():
+            if isinstance(value, (int, float)):
+                assert f"# TYPE terminal_{group}_{key} gauge" in body
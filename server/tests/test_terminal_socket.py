@@ -0,0 +1,26 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app import app
+from core.config import CORS_ORIGINS
+
+client = TestClient(app)
+
+
+def test_refuses_other_origins():
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with client.websocket_connect("/api/terminal/ws", headers={"Origin": "http://attacker.example"}):
+            pass
+    assert refused.value.code == 1008
+
+
+def test_accepts_allowed_origin():
+    with client.websocket_connect("/api/terminal/ws", headers={"Origin": CORS_ORIGINS[0]}) as websocket:
+        assert websocket.receive_json()["type"] == "session"
+
+
+def test_accepts_clients_without_origin():
+    # Only browsers send an Origin, and they are the ones CORS protects against
+    with client.websocket_connect("/api/terminal/ws") as websocket:
+        assert websocket.receive_json()["type"] == "session"
@@ -0,0 +1,68 @@
+import asyncio
+
+from services.worker_pool import PythonWorkerPool
+
+# Writes its own pid and that of a process it starts, then spins
+SPIN_SCRIPT = """\
+import subprocess, sys
+sleeper = subprocess.Popen(["sleep", "60"])
+with open(sys.argv[1], "w") as f:
+    f.write(f"{__import__('os').getpid()} {sleeper.pid}")
+while True:
+    pass
+"""
+
+
+async def start_spinning(pool: PythonWorkerPool, tmp_path, timeout: float):
+    script = tmp_path / "spin.py"
+    script.write_text(SPIN_SCRIPT)
+    pid_file = tmp_path / "pids"
+    task = asyncio.ensure_future(pool.run(str(script), [str(pid_file)], timeout))
+    for _ in range(200):
+        if pid_file.exists() and pid_file.read_text():
+            break
+        await asyncio.sleep(0.05)
+    return task, [int(pid) for pid in pid_file.read_text().split()]
+
+
+def test_cancelled_run_leaves_no_process(tmp_path, wait_gone):
+    async def main():
+        pool = PythonWorkerPool(size=1, max_runs=10, memory_limit_mb=0)
+        task, pids = await start_spinning(pool, tmp_path, timeout=30)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        try:
+            return pids, wait_gone(pids)
+        finally:
+            await pool.close()
+
+    pids, gone = asyncio.run(main())
+    assert len(pids) == 2
+    assert gone
+
+
+def test_closing_the_pool_kills_its_runs(tmp_path, wait_gone):
+    async def main():
+        pool = PythonWorkerPool(size=1, max_runs=10, memory_limit_mb=0)
+        task, pids = await start_spinning(pool, tmp_path, timeout=30)
+        await pool.close()
+        await asyncio.gather(task, return_exceptions=True)
+        return pids, wait_gone(pids)
+
+    pids, gone = asyncio.run(main())
+    assert gone
+
+
+def test_run_output(tmp_path):
+    async def main():
+        pool = PythonWorkerPool(size=1, max_runs=10, memory_limit_mb=0)
+        script = tmp_path / "hello.py"
+        script.write_text("import sys\nprint('hello', sys.argv[1])\n")
+        try:
+            return await pool.run(str(script), ["world"], 5)
+        finally:
+            await pool.close()
+
+    result = asyncio.run(main())
+    assert result.returncode == 0
+    assert result.stdout == "hello world\n"
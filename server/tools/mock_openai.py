@@ -0,0 +1,262 @@
+"""
+Local mock of the OpenAI chat completions API, for load and soak testing
+the AI commands without network access or API costs
+
+Run the server against it:
+
+    python tools/mock_openai.py --port 8001 --latency 0.2 --tokens-per-second 200
+    AI_PROVIDER=mock python app.py
+
+Answers are canned: prompts asking for Python code get a small runnable
+script, anything else gets filler text of the requested length.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+from aiohttp import web
+
+SCRIPT = '''# filename: mock_script.py
+"""Script returned by the mock OpenAI server"""
+import sys
+
+
+def main():
+    print("Hello from the mock model")
+    print("Arguments:", sys.argv[1:])
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+# Code answers in the other formats of --code-format
+FENCED_SCRIPT = "Here is the script you asked for:\n\n```python\n" + SCRIPT + "```\n\n" + (
+    "The script prints a greeting followed by its command line arguments. Run it with a few "
+    "arguments to see them echoed back, or extend main() with the behaviour you need.\n"
+)
+BROKEN_SCRIPT = SCRIPT.replace("def main():", "def main()", 1)
+CRASHING_SCRIPT = SCRIPT.replace('    print("Arguments:", sys.argv[1:])', '    raise RuntimeError("mock failure")', 1)
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua").split()
+
+
+@dataclass
+class MockOptions:
+    """How the mock behaves"""
+    # Seconds before the first token (or the whole answer) is sent
+    latency: float = 0.1
+    # Random extra latency, up to this many seconds
+    jitter: float = 0.0
+    # Generation speed; 0 sends every token at once
+    tokens_per_second: float = 0.0
+    # Tokens in a text answer, unless the request's max_tokens is lower
+    answer_tokens: int = 60
+    # Fraction of requests answered with 500
+    error_rate: float = 0.0
+    # Fraction of requests answered with 429 and a Retry-After header
+    rate_limit_rate: float = 0.0
+    # Retry-After sent with 429 answers, in seconds
+    retry_after: float = 1.0
+    # Seed for the random choices, for reproducible runs
+    seed: Optional[int] = None
+    # How code answers look: "plain" (raw code), "fenced" (a ``` block between prose) or "broken" (a syntax error)
+    code_format: str = "plain"
+    # Fraction of code answers whose script raises when run
+    crash_rate: float = 0.0
+    # Fraction of requests that stall for slow_latency extra seconds before answering
+    slow_rate: float = 0.0
+    slow_latency: float = 5.0
+
+
+class MockState:
+    def __init__(self, options: MockOptions):
+        self.options = options
+        self.random = random.Random(options.seed)
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.abandoned = 0
+        self.slow = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+def _answer_tokens(prompt: str, max_tokens: int, options: MockOptions, crash: bool = False) -> List[str]:
+    """Split the canned answer into the pieces streamed as tokens"""
+    if "python code" in prompt.lower():
+        if crash:
+            script = CRASHING_SCRIPT
+        else:
+            script = {"fenced": FENCED_SCRIPT, "broken": BROKEN_SCRIPT}.get(options.code_format, SCRIPT)
+        return [line + "\n" for line in script.split("\n")[:-1]]
+    count = max(1, min(options.answer_tokens, max_tokens))
+    return [WORDS[i % len(WORDS)] + " " for i in range(count)]
+
+
+def _usage(prompt: str, tokens: List[str]) -> dict:
+    prompt_tokens = max(1, len(prompt) // 4)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)}
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason: Optional[str] = None) -> bytes:
+    data = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+async def chat_completions(request: web.Request) -> web.StreamResponse:
+    state: MockState = request.app["state"]
+    options = state.options
+    state.requests += 1
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        return web.json_response({"error": {"message": "Invalid JSON body"}}, status=400)
+
+    roll = state.random.random()
+    if roll < options.rate_limit_rate:
+        state.rate_limited += 1
+        return web.json_response(
+            {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}},
+            status=429, headers={"Retry-After": str(options.retry_after)}
+        )
+    if roll < options.rate_limit_rate + options.error_rate:
+        state.errors += 1
+        return web.json_response({"error": {"message": "Injected server error (mock)"}}, status=500)
+
+    messages = body.get("messages") or []
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    model = body.get("model", "mock-model")
+    crash = options.crash_rate > 0 and state.random.random() < options.crash_rate
+    tokens = _answer_tokens(prompt, int(body.get("max_tokens") or 1000), options, crash)
+    completion_id = f"chatcmpl-mock-{state.requests}"
+    delay = options.tokens_per_second and 1 / options.tokens_per_second
+    latency = options.latency + state.random.uniform(0, options.jitter)
+    if options.slow_rate > 0 and state.random.random() < options.slow_rate:
+        state.slow += 1
+        latency += options.slow_latency
+
+    state.in_flight += 1
+    state.max_in_flight = max(state.max_in_flight, state.in_flight)
+    try:
+        await asyncio.sleep(latency)
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay * len(tokens))
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+                "usage": _usage(prompt, tokens),
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await response.write(_chunk(completion_id, model, {"role": "assistant", "content": ""}))
+        try:
+            for token in tokens:
+                if delay:
+                    await asyncio.sleep(delay)
+                await response.write(_chunk(completion_id, model, {"content": token}))
+            await response.write(_chunk(completion_id, model, {}, "stop"))
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client stopped reading early
+            state.abandoned += 1
+        return response
+    finally:
+        state.in_flight -= 1
+
+
+async def list_models(request: web.Request) -> web.Response:
+    return web.json_response({"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+
+
+async def mock_stats(request: web.Request) -> web.Response:
+    state: MockState = request.app["state"]
+    return web.json_response({
+        "requests": state.requests,
+        "errors": state.errors,
+        "rate_limited": state.rate_limited,
+        "abandoned": state.abandoned,
+        "slow": state.slow,
+        "in_flight": state.in_flight,
+        "max_in_flight": state.max_in_flight,
+    })
+
+
+def create_app(options: Optional[MockOptions] = None) -> web.Application:
+    """
+    Create the mock server application
+
+    Args:
+        options: How the mock behaves, the defaults if None
+
+    Returns:
+        The aiohttp application, serving /v1/chat/completions, /v1/models and /stats
+    """
+    app = web.Application()
+    app["state"] = MockState(options or MockOptions())
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/v1/models", list_models)
+    app.router.add_get("/stats", mock_stats)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="generation speed (0 sends the whole answer at once)")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="tokens in a text answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of 429 answers, in seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--code-format", choices=("plain", "fenced", "broken"), default="plain",
+                        help="how answers with Python code look")
+    parser.add_argument("--crash-rate", type=float, default=0.0,
+                        help="fraction of code answers whose script raises when run")
+    parser.add_argument("--slow-rate", type=float, default=0.0,
+                        help="fraction of requests that stall before answering, to exercise hedging")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="extra seconds a stalled request takes")
+    args = parser.parse_args()
+
+    options = MockOptions(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+        code_format=args.code_format,
+        crash_rate=args.crash_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+    )
+    web.run_app(create_app(options), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
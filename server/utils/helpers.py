@@ -20,22 +20,48 @@ Available commands:
 - clear: Clear the terminal screen
 - help: Display this help message
 
+Session Commands (in a terminal session):
+- cd <dir>: Change the working directory
+- export NAME=value: Set an environment variable for later commands
+- unset NAME: Remove a variable set with export
+- env: List variables set with export
+- history [N]: Show the last N commands
+
+Kernel Commands (in a terminal session, state is kept between commands):
+- kernel:python <code>: Evaluate Python code in a persistent REPL (also kernel:py)
+- kernel:node <code>: Evaluate JavaScript code in a persistent REPL (also kernel:js)
+- kernel:list: List this session's kernels
+- kernel:restart <language>: Start a kernel afresh
+- kernel:stop [language]: Stop one or all of this session's kernels
+
 AI Commands:
 - ai:<prompt>: Send a prompt to the default AI model
 - ai:model:<model_name> <prompt>: Use a specific AI model
 - ai:code:<description>: Generate Python code and save to a file
 - ai:code:<description> --no-run: Generate code without running it
+- ai:code:<description> --background: Queue the generation as a job and return right away
+- ai:code:<description> --candidates N: Generate N versions in parallel and keep the first that runs cleanly
+- Add --no-cache to any ai: command to skip cached responses
+
+Job Commands:
+- job:list [state]: List recent background jobs
+- job:status <id>: Show a job's state and output
+- job:cancel <id>: Cancel a queued or running job
 
 File Commands:
 - file:create <content>: Create a file with the given content
 - file:list [extension]: List all generated files
+  Options: --page N, --per-page N, --sort name|size|mtime, --desc, --match <text>
 - file:view <filename>: View the contents of a file
+  Options: --lines A:B, --bytes A:B, --head N, --tail N
 - file:run <filename> [--demo]: Run a Python file (--demo for interactive scripts)
 
 Example: ls -la
 Example: ai:Write a short poem about coding
 Example: ai:code:Create a web scraper for news headlines
 Example: file:list .py
+Example: file:list --sort mtime --desc --per-page 20
 Example: file:view fibonacci.py
+Example: file:view data.csv --lines 500000:500050
 Example: file:run calculator.py --demo
 """ 
\ No newline at end of file